@@ -0,0 +1,23 @@
+"""Verificación de contraseñas comunes para los jobs de credenciales de testing.
+
+Corre en los procesos del pool de credenciales (spawn): cada proceso importa este módulo
+y no server.py, así que no debe tener efectos al importarse (cliente de Mongo,
+directorios, pools). Solo passlib.
+"""
+from typing import List, Optional
+
+from passlib.context import CryptContext
+
+# Mismo esquema que pwd_context en server.py
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+
+def buscar_password_comun(password_hash: str, passwords: List[str]) -> Optional[str]:
+    """Prueba un lote de contraseñas comunes contra un hash"""
+    for pwd in passwords:
+        try:
+            if pwd_context.verify(pwd, password_hash):
+                return pwd
+        except Exception:
+            # Si hay error en la verificación, continuar con la siguiente
+            continue
+    return None
@@ -2,19 +2,39 @@ from fastapi import FastAPI, APIRouter, Depends, HTTPException, status, Request,
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from starlette.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
+from fastapi.responses import JSONResponse
+from fastapi.encoders import jsonable_encoder
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import IndexModel, UpdateOne, ReturnDocument, ASCENDING, DESCENDING
+from pymongo.errors import OperationFailure, DuplicateKeyError, BulkWriteError
 from pydantic import BaseModel, Field, EmailStr
 from typing import List, Optional, Union
-from datetime import datetime, timedelta, timezone
+from datetime import date, datetime, timedelta, timezone
+from zoneinfo import ZoneInfo
 from passlib.context import CryptContext
 from jose import JWTError, jwt
 from dotenv import load_dotenv
+from cachetools import TTLCache
 from pathlib import Path
+from credenciales_worker import buscar_password_comun
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 import os
+import re
+import math
+import asyncio
+import bisect
 import logging
 import uuid
-import requests
+import time
+import hmac
+import hashlib
+import ipaddress
+import secrets
+import httpx
+import numpy as np
 import json
+import multiprocessing
 import shutil
 
 # Configure logging
@@ -34,6 +54,9 @@ db = client[os.environ['DB_NAME']]
 SECRET_KEY = "mi-clave-secreta-super-segura-para-demo-12345"
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
+REFRESH_TOKEN_EXPIRE_DAYS = 14
+# Un token recién rotado presentado de nuevo (otra pestaña, reintento) no se toma como robo
+REFRESH_REUSO_GRACIA_SEGUNDOS = 10
 
 # Password hashing
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
@@ -97,6 +120,10 @@ class Token(BaseModel):
     access_token: str
     token_type: str
     user: UserResponse
+    refresh_token: Optional[str] = None
+
+class RefreshRequest(BaseModel):
+    refresh_token: str
 
 class LoginRequest(BaseModel):
     email: EmailStr
@@ -157,6 +184,7 @@ class Lavadero(BaseModel):
     fecha_vencimiento: Optional[datetime] = None
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
     is_active: bool = True
+    version_contenido: int = 0  # sube con cada cambio de configuración o días no laborales (ETag)
 
 class LavaderoCreate(BaseModel):
     nombre: str
@@ -173,28 +201,57 @@ class LavaderoResponse(BaseModel):
     created_at: datetime
 
 # Configuración de Lavadero
+# Versión del esquema canónico de configuracion_lavadero (ver MIGRACIONES DE DATOS)
+CONFIGURACION_SCHEMA_VERSION = 4
+BAYS_MAXIMO = 20  # puestos de lavado simultáneos por lavadero
+
+# (tipo, sufijo de los campos servicio_*/precio_* del formulario admin, nombre, icono, precio por defecto)
+TIPOS_VEHICULO_BASE = [
+    ("moto", "motos", "Motocicleta", "🏍️", 3000.0),
+    ("auto", "autos", "Auto/Sedan", "🚗", 5000.0),
+    ("camioneta", "camionetas", "Camioneta/SUV", "🚙", 8000.0),
+]
+
+# Configuración que crea la vista pública para un lavadero que todavía no tiene una:
+# siempre fue distinta de la del panel admin (cierre 20:00, lunes a sábado, estos precios)
+HORARIO_CIERRE_PUBLICO_POR_DEFECTO = "20:00"
+DIAS_LABORABLES_PUBLICO_POR_DEFECTO = [1, 2, 3, 4, 5, 6]
+TIPOS_VEHICULO_PUBLICO_POR_DEFECTO = [
+    ("auto", "Auto/Sedan", "🚗", 2500.0),
+    ("camioneta", "SUV/Pickup", "🚙", 3500.0),  # antes "suv": el esquema canónico lo llama camioneta
+    ("moto", "Motocicleta", "🏍️", 1500.0),
+]
+
+class TipoVehiculo(BaseModel):
+    tipo: str  # "moto", "auto", "camioneta"
+    nombre: str
+    precio: float
+    activo: bool = True
+    icono: Optional[str] = None
+    duracion: Optional[int] = None  # minutos; None = duracion_turno del lavadero
+
 class ConfiguracionLavadero(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     lavadero_id: str
-    hora_apertura: str  # "08:00"
-    hora_cierre: str    # "18:00"
-    duracion_turno_minutos: int  # 30
-    dias_laborales: List[int]  # [1,2,3,4,5] (1=Lunes, 7=Domingo)
-    alias_bancario: str
-    precio_turno: float
-    # Nuevos campos para tipos de vehículos
-    servicio_motos: bool = True
-    servicio_autos: bool = True
-    servicio_camionetas: bool = True
-    precio_motos: float = 3000.0
-    precio_autos: float = 5000.0
-    precio_camionetas: float = 8000.0
+    schema_version: int = CONFIGURACION_SCHEMA_VERSION
+    horario_apertura: str = "08:00"
+    horario_cierre: str = "18:00"
+    duracion_turno: int = 60  # minutos
+    bays: int = 1  # puestos de lavado: turnos simultáneos por horario
+    dias_laborables: List[int] = [1, 2, 3, 4, 5]  # (1=Lunes, 7=Domingo)
+    tipos_vehiculo: List[TipoVehiculo] = Field(default_factory=lambda: [
+        TipoVehiculo(tipo=tipo, nombre=nombre, precio=precio, icono=icono)
+        for tipo, _, nombre, icono, precio in TIPOS_VEHICULO_BASE
+    ])
+    alias_bancario: str = "lavadero.alias.mp"
+    precio_turno: float = 5000.0
     # Ubicación del lavadero
     latitud: Optional[float] = None
     longitud: Optional[float] = None
     direccion_completa: Optional[str] = None
     # Estado de apertura en tiempo real
     esta_abierto: bool = False
+    configurado: bool = True
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
 class ConfiguracionLavaderoCreate(BaseModel):
@@ -202,6 +259,7 @@ class ConfiguracionLavaderoCreate(BaseModel):
     hora_apertura: str
     hora_cierre: str
     duracion_turno_minutos: int
+    bays: int = 1
     dias_laborales: List[int]
     alias_bancario: str
     precio_turno: float
@@ -212,6 +270,10 @@ class ConfiguracionLavaderoCreate(BaseModel):
     precio_motos: float = 3000.0
     precio_autos: float = 5000.0
     precio_camionetas: float = 8000.0
+    # Duración del servicio por tipo (None = duración del turno)
+    duracion_motos: Optional[int] = None
+    duracion_autos: Optional[int] = None
+    duracion_camionetas: Optional[int] = None
     # Ubicación del lavadero
     latitud: Optional[float] = None
     longitud: Optional[float] = None
@@ -237,10 +299,16 @@ class Turno(BaseModel):
     fecha_hora: datetime
     estado: str = EstadoTurno.DISPONIBLE
     precio: float
+    bay: int = 0  # puesto de lavado dentro del lavadero
+    fin: Optional[datetime] = None  # None en turnos viejos: fecha_hora + duracion_turno
+    tipo_vehiculo: Optional[str] = None
+    ocupa_slot: bool = True  # False al cancelar: libera el índice único del slot
+    idempotency_key: Optional[str] = None
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
 class TurnoCreate(BaseModel):
-    fecha_hora: datetime
+    fecha_hora: datetime  # sin zona horaria se interpreta en la hora local del lavadero
+    tipo_vehiculo: Optional[str] = None  # define duración y precio; None = turno de la grilla
 
 class TurnoResponse(BaseModel):
     id: str
@@ -249,12 +317,16 @@ class TurnoResponse(BaseModel):
     fecha_hora: datetime
     estado: str
     precio: float
+    bay: int = 0
+    fin: Optional[datetime] = None
+    tipo_vehiculo: Optional[str] = None
     created_at: datetime
 
 # Comprobante de Pago (Turnos)
 class ComprobantePago(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     turno_id: str
+    lavadero_id: str  # Denormalizado desde el turno para contar sin pasar por turnos
     cliente_id: str
     imagen_url: str  # URL o path de la imagen
     estado: str = EstadoPago.PENDIENTE
@@ -303,6 +375,1162 @@ class AdminLavaderoRegister(BaseModel):
     # Datos del lavadero
     lavadero: LavaderoCreate
 
+# ========== ÍNDICES DE BASE DE DATOS ==========
+
+# Registro declarativo de índices por colección. Se aplica al iniciar la app
+# (create_indexes es idempotente) y sirve de referencia para el reporte de drift.
+INDICES_REGISTRO = {
+    "users": [
+        IndexModel([("email", ASCENDING)], name="email_unique", unique=True),
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        IndexModel([("created_at", DESCENDING), ("id", DESCENDING)], name="created_at_id"),
+        IndexModel(
+            [("rol", ASCENDING), ("created_at", DESCENDING), ("id", DESCENDING)],
+            name="rol_created_at_id"
+        ),
+        IndexModel([("nombre", ASCENDING)], name="nombre"),
+    ],
+    "lavaderos": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        IndexModel([("admin_id", ASCENDING)], name="admin_id_unique", unique=True),
+        IndexModel(
+            [("estado_operativo", ASCENDING), ("is_active", ASCENDING), ("id", ASCENDING)],
+            name="estado_operativo_is_active_id"
+        ),
+        IndexModel([("created_at", DESCENDING), ("id", DESCENDING)], name="created_at_id"),
+        IndexModel(
+            [("estado_operativo", ASCENDING), ("created_at", DESCENDING), ("id", DESCENDING)],
+            name="estado_operativo_created_at_id"
+        ),
+        IndexModel([("nombre", ASCENDING)], name="nombre"),
+    ],
+    "configuracion_lavadero": [
+        IndexModel([("lavadero_id", ASCENDING)], name="lavadero_id_unique", unique=True),
+    ],
+    "configuracion_superadmin": [
+        # Parcial: documentos legacy sin clave no chocan entre sí
+        IndexModel(
+            [("clave", ASCENDING)], name="clave_unique", unique=True,
+            partialFilterExpression={"clave": {"$exists": True}}
+        ),
+    ],
+    "dias_no_laborales": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        IndexModel([("lavadero_id", ASCENDING), ("fecha", ASCENDING)], name="lavadero_id_fecha_unique", unique=True),
+    ],
+    "pagos_mensualidad": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        IndexModel([("admin_id", ASCENDING), ("estado", ASCENDING)], name="admin_id_estado"),
+        IndexModel([("admin_id", ASCENDING), ("mes_año", ASCENDING)], name="admin_id_mes_año"),
+        IndexModel([("estado", ASCENDING)], name="estado"),
+    ],
+    "comprobantes_pago_mensualidad": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        IndexModel([("created_at", DESCENDING), ("id", DESCENDING)], name="created_at_id"),
+        IndexModel(
+            [("estado", ASCENDING), ("created_at", DESCENDING), ("id", DESCENDING)],
+            name="estado_created_at_id"
+        ),
+        IndexModel(
+            [("admin_id", ASCENDING), ("created_at", DESCENDING), ("id", DESCENDING)],
+            name="admin_id_created_at_id"
+        ),
+        IndexModel([("pago_mensualidad_id", ASCENDING), ("estado", ASCENDING)], name="pago_mensualidad_id_estado"),
+    ],
+    "comprobantes_pago": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        IndexModel([("turno_id", ASCENDING)], name="turno_id"),
+        IndexModel([("lavadero_id", ASCENDING), ("estado", ASCENDING)], name="lavadero_id_estado"),
+    ],
+    "turnos": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        IndexModel([("lavadero_id", ASCENDING), ("estado", ASCENDING)], name="lavadero_id_estado"),
+        IndexModel([("cliente_id", ASCENDING), ("estado", ASCENDING)], name="cliente_id_estado"),
+        IndexModel([("lavadero_id", ASCENDING), ("fecha_hora", ASCENDING)], name="lavadero_id_fecha_hora"),
+        # Un turno activo por slot y puesto: la reserva es insert-or-fail, sin leer antes
+        IndexModel(
+            [("lavadero_id", ASCENDING), ("fecha_hora", ASCENDING), ("bay", ASCENDING)],
+            name="lavadero_id_fecha_hora_bay_unique", unique=True,
+            partialFilterExpression={"ocupa_slot": True}
+        ),
+        IndexModel(
+            [("cliente_id", ASCENDING), ("idempotency_key", ASCENDING)],
+            name="cliente_id_idempotency_key_unique", unique=True,
+            partialFilterExpression={"idempotency_key": {"$type": "string"}}
+        ),
+    ],
+    "google_sessions": [
+        IndexModel([("session_token", ASCENDING)], name="session_token_unique", unique=True),
+        IndexModel([("user_id", ASCENDING)], name="user_id"),
+        # TTL: MongoDB borra la sesión apenas pasa expires_at
+        IndexModel([("expires_at", ASCENDING)], name="expires_at_ttl", expireAfterSeconds=0),
+    ],
+    "tokens_revocados": [
+        IndexModel([("expires_at", ASCENDING)], name="expires_at_ttl", expireAfterSeconds=0),
+    ],
+    "temp_credentials": [
+        IndexModel([("admin_email", ASCENDING)], name="admin_email"),
+    ],
+    "refresh_tokens": [
+        IndexModel([("token_hash", ASCENDING)], name="token_hash_unique", unique=True),
+        IndexModel([("expires_at", ASCENDING)], name="expires_at_ttl", expireAfterSeconds=0),
+        IndexModel([("user_id", ASCENDING)], name="user_id"),
+        IndexModel([("familia", ASCENDING)], name="familia"),
+    ],
+    "disponibilidad_dias": [
+        IndexModel([("lavadero_id", ASCENDING), ("fecha", ASCENDING)], name="lavadero_id_fecha"),
+        # Se reconstruyen solos al día siguiente: acota cualquier desvío con los turnos
+        IndexModel([("expires_at", ASCENDING)], name="expires_at_ttl", expireAfterSeconds=0),
+    ],
+    "limites_intentos": [
+        IndexModel([("expires_at", ASCENDING)], name="expires_at_ttl", expireAfterSeconds=0),
+    ],
+    "trabajos_credenciales": [
+        IndexModel([("expires_at", ASCENDING)], name="expires_at_ttl", expireAfterSeconds=0),
+    ],
+    # Bloques (lavadero, bay, minuto) reclamados por turnos: el _id único impide solapamientos
+    "ocupacion_bays": [
+        IndexModel([("turno_id", ASCENDING)], name="turno_id"),
+        # Vencen un día después del turno; los huérfanos los borra reconciliar_ocupacion
+        IndexModel([("expires_at", ASCENDING)], name="expires_at_ttl", expireAfterSeconds=0),
+    ],
+}
+
+# Opciones de índice que se comparan al calcular el drift
+OPCIONES_INDICE = ("unique", "sparse", "expireAfterSeconds", "partialFilterExpression")
+
+async def reporte_drift_indices():
+    """Compara el registro de índices con los índices existentes en la base"""
+    reporte = {}
+    for coleccion, indices in INDICES_REGISTRO.items():
+        existentes = await db[coleccion].index_information()
+        esperados = {indice.document["name"]: indice.document for indice in indices}
+
+        faltantes = [nombre for nombre in esperados if nombre not in existentes]
+        extra = [nombre for nombre in existentes if nombre != "_id_" and nombre not in esperados]
+        distintos = []
+        for nombre, esperado in esperados.items():
+            actual = existentes.get(nombre)
+            if not actual:
+                continue
+            if list(actual["key"]) != list(esperado["key"].items()) or any(
+                actual.get(opcion) != esperado.get(opcion) for opcion in OPCIONES_INDICE
+            ):
+                distintos.append(nombre)
+
+        if faltantes or extra or distintos:
+            reporte[coleccion] = {
+                "faltantes": faltantes,
+                "extra": extra,
+                "distintos": distintos
+            }
+    return reporte
+
+async def aplicar_indices():
+    """Crea los índices del registro y devuelve el reporte de drift resultante"""
+    for coleccion, indices in INDICES_REGISTRO.items():
+        # Uno por uno para que un conflicto (ej. datos duplicados) no frene al resto
+        for indice in indices:
+            try:
+                await db[coleccion].create_indexes([indice])
+            except OperationFailure as e:
+                logger.warning(f"No se pudo crear el índice {coleccion}.{indice.document['name']}: {e}")
+
+    reporte = await reporte_drift_indices()
+    if reporte:
+        logger.warning(f"Drift de índices detectado: {reporte}")
+    else:
+        logger.info("Índices de base de datos sincronizados con el registro")
+    return reporte
+
+# ========== MIGRACIONES DE DATOS ==========
+
+async def backfill_lavadero_id_comprobantes_pago():
+    """Copia lavadero_id del turno a los comprobantes de pago que no lo tienen"""
+    # Se resuelve del lado del servidor con $merge; es idempotente porque solo
+    # toma comprobantes sin lavadero_id
+    pipeline = [
+        {"$match": {"lavadero_id": {"$exists": False}}},
+        {"$lookup": {
+            "from": "turnos",
+            "localField": "turno_id",
+            "foreignField": "id",
+            "as": "turno"
+        }},
+        {"$unwind": "$turno"},
+        {"$project": {"_id": 1, "lavadero_id": "$turno.lavadero_id"}},
+        {"$merge": {
+            "into": "comprobantes_pago",
+            "on": "_id",
+            "whenMatched": "merge",
+            "whenNotMatched": "discard"
+        }}
+    ]
+    await db.comprobantes_pago.aggregate(pipeline).to_list(None)
+    
+    sin_lavadero = await db.comprobantes_pago.count_documents({"lavadero_id": {"$exists": False}})
+    if sin_lavadero:
+        logger.warning(f"{sin_lavadero} comprobante(s) de pago sin turno asociado quedaron sin lavadero_id")
+
+# ========== CONTADORES ==========
+
+# Colección "contadores": un documento por alcance con conteos por estado,
+# mantenidos con $inc en cada transición y corregidos por la reconciliación.
+#   "global"         -> lavaderos, comprobantes_pago_mensualidad
+#   "lavadero:<id>"  -> turnos, comprobantes_pago
+#   "cliente:<id>"   -> turnos
+CONTADORES_GLOBAL = "global"
+CONTADORES_RECONCILIACION_SEGUNDOS = int(os.environ.get("CONTADORES_RECONCILIACION_SEGUNDOS", "3600"))
+
+def clave_contadores_lavadero(lavadero_id: str):
+    return f"lavadero:{lavadero_id}"
+
+def clave_contadores_cliente(cliente_id: str):
+    return f"cliente:{cliente_id}"
+
+async def contar_por_estado(coleccion, filtro: dict, campo: str = "estado"):
+    """Cuenta documentos agrupados por estado en una sola agregación"""
+    pipeline = [
+        {"$match": filtro},
+        {"$group": {"_id": f"${campo}", "count": {"$sum": 1}}}
+    ]
+    grupos = await coleccion.aggregate(pipeline).to_list(None)
+    return {grupo["_id"]: grupo["count"] for grupo in grupos}
+
+async def ajustar_contadores(clave: str, incrementos: dict):
+    """Aplica incrementos atómicos ({"campo.ESTADO": n}) sobre un documento de contadores"""
+    incrementos = {campo: n for campo, n in incrementos.items() if n}
+    if not incrementos:
+        return
+    await db.contadores.update_one({"_id": clave}, {"$inc": incrementos}, upsert=True)
+
+async def registrar_transicion(clave: str, campo: str, anterior: Optional[str] = None, nuevo: Optional[str] = None):
+    """Registra el paso de un documento del estado anterior al nuevo (None = alta/baja)"""
+    if anterior == nuevo:
+        return
+    incrementos = {}
+    if anterior:
+        incrementos[f"{campo}.{anterior}"] = -1
+    if nuevo:
+        incrementos[f"{campo}.{nuevo}"] = 1
+    await ajustar_contadores(clave, incrementos)
+
+def sin_negativos(conteos: dict):
+    """Entre una transición y la reconciliación un contador puede quedar negativo: se muestra 0"""
+    return {estado: max(0, cantidad) for estado, cantidad in conteos.items()}
+
+async def leer_contadores(clave: str, campo: str):
+    """Devuelve {estado: cantidad} para un campo de un documento de contadores"""
+    doc = await db.contadores.find_one({"_id": clave}, {campo: 1})
+    if not doc:
+        return {}
+    return sin_negativos(doc.get(campo, {}))
+
+async def _contar_por_clave_y_estado(coleccion, campo_clave: str, filtro: Optional[dict] = None):
+    """Agrupa la colección (o lo que pase el filtro) por (clave, estado) -> {clave: {estado: n}}"""
+    pipeline = [
+        {"$match": {**(filtro or {}), campo_clave: {"$ne": None}}},
+        {"$group": {"_id": {"clave": f"${campo_clave}", "estado": "$estado"}, "count": {"$sum": 1}}}
+    ]
+    resultado = {}
+    async for grupo in coleccion.aggregate(pipeline):
+        resultado.setdefault(grupo["_id"]["clave"], {})[grupo["_id"]["estado"]] = grupo["count"]
+    return resultado
+
+def _diferencias(reales: dict, actuales: dict):
+    """Incrementos ({"campo.ESTADO": n}) que llevan los contadores actuales a los reales"""
+    incrementos = {}
+    for campo in set(reales) | set(actuales) - {"_id"}:
+        real, actual = reales.get(campo, {}), actuales.get(campo, {})
+        for estado in set(real) | set(actual):
+            incrementos[f"{campo}.{estado}"] = real.get(estado, 0) - actual.get(estado, 0)
+    return {campo: n for campo, n in incrementos.items() if n}
+
+async def reconciliar_contadores():
+    """Corrige los contadores contra las colecciones fuente.
+
+    Aplica la diferencia con $inc en vez de pisar el valor: un $inc de una transición
+    que llega mientras corre la reconciliación no se pierde.
+    """
+    (
+        lavaderos_por_estado,
+        comprobantes_por_estado,
+        turnos_por_lavadero,
+        comprobantes_por_lavadero,
+        turnos_por_cliente,
+        actuales,
+    ) = await asyncio.gather(
+        contar_por_estado(db.lavaderos, {}, campo="estado_operativo"),
+        contar_por_estado(db.comprobantes_pago_mensualidad, {}),
+        _contar_por_clave_y_estado(db.turnos, "lavadero_id"),
+        _contar_por_clave_y_estado(db.comprobantes_pago, "lavadero_id"),
+        _contar_por_clave_y_estado(db.turnos, "cliente_id"),
+        db.contadores.find({}).to_list(None),
+    )
+    
+    documentos = {
+        CONTADORES_GLOBAL: {
+            "lavaderos": lavaderos_por_estado,
+            "comprobantes_pago_mensualidad": comprobantes_por_estado
+        }
+    }
+    for lavadero_id in set(turnos_por_lavadero) | set(comprobantes_por_lavadero):
+        documentos[clave_contadores_lavadero(lavadero_id)] = {
+            "turnos": turnos_por_lavadero.get(lavadero_id, {}),
+            "comprobantes_pago": comprobantes_por_lavadero.get(lavadero_id, {})
+        }
+    for cliente_id, turnos in turnos_por_cliente.items():
+        documentos[clave_contadores_cliente(cliente_id)] = {"turnos": turnos}
+    
+    # Los alcances que ya no tienen documentos fuente se llevan a cero
+    actuales = {doc["_id"]: doc for doc in actuales}
+    operaciones = []
+    for clave in set(documentos) | set(actuales):
+        incrementos = _diferencias(documentos.get(clave, {}), actuales.get(clave, {}))
+        if incrementos:
+            operaciones.append(UpdateOne({"_id": clave}, {"$inc": incrementos}, upsert=True))
+    if operaciones:
+        await db.contadores.bulk_write(operaciones, ordered=False)
+
+async def tarea_reconciliacion_contadores():
+    """Reconciliación periódica de contadores (corrige drift de los $inc)"""
+    while True:
+        try:
+            await reconciliar_contadores()
+        except Exception as e:
+            logger.error(f"Error reconciliando contadores: {e}")
+        await asyncio.sleep(CONTADORES_RECONCILIACION_SEGUNDOS)
+
+# ========== PAGINACIÓN ==========
+
+# Los listados se ordenan por (created_at desc, id desc) y se paginan por keyset:
+# el cursor es "<created_at iso>|<id>" del último elemento devuelto.
+ORDEN_KEYSET = [("created_at", DESCENDING), ("id", DESCENDING)]
+LIMITE_PAGINA_MAXIMO = 200
+
+def codificar_cursor(created_at: datetime, id: str):
+    return f"{created_at.isoformat()}|{id}"
+
+def filtro_keyset(cursor: str):
+    """Filtro Mongo para los elementos posteriores al cursor"""
+    try:
+        created_at, id = cursor.rsplit("|", 1)
+        created_at = datetime.fromisoformat(created_at)
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Cursor inválido"
+        )
+    return {"$or": [
+        {"created_at": {"$lt": created_at}},
+        {"created_at": created_at, "id": {"$lt": id}}
+    ]}
+
+def filtro_prefijo(q: str, campos: List[str]):
+    """Búsqueda por prefijo (anclada, usa índice) sobre uno o más campos"""
+    patron = f"^{re.escape(q.strip())}"
+    return {"$or": [{campo: {"$regex": patron}} for campo in campos]}
+
+def paginar(response: Response, items: list, limit: int, id_field: str = "id"):
+    """Recorta la página a `limit` y publica el siguiente cursor en X-Next-Cursor"""
+    if len(items) > limit:
+        items = items[:limit]
+        response.headers["X-Next-Cursor"] = codificar_cursor(items[-1]["created_at"], items[-1][id_field])
+    return items
+
+# Migración de configuracion_lavadero al esquema canónico.
+# Cada paso recibe el documento en la versión N-1 y devuelve (set, unset) para llevarlo a N.
+
+CAMPOS_CONFIGURACION_LEGACY = [
+    "hora_apertura", "hora_cierre", "duracion_turno_minutos", "dias_laborales", "direccion",
+    "servicio_motos", "servicio_autos", "servicio_camionetas",
+    "precio_motos", "precio_autos", "precio_camionetas",
+]
+
+def tipos_vehiculo_desde_servicios(datos: dict):
+    """Arma tipos_vehiculo desde los campos servicio_*/precio_* (formulario admin / esquema v1)"""
+    return [
+        {
+            "tipo": tipo,
+            "nombre": nombre,
+            "precio": datos.get(f"precio_{sufijo}", precio),
+            "activo": datos.get(f"servicio_{sufijo}", True),
+            "icono": icono,
+            "duracion": datos.get(f"duracion_{sufijo}")
+        }
+        for tipo, sufijo, nombre, icono, precio in TIPOS_VEHICULO_BASE
+    ]
+
+def migrar_configuracion_v2(doc: dict):
+    """v1 (hora_*/servicio_*/precio_* y/o horario_*/tipos_vehiculo) -> v2 canónico"""
+    if "servicio_motos" in doc:
+        # Los campos del formulario admin son los últimos que escribió el dueño
+        tipos_vehiculo = tipos_vehiculo_desde_servicios(doc)
+    elif doc.get("tipos_vehiculo"):
+        tipos_vehiculo = [
+            {**tipo, "tipo": "camioneta"} if tipo.get("tipo") == "suv" else tipo
+            for tipo in doc["tipos_vehiculo"]
+        ]
+    else:
+        tipos_vehiculo = tipos_vehiculo_desde_servicios({})
+    
+    cambios = {
+        "horario_apertura": doc.get("horario_apertura") or doc.get("hora_apertura") or "08:00",
+        "horario_cierre": doc.get("horario_cierre") or doc.get("hora_cierre") or "18:00",
+        "duracion_turno": doc.get("duracion_turno") or doc.get("duracion_turno_minutos") or 60,
+        "dias_laborables": doc.get("dias_laborables") or doc.get("dias_laborales") or [1, 2, 3, 4, 5],
+        "tipos_vehiculo": tipos_vehiculo,
+        "direccion_completa": doc.get("direccion_completa") or doc.get("direccion"),
+        "configurado": doc.get("configurado", True),
+        "schema_version": 2
+    }
+    return cambios, [campo for campo in CAMPOS_CONFIGURACION_LEGACY if campo in doc]
+
+def migrar_configuracion_v3(doc: dict):
+    """v2 -> v3: capacidad en puestos de lavado (bays); los lavaderos existentes tienen uno"""
+    return {"bays": doc.get("bays") or 1, "schema_version": 3}, []
+
+def _hora_en_bloques(hora: str, hacia_arriba: bool) -> str:
+    minutos = _minutos_del_dia(hora)
+    bloques = -(-minutos // BLOQUE_OCUPACION_MINUTOS) if hacia_arriba else minutos // BLOQUE_OCUPACION_MINUTOS
+    minutos = bloques * BLOQUE_OCUPACION_MINUTOS
+    return f"{minutos // 60:02d}:{minutos % 60:02d}"
+
+def migrar_configuracion_v4(doc: dict):
+    """v3 -> v4: horarios y duración en múltiplos de BLOQUE_OCUPACION_MINUTOS.
+
+    Los bloques de ocupación por bay se alinean a esa grilla: fuera de ella dos turnos
+    contiguos reclamarían el mismo bloque. La apertura se corre hacia adelante, el
+    cierre hacia atrás y la duración al múltiplo más cercano (nunca 0).
+    """
+    duracion = round(int(doc.get("duracion_turno") or 60) / BLOQUE_OCUPACION_MINUTOS) * BLOQUE_OCUPACION_MINUTOS
+    return {
+        "horario_apertura": _hora_en_bloques(doc.get("horario_apertura") or "08:00", hacia_arriba=True),
+        "horario_cierre": _hora_en_bloques(doc.get("horario_cierre") or "18:00", hacia_arriba=False),
+        "duracion_turno": min(480, max(BLOQUE_OCUPACION_MINUTOS, duracion)),
+        "schema_version": 4
+    }, []
+
+MIGRACIONES_CONFIGURACION = {
+    2: migrar_configuracion_v2,
+    3: migrar_configuracion_v3,
+    4: migrar_configuracion_v4,
+}
+
+def normalizar_configuracion(doc: dict):
+    """Lleva un documento de configuración a la versión actual (en memoria)"""
+    doc = dict(doc)
+    version = doc.get("schema_version", 1)
+    for destino in range(version + 1, CONFIGURACION_SCHEMA_VERSION + 1):
+        cambios, eliminados = MIGRACIONES_CONFIGURACION[destino](doc)
+        for campo in eliminados:
+            doc.pop(campo, None)
+        doc.update(cambios)
+    return doc
+
+async def migrar_configuraciones(dry_run: bool = False, batch_size: int = 500):
+    """Backfill online, por lotes y reanudable de configuracion_lavadero al esquema actual"""
+    filtro_pendientes = {"$or": [
+        {"schema_version": {"$lt": CONFIGURACION_SCHEMA_VERSION}},
+        {"schema_version": {"$exists": False}}
+    ]}
+    resultado = {"dry_run": dry_run, "procesados": 0, "migrados": 0}
+    # Reanudar una corrida anterior hacia la misma versión que no llegó al final
+    progreso = {} if dry_run else await db.migraciones.find_one({"_id": "configuracion_lavadero"}) or {}
+    ultimo_id = progreso.get("ultimo_id") if progreso.get("schema_version") == CONFIGURACION_SCHEMA_VERSION else None
+    
+    while True:
+        filtro = dict(filtro_pendientes)
+        if ultimo_id is not None:
+            filtro = {"$and": [filtro_pendientes, {"_id": {"$gt": ultimo_id}}]}
+        lote = await db.configuracion_lavadero.find(filtro).sort("_id", ASCENDING).limit(batch_size).to_list(batch_size)
+        if not lote:
+            break
+        ultimo_id = lote[-1]["_id"]
+        
+        operaciones = []
+        for doc in lote:
+            normalizado = normalizar_configuracion(doc)
+            eliminados = {campo: "" for campo in doc if campo not in normalizado}
+            actualizacion = {"$set": {campo: normalizado[campo] for campo in normalizado if campo != "_id"}}
+            if eliminados:
+                actualizacion["$unset"] = eliminados
+            # Solo si nadie migró/modificó la versión mientras tanto
+            operaciones.append(UpdateOne(
+                {"_id": doc["_id"], "schema_version": doc.get("schema_version", {"$exists": False})},
+                actualizacion
+            ))
+        
+        resultado["procesados"] += len(lote)
+        if not dry_run:
+            escritura = await db.configuracion_lavadero.bulk_write(operaciones, ordered=False)
+            resultado["migrados"] += escritura.modified_count
+            await db.migraciones.update_one(
+                {"_id": "configuracion_lavadero"},
+                {"$set": {
+                    "schema_version": CONFIGURACION_SCHEMA_VERSION,
+                    "ultimo_id": ultimo_id,
+                    "actualizado": datetime.now(timezone.utc)
+                }, "$inc": {"migrados": escritura.modified_count}},
+                upsert=True
+            )
+    
+    if not dry_run and ultimo_id is not None:
+        # Terminada: la próxima corrida (documentos viejos escritos después) empieza de cero
+        await db.migraciones.update_one({"_id": "configuracion_lavadero"}, {"$set": {"ultimo_id": None}})
+    if resultado["procesados"]:
+        logger.info(f"Migración de configuracion_lavadero: {resultado}")
+    return resultado
+
+def configuracion_vista_admin(config: dict, lavadero_doc: dict):
+    """Respuesta del panel admin: campos del formulario (hora_*/servicio_*/precio_*) desde el esquema canónico"""
+    tipos = {tipo["tipo"]: tipo for tipo in config.get("tipos_vehiculo", [])}
+    vista = {
+        "id": config.get("id"),
+        "lavadero_id": config["lavadero_id"],
+        "nombre_lavadero": lavadero_doc.get("nombre", ""),
+        "hora_apertura": config["horario_apertura"],
+        "hora_cierre": config["horario_cierre"],
+        "duracion_turno_minutos": config["duracion_turno"],
+        "bays": config.get("bays", 1),
+        "dias_laborales": config["dias_laborables"],
+        "alias_bancario": config.get("alias_bancario", ""),
+        "precio_turno": config.get("precio_turno", 0.0),
+        "latitud": config.get("latitud"),
+        "longitud": config.get("longitud"),
+        "direccion_completa": config.get("direccion_completa"),
+        "esta_abierto": config.get("esta_abierto", False),
+        "created_at": config.get("created_at")
+    }
+    for tipo, sufijo, _, _, precio in TIPOS_VEHICULO_BASE:
+        vista[f"servicio_{sufijo}"] = tipos[tipo]["activo"] if tipo in tipos else False
+        vista[f"precio_{sufijo}"] = tipos[tipo]["precio"] if tipo in tipos else precio
+        vista[f"duracion_{sufijo}"] = tipos[tipo].get("duracion") if tipo in tipos else None
+    return vista
+
+# ========== CACHE DE PRINCIPALES ==========
+
+class PrincipalCache:
+    """Cache en proceso (TTL + LRU acotado) del usuario autenticado por token"""
+
+    def __init__(self, maxsize: int, ttl: float):
+        self._cache = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.hits = 0
+        self.misses = 0
+        self.invalidaciones = 0
+
+    def get(self, clave: str):
+        user = self._cache.get(clave)
+        if user is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        # Copia: los handlers no deben mutar el objeto compartido
+        return user.copy()
+
+    def set(self, clave: str, user):
+        self._cache[clave] = user.copy()
+
+    def invalidar(self, clave: str):
+        if self._cache.pop(clave, None) is not None:
+            self.invalidaciones += 1
+
+    def invalidar_usuario(self, user_id: str):
+        """Elimina todas las entradas (sesiones y JWT) de un usuario"""
+        for clave in [clave for clave, user in list(self._cache.items()) if user.id == user_id]:
+            self.invalidar(clave)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "entradas": len(self._cache),
+            "maxsize": self._cache.maxsize,
+            "ttl_segundos": self._cache.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / total, 4) if total else 0.0,
+            "invalidaciones": self.invalidaciones
+        }
+
+principal_cache = PrincipalCache(
+    maxsize=int(os.environ.get("PRINCIPAL_CACHE_MAXSIZE", "10000")),
+    ttl=float(os.environ.get("PRINCIPAL_CACHE_TTL_SEGUNDOS", "30"))
+)
+
+# ========== REVOCACIÓN DE TOKENS ==========
+
+# Los access tokens llevan uid/rol como claims y se autorizan sin leer users.
+# Para invalidarlos antes de su exp se usa una lista de revocación en memoria,
+# respaldada en la colección tokens_revocados (con TTL) y sincronizada entre
+# workers cada REVOCACIONES_SYNC_SEGUNDOS (ventana máxima de propagación).
+#   "user:<id>" -> revoca todos los tokens del usuario emitidos antes de revocado_en
+#   "jti:<jti>" -> revoca un token puntual
+REVOCACIONES_SYNC_SEGUNDOS = int(os.environ.get("REVOCACIONES_SYNC_SEGUNDOS", "10"))
+
+class ListaRevocacion:
+    def __init__(self):
+        self._revocados = {}  # clave -> timestamp de revocación
+
+    def revocado(self, payload: dict):
+        if f"jti:{payload.get('jti')}" in self._revocados:
+            return True
+        revocado_en = self._revocados.get(f"user:{payload.get('uid')}")
+        # iat va con microsegundos: un login inmediatamente posterior a la revocación pasa
+        return revocado_en is not None and payload.get("iat", 0) <= revocado_en
+
+    async def revocar(self, clave: str):
+        ahora = datetime.now(timezone.utc)
+        # Redondeado hacia arriba al milisegundo (lo que guarda Mongo): la copia en memoria
+        # y la sincronizada desde la base son el mismo instante
+        ahora += timedelta(microseconds=(1000 - ahora.microsecond % 1000) % 1000)
+        self._revocados[clave] = ahora.timestamp()
+        await db.tokens_revocados.update_one(
+            {"_id": clave},
+            {"$set": {
+                "revocado_en": ahora,
+                # Pasado el tiempo de vida de un token la entrada ya no hace falta
+                "expires_at": ahora + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+            }},
+            upsert=True
+        )
+
+    async def revocar_usuario(self, user_id: str):
+        await self.revocar(f"user:{user_id}")
+        # Sin refresh tokens vivos el usuario no puede obtener nuevos access tokens
+        await db.refresh_tokens.delete_many({"user_id": user_id})
+
+    async def sincronizar(self):
+        ahora = datetime.now(timezone.utc)
+        docs = await db.tokens_revocados.find({"expires_at": {"$gt": ahora}}).to_list(None)
+        # Se combina con lo que hay en memoria: una revocación de este worker cuya escritura
+        # terminó después de la lectura no se pierde hasta la próxima sincronización
+        vigencia = ahora.timestamp() - ACCESS_TOKEN_EXPIRE_MINUTES * 60
+        revocados = {clave: revocado_en for clave, revocado_en in self._revocados.items() if revocado_en > vigencia}
+        for doc in docs:
+            revocado_en = doc["revocado_en"].replace(tzinfo=timezone.utc).timestamp()
+            revocados[doc["_id"]] = max(revocado_en, revocados.get(doc["_id"], revocado_en))
+        self._revocados = revocados
+
+lista_revocacion = ListaRevocacion()
+
+async def tarea_sincronizacion_revocaciones():
+    while True:
+        try:
+            await lista_revocacion.sincronizar()
+        except Exception as e:
+            logger.error(f"Error sincronizando tokens revocados: {e}")
+        await asyncio.sleep(REVOCACIONES_SYNC_SEGUNDOS)
+
+# ========== POOL DE HASHING DE CONTRASEÑAS ==========
+
+class PasswordPool:
+    """Ejecuta bcrypt fuera del event loop en un pool acotado con límite de cola"""
+
+    def __init__(self, workers: int, max_cola: int):
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bcrypt")
+        self.workers = workers
+        self.max_cola = max_cola
+        self.en_curso = 0  # trabajos encolados + ejecutándose
+        self.rechazos = 0
+        self._espera = {"count": 0, "total": 0.0, "max": 0.0}
+        self._hash = {"count": 0, "total": 0.0, "max": 0.0}
+
+    @staticmethod
+    def _registrar(metrica: dict, segundos: float):
+        metrica["count"] += 1
+        metrica["total"] += segundos
+        metrica["max"] = max(metrica["max"], segundos)
+
+    async def ejecutar(self, funcion, *args):
+        if self.en_curso >= self.workers + self.max_cola:
+            self.rechazos += 1
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Servidor ocupado, intente nuevamente en unos segundos",
+                headers={"Retry-After": "1"}
+            )
+        
+        encolado = time.perf_counter()
+        tiempos = {}
+        
+        def tarea():
+            inicio = time.perf_counter()
+            tiempos["espera"] = inicio - encolado
+            try:
+                return funcion(*args)
+            finally:
+                tiempos["hash"] = time.perf_counter() - inicio
+        
+        self.en_curso += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, tarea)
+        finally:
+            self.en_curso -= 1
+            if "espera" in tiempos:
+                self._registrar(self._espera, tiempos["espera"])
+                self._registrar(self._hash, tiempos["hash"])
+
+    def stats(self):
+        def resumen(metrica):
+            return {
+                "count": metrica["count"],
+                "avg_ms": round(metrica["total"] / metrica["count"] * 1000, 2) if metrica["count"] else 0.0,
+                "max_ms": round(metrica["max"] * 1000, 2)
+            }
+        return {
+            "workers": self.workers,
+            "max_cola": self.max_cola,
+            "en_curso": self.en_curso,
+            "rechazos": self.rechazos,
+            "espera": resumen(self._espera),
+            "hash": resumen(self._hash)
+        }
+
+password_pool = PasswordPool(
+    workers=int(os.environ.get("PASSWORD_POOL_WORKERS", "4")),
+    max_cola=int(os.environ.get("PASSWORD_POOL_MAX_COLA", "32"))
+)
+
+# ========== LÍMITE DE INTENTOS DE AUTENTICACIÓN ==========
+
+class BackendLimiteMemoria:
+    """Ventana deslizante exacta (log de timestamps) por clave, en proceso"""
+
+    def __init__(self, maxsize: int, ttl: float):
+        # Acotado: claves inactivas o de ráfagas de emails distintos se descartan solas
+        self._ventanas = TTLCache(maxsize=maxsize, ttl=ttl)
+
+    async def registrar(self, clave: str, limite: int, ventana: float) -> Optional[int]:
+        """None si el intento entra en el presupuesto; si no, segundos para reintentar"""
+        ahora = time.monotonic()
+        intentos = self._ventanas.get(clave) or deque()
+        while intentos and intentos[0] <= ahora - ventana:
+            intentos.popleft()
+        if len(intentos) >= limite:
+            self._ventanas[clave] = intentos
+            return max(1, math.ceil(intentos[0] + ventana - ahora))
+        intentos.append(ahora)
+        self._ventanas[clave] = intentos
+        return None
+
+class BackendLimiteMongo:
+    """Ventana deslizante aproximada (dos ventanas fijas ponderadas) compartida entre workers"""
+
+    async def registrar(self, clave: str, limite: int, ventana: float) -> Optional[int]:
+        ahora = time.time()
+        indice = int(ahora // ventana)
+        inicio = indice * ventana
+        actual = await db.limites_intentos.find_one_and_update(
+            {"_id": f"{clave}:{indice}"},
+            {
+                "$inc": {"count": 1},
+                "$setOnInsert": {"expires_at": datetime.fromtimestamp(inicio + 2 * ventana, tz=timezone.utc)}
+            },
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        previa = await db.limites_intentos.find_one({"_id": f"{clave}:{indice - 1}"}, {"count": 1})
+        peso_previa = 1 - (ahora - inicio) / ventana
+        estimado = (previa["count"] if previa else 0) * peso_previa + actual["count"]
+        if estimado > limite:
+            return max(1, math.ceil(inicio + ventana - ahora))
+        return None
+
+def _presupuesto(nombre: str, defecto: str):
+    """Lee un presupuesto "intentos/segundos" de la variable de entorno indicada"""
+    limite, ventana = os.environ.get(nombre, defecto).split("/")
+    return int(limite), float(ventana)
+
+PRESUPUESTOS_AUTENTICACION = {
+    "login": {
+        "ip": _presupuesto("LIMITE_LOGIN_IP", "30/60"),
+        "email": _presupuesto("LIMITE_LOGIN_EMAIL", "10/300"),
+    },
+    "register": {
+        "ip": _presupuesto("LIMITE_REGISTER_IP", "10/3600"),
+        "email": _presupuesto("LIMITE_REGISTER_EMAIL", "3/3600"),
+    },
+}
+
+class LimitadorAutenticacion:
+    """Control de admisión por IP y por email antes de llegar a bcrypt"""
+
+    def __init__(self, backend, presupuestos: dict):
+        self.backend = backend
+        self.presupuestos = presupuestos
+        self._stats = {
+            accion: {dimension: {"permitidos": 0, "rechazados": 0} for dimension in dimensiones}
+            for accion, dimensiones in presupuestos.items()
+        }
+
+    async def verificar(self, accion: str, **dimensiones):
+        for dimension, valor in dimensiones.items():
+            limite, ventana = self.presupuestos[accion][dimension]
+            retry_after = await self.backend.registrar(f"{accion}:{dimension}:{valor}", limite, ventana)
+            if retry_after is not None:
+                self._stats[accion][dimension]["rechazados"] += 1
+                raise HTTPException(
+                    status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                    detail="Demasiados intentos, intente nuevamente más tarde",
+                    headers={"Retry-After": str(retry_after)}
+                )
+            self._stats[accion][dimension]["permitidos"] += 1
+
+    def stats(self):
+        return {
+            "backend": type(self.backend).__name__,
+            "presupuestos": {
+                accion: {dimension: f"{limite}/{int(ventana)}s" for dimension, (limite, ventana) in dimensiones.items()}
+                for accion, dimensiones in self.presupuestos.items()
+            },
+            **self._stats
+        }
+
+# IPs o redes (CIDR) de los proxies propios, separadas por coma. Solo si la conexión
+# viene de uno de ellos se lee X-Forwarded-For; si no, cualquiera podría elegir su IP.
+PROXIES_CONFIABLES = [
+    ipaddress.ip_network(red.strip(), strict=False)
+    for red in os.environ.get("PROXIES_CONFIABLES", "").split(",") if red.strip()
+]
+
+def _proxy_confiable(ip: str) -> bool:
+    try:
+        direccion = ipaddress.ip_address(ip)
+    except ValueError:
+        return False
+    return any(direccion in red for red in PROXIES_CONFIABLES)
+
+def ip_cliente(request: Request) -> str:
+    ip = request.client.host if request.client else "desconocida"
+    forwarded = request.headers.get("X-Forwarded-For")
+    if not forwarded or not _proxy_confiable(ip):
+        return ip
+    # Cada proxy agrega a la derecha la IP que lo llamó: la real es la primera desde la
+    # derecha que no es un proxy propio; las anteriores las controla el cliente
+    for salto in reversed([salto.strip() for salto in forwarded.split(",")]):
+        if not _proxy_confiable(salto):
+            return salto
+    return ip
+
+limitador_autenticacion = LimitadorAutenticacion(
+    backend=(
+        BackendLimiteMongo() if os.environ.get("LIMITE_BACKEND", "memoria") == "mongo"
+        else BackendLimiteMemoria(
+            maxsize=int(os.environ.get("LIMITE_MEMORIA_MAXSIZE", "100000")),
+            ttl=max(ventana for dimensiones in PRESUPUESTOS_AUTENTICACION.values() for _, ventana in dimensiones.values())
+        )
+    ),
+    presupuestos=PRESUPUESTOS_AUTENTICACION
+)
+
+# ========== CLIENTE HTTP DEL SERVICIO DE AUTENTICACIÓN ==========
+
+AUTH_SERVICE_URL = os.environ.get("AUTH_SERVICE_URL", "https://demobackend.emergentagent.com")
+AUTH_SESSION_DATA_PATH = "/auth/v1/env/oauth/session-data"
+
+class AuthServiceClient:
+    """Cliente async compartido (keep-alive) con deadline por llamada y circuit breaker"""
+
+    def __init__(self, base_url: str, deadline: float, umbral_fallos: int, enfriamiento: float):
+        self.base_url = base_url
+        self.deadline = deadline
+        self.umbral_fallos = umbral_fallos
+        self.enfriamiento = enfriamiento
+        self._client = None
+        self._fallos_consecutivos = 0
+        self._abierto_hasta = 0.0
+        self._sonda_en_curso = False
+        self._stats = {"llamadas": 0, "errores": 0, "timeouts": 0, "cortocircuitadas": 0, "aperturas": 0}
+
+    def iniciar(self):
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                timeout=httpx.Timeout(self.deadline),
+                limits=httpx.Limits(max_connections=100, max_keepalive_connections=20)
+            )
+
+    async def cerrar(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def _estado_breaker(self):
+        if self._fallos_consecutivos < self.umbral_fallos:
+            return "CERRADO"
+        if time.monotonic() < self._abierto_hasta:
+            return "ABIERTO"
+        return "SEMI_ABIERTO"
+
+    def _registrar_exito(self):
+        self._fallos_consecutivos = 0
+
+    def _registrar_fallo(self):
+        self._stats["errores"] += 1
+        self._fallos_consecutivos += 1
+        if self._fallos_consecutivos >= self.umbral_fallos:
+            if self._abierto_hasta <= time.monotonic():
+                self._stats["aperturas"] += 1
+            self._abierto_hasta = time.monotonic() + self.enfriamiento
+
+    async def obtener_session_data(self, session_id: str) -> dict:
+        estado = self._estado_breaker()
+        # Abierto, o semi-abierto con la única sonda ya en vuelo: fallar rápido
+        if estado == "ABIERTO" or (estado == "SEMI_ABIERTO" and self._sonda_en_curso):
+            self._stats["cortocircuitadas"] += 1
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Servicio de autenticación no disponible, intente nuevamente más tarde",
+                headers={"Retry-After": str(int(self.enfriamiento))}
+            )
+        
+        self.iniciar()
+        self._stats["llamadas"] += 1
+        self._sonda_en_curso = estado == "SEMI_ABIERTO"
+        try:
+            # El deadline cubre también la espera por una conexión libre del pool
+            response = await asyncio.wait_for(
+                self._client.get(AUTH_SESSION_DATA_PATH, headers={"X-Session-ID": session_id}),
+                timeout=self.deadline
+            )
+        except (asyncio.TimeoutError, httpx.TimeoutException) as e:
+            self._stats["timeouts"] += 1
+            self._registrar_fallo()
+            logger.error(f"Timeout calling Emergent Auth API: {e!r}")
+            raise HTTPException(
+                status_code=status.HTTP_504_GATEWAY_TIMEOUT,
+                detail="El servidor de autenticación no respondió a tiempo"
+            )
+        except httpx.HTTPError as e:
+            self._registrar_fallo()
+            logger.error(f"Error calling Emergent Auth API: {e}")
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail="Error del servidor de autenticación"
+            )
+        finally:
+            self._sonda_en_curso = False
+        
+        if response.status_code >= 500:
+            self._registrar_fallo()
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail="Error del servidor de autenticación"
+            )
+        # Un 4xx es una respuesta sana del servicio: no cuenta para el breaker
+        self._registrar_exito()
+        if response.status_code != 200:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Session ID inválido"
+            )
+        return response.json()
+
+    def stats(self):
+        return {
+            "estado": self._estado_breaker(),
+            "fallos_consecutivos": self._fallos_consecutivos,
+            "deadline_segundos": self.deadline,
+            **self._stats
+        }
+
+auth_service = AuthServiceClient(
+    base_url=AUTH_SERVICE_URL,
+    deadline=float(os.environ.get("AUTH_SERVICE_DEADLINE_SEGUNDOS", "5")),
+    umbral_fallos=int(os.environ.get("AUTH_SERVICE_UMBRAL_FALLOS", "5")),
+    enfriamiento=float(os.environ.get("AUTH_SERVICE_ENFRIAMIENTO_SEGUNDOS", "30"))
+)
+
+class SingleFlight:
+    """Comparte una única ejecución entre llamadas concurrentes con la misma clave"""
+
+    def __init__(self):
+        self._en_vuelo = {}
+        self.compartidas = 0
+
+    def en_vuelo(self, clave: str) -> bool:
+        return clave in self._en_vuelo
+
+    async def ejecutar(self, clave: str, funcion):
+        tarea = self._en_vuelo.get(clave)
+        if tarea is None:
+            tarea = asyncio.create_task(funcion())
+            self._en_vuelo[clave] = tarea
+            tarea.add_done_callback(lambda _: self._en_vuelo.pop(clave, None))
+        else:
+            self.compartidas += 1
+        # shield: si un cliente se desconecta no cancela el intercambio de los demás
+        return await asyncio.shield(tarea)
+
+intercambios_sesion = SingleFlight()
+
+# ========== CACHE DE RESPUESTAS PÚBLICAS ==========
+
+class EntradaCache:
+    def __init__(self, cuerpo: bytes, headers: dict, generacion: int):
+        self.cuerpo = cuerpo
+        self.headers = headers
+        self.generacion = generacion
+        self.creado = time.monotonic()
+
+class CacheRespuestas:
+    """Respuestas JSON pre-serializadas con stale-while-revalidate.
+
+    Una entrada fresca se sirve tal cual; una vencida (pero dentro de max_stale)
+    se sirve igual mientras un único refresh corre en background. Las escrituras
+    invalidan por prefijo de clave ("lavadero:<id>:", "operativos:", ...).
+    """
+
+    def __init__(self, maxsize: int, fresco: float, max_stale: float):
+        self._entradas = TTLCache(maxsize=maxsize, ttl=fresco + max_stale)
+        self._refrescos = SingleFlight()
+        self.fresco = fresco
+        self.max_stale = max_stale
+        # Cambia en cada invalidación: un refresh iniciado antes no debe pisar datos nuevos
+        self._generacion = 0
+        self._stats = {"hits": 0, "stale": 0, "misses": 0, "refrescos": 0, "invalidaciones": 0}
+
+    async def _generar(self, clave: str, generar) -> EntradaCache:
+        generacion = self._generacion
+        respuesta = await generar()
+        entrada = EntradaCache(
+            cuerpo=respuesta.body,
+            headers={k: v for k, v in respuesta.headers.items() if k.lower().startswith("x-")},
+            generacion=generacion
+        )
+        if generacion == self._generacion:
+            self._entradas[clave] = entrada
+        return entrada
+
+    async def _refrescar(self, clave: str, generar):
+        try:
+            self._stats["refrescos"] += 1
+            await self._refrescos.ejecutar(clave, lambda: self._generar(clave, generar))
+        except HTTPException as e:
+            # El recurso ya no existe (o dejó de ser visible): no seguir sirviendo la copia vieja
+            self._entradas.pop(clave, None)
+            logger.info(f"Cache de {clave} descartado al refrescar: {e.status_code}")
+        except Exception as e:
+            # La entrada vencida se sigue sirviendo hasta max_stale
+            logger.error(f"Error refrescando cache de {clave}: {e}")
+
+    async def responder(self, clave: str, generar) -> Response:
+        """generar() es async y devuelve un JSONResponse; solo se cachean los 200"""
+        entrada = self._entradas.get(clave)
+        if entrada is not None:
+            if time.monotonic() - entrada.creado < self.fresco:
+                self._stats["hits"] += 1
+            else:
+                self._stats["stale"] += 1
+                if not self._refrescos.en_vuelo(clave):
+                    asyncio.create_task(self._refrescar(clave, generar))
+        else:
+            self._stats["misses"] += 1
+            entrada = await self._refrescos.ejecutar(clave, lambda: self._generar(clave, generar))
+        return Response(content=entrada.cuerpo, media_type="application/json", headers=entrada.headers)
+
+    def header(self, clave: str, nombre: str) -> Optional[str]:
+        """Header guardado de una entrada, sin contar como hit ni refrescarla"""
+        entrada = self._entradas.get(clave)
+        return entrada.headers.get(nombre.lower()) if entrada is not None else None
+
+    def invalidar(self, *prefijos: str):
+        self._generacion += 1
+        self._stats["invalidaciones"] += 1
+        for clave in [c for c in list(self._entradas.keys()) if c.startswith(prefijos)]:
+            self._entradas.pop(clave, None)
+
+    def invalidar_lavadero(self, lavadero_id: str):
+        # El listado de operativos incluye nombre, dirección y apertura de cada lavadero
+        self.invalidar(f"lavadero:{lavadero_id}:", "operativos:")
+
+    def stats(self):
+        return {
+            "entradas": len(self._entradas),
+            "maxsize": self._entradas.maxsize,
+            "fresco_segundos": self.fresco,
+            "max_stale_segundos": self.max_stale,
+            **self._stats
+        }
+
+cache_respuestas = CacheRespuestas(
+    maxsize=int(os.environ.get("CACHE_RESPUESTAS_MAXSIZE", "5000")),
+    fresco=float(os.environ.get("CACHE_RESPUESTAS_FRESCO_SEGUNDOS", "15")),
+    max_stale=float(os.environ.get("CACHE_RESPUESTAS_MAX_STALE_SEGUNDOS", "300"))
+)
+
+# ========== CONFIGURACIÓN SUPER ADMIN (SINGLETON) ==========
+
+CLAVE_CONFIGURACION_SUPERADMIN = "global"
+
+class ConfiguracionSuperAdminProvider:
+    """Singleton de configuracion_superadmin cacheado en proceso.
+
+    El documento por defecto se crea con un upsert $setOnInsert sobre una clave
+    única, así dos requests concurrentes no pueden crear dos configuraciones.
+    """
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self._config = None
+        self._cargado_en = 0.0
+        self._lock = asyncio.Lock()
+
+    async def _cargar(self) -> dict:
+        coleccion = db.configuracion_superadmin
+        # Adoptar el documento previo a la clave única (el más antiguo) si existe
+        if not await coleccion.find_one({"clave": CLAVE_CONFIGURACION_SUPERADMIN}, {"_id": 1}):
+            legacy = await coleccion.find_one({"clave": {"$exists": False}}, {"_id": 1}, sort=[("created_at", ASCENDING)])
+            if legacy:
+                try:
+                    await coleccion.update_one({"_id": legacy["_id"]}, {"$set": {"clave": CLAVE_CONFIGURACION_SUPERADMIN}})
+                except DuplicateKeyError:
+                    pass  # otro worker lo adoptó primero
+        
+        default_config = ConfiguracionSuperAdmin(
+            alias_bancario="superadmin.alias.mp",
+            precio_mensualidad=10000.0
+        )
+        try:
+            return await coleccion.find_one_and_update(
+                {"clave": CLAVE_CONFIGURACION_SUPERADMIN},
+                {"$setOnInsert": default_config.dict()},
+                projection={"_id": 0, "clave": 0},
+                upsert=True,
+                return_document=ReturnDocument.AFTER
+            )
+        except DuplicateKeyError:
+            # Carrera de upserts entre workers: el documento ya existe
+            return await coleccion.find_one({"clave": CLAVE_CONFIGURACION_SUPERADMIN}, {"_id": 0, "clave": 0})
+
+    def _guardar(self, config: dict):
+        self._config = config
+        self._cargado_en = time.monotonic()
+
+    async def obtener(self) -> dict:
+        # El TTL acota cuánto tarda en verse un cambio hecho desde otro worker
+        if self._config is None or time.monotonic() - self._cargado_en > self.ttl:
+            async with self._lock:
+                if self._config is None or time.monotonic() - self._cargado_en > self.ttl:
+                    self._guardar(await self._cargar())
+        return dict(self._config)
+
+    async def actualizar(self, campos: dict) -> dict:
+        """Aplica los cambios y devuelve la configuración anterior"""
+        await self.obtener()  # garantiza que el singleton exista
+        anterior = await db.configuracion_superadmin.find_one_and_update(
+            {"clave": CLAVE_CONFIGURACION_SUPERADMIN},
+            {"$set": campos},
+            projection={"_id": 0, "clave": 0},
+            return_document=ReturnDocument.BEFORE
+        )
+        self._guardar({**anterior, **campos})
+        return anterior
+
+configuracion_superadmin = ConfiguracionSuperAdminProvider(
+    ttl=float(os.environ.get("CONFIGURACION_SUPERADMIN_TTL_SEGUNDOS", "60"))
+)
+
 # Utility functions
 def verify_password(plain_password, hashed_password):
     return pwd_context.verify(plain_password, hashed_password)
@@ -310,16 +1538,51 @@ def verify_password(plain_password, hashed_password):
 def get_password_hash(password):
     return pwd_context.hash(password)
 
+async def verify_password_async(plain_password, hashed_password):
+    return await password_pool.ejecutar(verify_password, plain_password, hashed_password)
+
+async def get_password_hash_async(password):
+    return await password_pool.ejecutar(get_password_hash, password)
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
     if expires_delta:
         expire = datetime.utcnow() + expires_delta
     else:
         expire = datetime.utcnow() + timedelta(minutes=15)
-    to_encode.update({"exp": expire})
+    # iat con fracción de segundo: se compara contra el instante de revocación del usuario
+    to_encode.update({"exp": expire, "iat": datetime.now(timezone.utc).timestamp()})
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
+def hash_refresh_token(refresh_token: str) -> str:
+    # HMAC en lugar de bcrypt: el token ya tiene 256 bits de entropía
+    return hmac.new(SECRET_KEY.encode(), refresh_token.encode(), hashlib.sha256).hexdigest()
+
+async def create_refresh_token(user_id: str, familia: Optional[str] = None) -> str:
+    """Emite un refresh token opaco; en la base solo se guarda su hash"""
+    refresh_token = secrets.token_urlsafe(32)
+    ahora = datetime.now(timezone.utc)
+    await db.refresh_tokens.insert_one({
+        "id": str(uuid.uuid4()),
+        "token_hash": hash_refresh_token(refresh_token),
+        "user_id": user_id,
+        # Todos los tokens rotados desde un mismo login comparten familia
+        "familia": familia or str(uuid.uuid4()),
+        "usado_en": None,
+        "created_at": ahora,
+        "expires_at": ahora + timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS)
+    })
+    return refresh_token
+
+async def emitir_tokens(user, familia: Optional[str] = None):
+    access_token = create_access_token(
+        data={"sub": user.email, "uid": user.id, "rol": user.rol, "jti": str(uuid.uuid4())},
+        expires_delta=timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+    )
+    refresh_token = await create_refresh_token(user.id, familia)
+    return access_token, refresh_token
+
 async def get_user_by_email(email: str):
     user_doc = await db.users.find_one({"email": email})
     if user_doc:
@@ -337,7 +1600,7 @@ async def authenticate_user(email: str, password: str):
                 email=email,
                 nombre="Super Admin",
                 rol=UserRole.SUPER_ADMIN,
-                password_hash=get_password_hash(password)
+                password_hash=await get_password_hash_async(password)
             )
             user_dict = super_admin.dict()
             await db.users.insert_one(user_dict)
@@ -348,6 +1611,7 @@ async def authenticate_user(email: str, password: str):
                     {"email": email},
                     {"$set": {"rol": UserRole.SUPER_ADMIN}}
                 )
+                principal_cache.invalidar_usuario(super_admin.id)
                 super_admin.rol = UserRole.SUPER_ADMIN
         return super_admin
     
@@ -355,41 +1619,64 @@ async def authenticate_user(email: str, password: str):
     user = await get_user_by_email(email)
     if not user:
         return False
-    if not user.password_hash or not verify_password(password, user.password_hash):
+    if not user.password_hash or not await verify_password_async(password, user.password_hash):
         return False
     return user
 
 async def get_session_user(session_token: str):
     """Get user from session token"""
-    session_doc = await db.google_sessions.find_one({"session_token": session_token})
-    if not session_doc:
-        return None
-    
-    session = GoogleSession(**session_doc)
-    
-    # Check if session is expired
-    current_time = datetime.now(timezone.utc)
-    session_expires = session.expires_at
-    
-    # Ensure both datetimes are timezone-aware for comparison
-    if session_expires.tzinfo is None:
-        session_expires = session_expires.replace(tzinfo=timezone.utc)
-    
-    if session_expires < current_time:
-        await db.google_sessions.delete_one({"session_token": session_token})
-        return None
-    
-    # Get user
-    user_doc = await db.users.find_one({"id": session.user_id})
-    if user_doc:
-        return User(**user_doc)
+    # Las sesiones vencidas se filtran en la query; el índice TTL las elimina
+    pipeline = [
+        {"$match": {
+            "session_token": session_token,
+            "expires_at": {"$gt": datetime.now(timezone.utc)}
+        }},
+        {"$limit": 1},
+        {"$lookup": {
+            "from": "users",
+            "localField": "user_id",
+            "foreignField": "id",
+            "as": "user"
+        }},
+        {"$unwind": "$user"}
+    ]
+    sessions = await db.google_sessions.aggregate(pipeline).to_list(1)
+    if sessions:
+        return User(**sessions[0]["user"])
     return None
 
+async def get_session_user_cached(session_token: str):
+    clave = f"session:{session_token}"
+    user = principal_cache.get(clave)
+    if user is None:
+        user = await get_session_user(session_token)
+        if user:
+            principal_cache.set(clave, user)
+    return user
+
+async def get_jwt_user_cached(email: str):
+    clave = f"jwt:{email}"
+    user = principal_cache.get(clave)
+    if user is None:
+        user = await get_user_by_email(email)
+        if user:
+            principal_cache.set(clave, user)
+    return user
+
 async def get_current_user(request: Request):
+    # Memoizado por request: dependencias y handlers comparten el mismo usuario
+    cached_user = getattr(request.state, "current_user", None)
+    if cached_user:
+        return cached_user
+    user = await _resolve_current_user(request)
+    request.state.current_user = user
+    return user
+
+async def _resolve_current_user(request: Request):
     # First try to get user from session cookie (Google OAuth)
     session_token = request.cookies.get("session_token")
     if session_token:
-        user = await get_session_user(session_token)
+        user = await get_session_user_cached(session_token)
         if user:
             return user
     
@@ -405,12 +1692,12 @@ async def get_current_user(request: Request):
             token = auth_header.split(" ")[1]
             payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
             email: str = payload.get("sub")
-            if email is None:
+            if email is None or lista_revocacion.revocado(payload):
                 raise credentials_exception
         except JWTError:
             raise credentials_exception
         
-        user = await get_user_by_email(email)
+        user = await get_jwt_user_cached(email)
         if user is None:
             raise credentials_exception
         return user
@@ -427,7 +1714,7 @@ async def get_current_user_optional(request: Request):
     # Try session cookie first
     session_token = request.cookies.get("session_token")
     if session_token:
-        user = await get_session_user(session_token)
+        user = await get_session_user_cached(session_token)
         if user:
             return user
     
@@ -438,16 +1725,57 @@ async def get_current_user_optional(request: Request):
             token = auth_header.split(" ")[1]
             payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
             email: str = payload.get("sub")
-            if email:
-                user = await get_user_by_email(email)
+            if email and not lista_revocacion.revocado(payload):
+                user = await get_jwt_user_cached(email)
                 return user
         except JWTError:
             pass
     
     return None
 
+class Principal(BaseModel):
+    id: str
+    email: str
+    rol: str
+
+def _decodificar_bearer(request: Request):
+    """Payload del JWT del header Authorization, o None si falta o es inválido"""
+    auth_header = request.headers.get("Authorization")
+    if not auth_header or not auth_header.startswith("Bearer "):
+        return None
+    try:
+        return jwt.decode(auth_header.split(" ")[1], SECRET_KEY, algorithms=[ALGORITHM])
+    except JWTError:
+        return None
+
+def _principal_desde_claims(request: Request):
+    """Principal desde los claims del JWT (sin consultar users); None si no aplica"""
+    payload = _decodificar_bearer(request)
+    if not payload:
+        return None
+    # Tokens emitidos antes de los claims uid/rol resuelven el usuario en la base
+    if not payload.get("uid") or not payload.get("rol") or lista_revocacion.revocado(payload):
+        return None
+    return Principal(id=payload["uid"], email=payload["sub"], rol=payload["rol"])
+
+async def get_principal(request: Request):
+    """Identidad y rol del usuario autenticado, para checks de autorización"""
+    principal = getattr(request.state, "principal", None)
+    if principal:
+        return principal
+    
+    # La cookie de sesión tiene prioridad, igual que en get_current_user
+    if not request.cookies.get("session_token"):
+        principal = _principal_desde_claims(request)
+    if principal is None:
+        current_user = await get_current_user(request)
+        principal = Principal(id=current_user.id, email=current_user.email, rol=current_user.rol)
+    
+    request.state.principal = principal
+    return principal
+
 async def get_admin_user(request: Request):
-    current_user = await get_current_user(request)
+    current_user = await get_principal(request)
     if current_user.rol not in [UserRole.ADMIN, UserRole.SUPER_ADMIN]:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
@@ -456,7 +1784,7 @@ async def get_admin_user(request: Request):
     return current_user
 
 async def get_super_admin_user(request: Request):
-    current_user = await get_current_user(request)
+    current_user = await get_principal(request)
     if current_user.rol != UserRole.SUPER_ADMIN:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
@@ -479,11 +1807,76 @@ async def verify_admin_owns_lavadero(admin_id: str, lavadero_id: str):
         )
     return lavadero
 
+# ========== CONTEXTO DE ADMIN (TENANT) ==========
+
+class AdminContext(BaseModel):
+    user: User
+    lavadero: Optional[dict] = None
+    config: Optional[dict] = None
+
+async def cargar_admin_context(request: Request, cargar_lavadero: bool = True):
+    """Resuelve usuario + lavadero + configuración una sola vez por request"""
+    ctx = getattr(request.state, "admin_context", None)
+    if ctx and (ctx.lavadero or not cargar_lavadero):
+        return ctx
+    
+    current_user = await get_current_user(request)
+    ctx = AdminContext(user=current_user)
+    if cargar_lavadero:
+        # Lavadero y configuración en una sola agregación
+        pipeline = [
+            {"$match": {"admin_id": current_user.id}},
+            {"$limit": 1},
+            {"$lookup": {
+                "from": "configuracion_lavadero",
+                "let": {"lavadero_id": "$id"},
+                "pipeline": [
+                    {"$match": {"$expr": {"$eq": ["$lavadero_id", "$$lavadero_id"]}}},
+                    {"$limit": 1},
+                    {"$project": {"_id": 0}}
+                ],
+                "as": "config"
+            }},
+            {"$project": {"_id": 0}}
+        ]
+        lavaderos = await db.lavaderos.aggregate(pipeline).to_list(1)
+        if lavaderos:
+            lavadero_doc = lavaderos[0]
+            configs = lavadero_doc.pop("config")
+            ctx.lavadero = lavadero_doc
+            ctx.config = configs[0] if configs else None
+    
+    request.state.admin_context = ctx
+    return ctx
+
+def admin_context(detail: str, cargar_lavadero: bool = True):
+    """Dependencia FastAPI: exige rol ADMIN y devuelve su AdminContext"""
+    async def dependency(request: Request) -> AdminContext:
+        current_user = await get_current_user(request)
+        if current_user.rol != UserRole.ADMIN:
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail=detail
+            )
+        
+        ctx = await cargar_admin_context(request, cargar_lavadero=cargar_lavadero)
+        if cargar_lavadero and not ctx.lavadero:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Lavadero no encontrado"
+            )
+        return ctx
+    return dependency
+
 # ========== ENDPOINTS DE REGISTRO ==========
 
 # Registro normal (solo para clientes)
 @api_router.post("/register", response_model=UserResponse)
-async def register_user(user_data: UserCreate):
+async def register_user(user_data: UserCreate, request: Request):
+    await limitador_autenticacion.verificar(
+        "register", ip=ip_cliente(request), email=user_data.email.lower()
+    )
+    
     # Check if user already exists
     existing_user = await get_user_by_email(user_data.email)
     if existing_user:
@@ -500,7 +1893,7 @@ async def register_user(user_data: UserCreate):
         )
     
     # Create user
-    password_hash = get_password_hash(user_data.password)
+    password_hash = await get_password_hash_async(user_data.password)
     new_user = User(
         email=user_data.email,
         nombre=user_data.nombre,
@@ -516,7 +1909,11 @@ async def register_user(user_data: UserCreate):
 
 # Registro de Admin con Lavadero
 @api_router.post("/register-admin", response_model=dict)
-async def register_admin_with_lavadero(admin_data: AdminLavaderoRegister):
+async def register_admin_with_lavadero(admin_data: AdminLavaderoRegister, request: Request):
+    await limitador_autenticacion.verificar(
+        "register", ip=ip_cliente(request), email=admin_data.email.lower()
+    )
+    
     # Check if user already exists
     existing_user = await get_user_by_email(admin_data.email)
     if existing_user:
@@ -536,7 +1933,7 @@ async def register_admin_with_lavadero(admin_data: AdminLavaderoRegister):
         )
     
     # Create admin user
-    password_hash = get_password_hash(admin_data.password)
+    password_hash = await get_password_hash_async(admin_data.password)
     new_admin = User(
         email=admin_data.email,
         nombre=admin_data.nombre,
@@ -567,18 +1964,11 @@ async def register_admin_with_lavadero(admin_data: AdminLavaderoRegister):
     # Insert lavadero to database
     lavadero_dict = new_lavadero.dict()
     await db.lavaderos.insert_one(lavadero_dict)
+    await registrar_transicion(CONTADORES_GLOBAL, "lavaderos", nuevo=new_lavadero.estado_operativo)
     
     # Create pago mensualidad pendiente
     # Obtener configuración super admin
-    config_super = await db.configuracion_superadmin.find_one({})
-    if not config_super:
-        # Crear configuración por defecto si no existe
-        default_config = ConfiguracionSuperAdmin(
-            alias_bancario="superadmin.alias.mp",
-            precio_mensualidad=10000.0
-        )
-        await db.configuracion_superadmin.insert_one(default_config.dict())
-        config_super = default_config.dict()
+    config_super = await configuracion_superadmin.obtener()
     
     # Crear pago mensualidad
     # (datetime ya está importado al inicio del archivo)
@@ -605,7 +1995,11 @@ async def register_admin_with_lavadero(admin_data: AdminLavaderoRegister):
     }
 
 @api_router.post("/login", response_model=Token)
-async def login(login_data: LoginRequest):
+async def login(login_data: LoginRequest, request: Request):
+    await limitador_autenticacion.verificar(
+        "login", ip=ip_cliente(request), email=login_data.email.lower()
+    )
+    
     user = await authenticate_user(login_data.email, login_data.password)
     if not user:
         raise HTTPException(
@@ -615,36 +2009,90 @@ async def login(login_data: LoginRequest):
         )
     
     # Verificar estado del admin si no es super admin
-    if user.rol == UserRole.ADMIN:
-        # Buscar el lavadero del admin
-        lavadero_doc = await db.lavaderos.find_one({"admin_id": user.id})
-        if lavadero_doc:
-            lavadero = Lavadero(**lavadero_doc)
-            # Verificar si está vencido
-            if lavadero.fecha_vencimiento:
-                # Asegurar que ambas fechas tengan timezone para comparar
-                fecha_vencimiento = lavadero.fecha_vencimiento
-                if fecha_vencimiento.tzinfo is None:
-                    fecha_vencimiento = fecha_vencimiento.replace(tzinfo=timezone.utc)
-                    
-                if fecha_vencimiento < datetime.now(timezone.utc):
-                    lavadero.estado_operativo = EstadoAdmin.VENCIDO
-                    await db.lavaderos.update_one(
-                        {"id": lavadero.id},
-                        {"$set": {"estado_operativo": EstadoAdmin.VENCIDO}}
-                    )
+    await verificar_vencimiento_admin(user)
     
-    access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-    access_token = create_access_token(
-        data={"sub": user.email}, expires_delta=access_token_expires
-    )
+    access_token, refresh_token = await emitir_tokens(user)
     
     user_response = UserResponse(**user.dict())
     
     return Token(
         access_token=access_token,
         token_type="bearer",
-        user=user_response
+        user=user_response,
+        refresh_token=refresh_token
+    )
+
+async def verificar_vencimiento_admin(user: User) -> Optional[str]:
+    """Pasa a VENCIDO el lavadero de un admin con la suscripción vencida; devuelve su estado_operativo"""
+    if user.rol != UserRole.ADMIN:
+        return None
+    lavadero_doc = await db.lavaderos.find_one({"admin_id": user.id})
+    if not lavadero_doc:
+        return None
+    lavadero = Lavadero(**lavadero_doc)
+    if lavadero.fecha_vencimiento:
+        # Asegurar que ambas fechas tengan timezone para comparar
+        fecha_vencimiento = lavadero.fecha_vencimiento
+        if fecha_vencimiento.tzinfo is None:
+            fecha_vencimiento = fecha_vencimiento.replace(tzinfo=timezone.utc)
+        
+        if fecha_vencimiento < datetime.now(timezone.utc) and lavadero.estado_operativo != EstadoAdmin.VENCIDO:
+            result = await db.lavaderos.update_one(
+                {"id": lavadero.id, "estado_operativo": lavadero.estado_operativo},
+                {"$set": {"estado_operativo": EstadoAdmin.VENCIDO}}
+            )
+            if result.modified_count:
+                await registrar_transicion(
+                    CONTADORES_GLOBAL, "lavaderos",
+                    anterior=lavadero.estado_operativo, nuevo=EstadoAdmin.VENCIDO
+                )
+                cache_respuestas.invalidar_lavadero(lavadero.id)
+            lavadero.estado_operativo = EstadoAdmin.VENCIDO
+    return lavadero.estado_operativo
+
+# Rotar refresh token: nuevo access token sin verificar la contraseña
+@api_router.post("/refresh", response_model=Token)
+async def refresh_access_token(refresh_data: RefreshRequest):
+    token_invalido = HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Refresh token inválido o expirado",
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+    token_hash = hash_refresh_token(refresh_data.refresh_token)
+    ahora = datetime.now(timezone.utc)
+    
+    # Marcar como usado de forma atómica: cada refresh token sirve una sola vez
+    token_doc = await db.refresh_tokens.find_one_and_update(
+        {"token_hash": token_hash, "usado_en": None, "expires_at": {"$gt": ahora}},
+        {"$set": {"usado_en": ahora}}
+    )
+    if not token_doc:
+        reutilizado = await db.refresh_tokens.find_one(
+            {"token_hash": token_hash, "usado_en": {"$ne": None}},
+            {"_id": 0, "familia": 1, "user_id": 1, "usado_en": 1}
+        )
+        usado_en = reutilizado and reutilizado["usado_en"].replace(tzinfo=reutilizado["usado_en"].tzinfo or timezone.utc)
+        if reutilizado and ahora - usado_en > timedelta(seconds=REFRESH_REUSO_GRACIA_SEGUNDOS):
+            # Reuso de un token ya rotado: posible robo, se invalida toda la familia
+            logger.warning(f"Reuso de refresh token detectado para usuario {reutilizado['user_id']}")
+            await db.refresh_tokens.delete_many({"familia": reutilizado["familia"]})
+        raise token_invalido
+    
+    user_doc = await db.users.find_one({"id": token_doc["user_id"]})
+    if not user_doc:
+        raise token_invalido
+    user = User(**user_doc)
+    # Sin esto un admin que solo rota tokens nunca pasaría a VENCIDO. Como en login, el
+    # vencimiento no corta la sesión: el panel muestra el estado y pide el pago
+    await verificar_vencimiento_admin(user)
+    
+    access_token, refresh_token = await emitir_tokens(user, familia=token_doc["familia"])
+    
+    return Token(
+        access_token=access_token,
+        token_type="bearer",
+        user=UserResponse(**user.dict()),
+        refresh_token=refresh_token
     )
 
 @api_router.get("/me", response_model=UserResponse)
@@ -659,16 +2107,17 @@ async def get_dashboard_stats(request: Request):
     
     if current_user.rol == UserRole.SUPER_ADMIN:
         # Super Admin: estadísticas globales
-        total_lavaderos = await db.lavaderos.count_documents({})
-        lavaderos_activos = await db.lavaderos.count_documents({"estado_operativo": EstadoAdmin.ACTIVO})
-        lavaderos_pendientes = await db.lavaderos.count_documents({"estado_operativo": EstadoAdmin.PENDIENTE_APROBACION})
-        comprobantes_pendientes = await db.comprobantes_pago_mensualidad.count_documents({"estado": EstadoPago.PENDIENTE})
+        # Lectura O(1) desde los contadores globales
+        lavaderos_por_estado, comprobantes_por_estado = await asyncio.gather(
+            leer_contadores(CONTADORES_GLOBAL, "lavaderos"),
+            leer_contadores(CONTADORES_GLOBAL, "comprobantes_pago_mensualidad")
+        )
         
         return {
-            "total_lavaderos": total_lavaderos,
-            "lavaderos_activos": lavaderos_activos,
-            "lavaderos_pendientes": lavaderos_pendientes,
-            "comprobantes_pendientes": comprobantes_pendientes
+            "total_lavaderos": sum(lavaderos_por_estado.values()),
+            "lavaderos_activos": lavaderos_por_estado.get(EstadoAdmin.ACTIVO, 0),
+            "lavaderos_pendientes": lavaderos_por_estado.get(EstadoAdmin.PENDIENTE_APROBACION, 0),
+            "comprobantes_pendientes": comprobantes_por_estado.get(EstadoPago.PENDIENTE, 0)
         }
     
     elif current_user.rol == UserRole.ADMIN:
@@ -682,14 +2131,10 @@ async def get_dashboard_stats(request: Request):
         
         lavadero = Lavadero(**lavadero_doc)
         
-        # Contar turnos
-        total_turnos = await db.turnos.count_documents({"lavadero_id": lavadero.id})
-        turnos_confirmados = await db.turnos.count_documents({"lavadero_id": lavadero.id, "estado": EstadoTurno.CONFIRMADO})
-        turnos_pendientes = await db.turnos.count_documents({"lavadero_id": lavadero.id, "estado": EstadoTurno.RESERVADO})
-        comprobantes_pendientes = await db.comprobantes_pago.count_documents({
-            "turno_id": {"$in": [turno["id"] async for turno in db.turnos.find({"lavadero_id": lavadero.id})]},
-            "estado": EstadoPago.PENDIENTE
-        })
+        # Turnos y comprobantes desde los contadores del lavadero (un solo documento)
+        contadores_doc = await db.contadores.find_one({"_id": clave_contadores_lavadero(lavadero.id)}) or {}
+        turnos_por_estado = sin_negativos(contadores_doc.get("turnos", {}))
+        comprobantes_pendientes = sin_negativos(contadores_doc.get("comprobantes_pago", {})).get(EstadoPago.PENDIENTE, 0)
         
         # Días restantes de suscripción
         dias_restantes = 0
@@ -705,30 +2150,49 @@ async def get_dashboard_stats(request: Request):
             "lavadero_nombre": lavadero.nombre,
             "estado_operativo": lavadero.estado_operativo,
             "dias_restantes": dias_restantes,
-            "total_turnos": total_turnos,
-            "turnos_confirmados": turnos_confirmados,
-            "turnos_pendientes": turnos_pendientes,
+            "total_turnos": sum(turnos_por_estado.values()),
+            "turnos_confirmados": turnos_por_estado.get(EstadoTurno.CONFIRMADO, 0),
+            "turnos_pendientes": turnos_por_estado.get(EstadoTurno.RESERVADO, 0),
             "comprobantes_pendientes": comprobantes_pendientes
         }
     
     else:  # CLIENTE
         # Cliente: estadísticas de sus turnos
-        mis_turnos = await db.turnos.count_documents({"cliente_id": current_user.id})
-        turnos_confirmados = await db.turnos.count_documents({"cliente_id": current_user.id, "estado": EstadoTurno.CONFIRMADO})
-        turnos_pendientes = await db.turnos.count_documents({"cliente_id": current_user.id, "estado": EstadoTurno.RESERVADO})
+        turnos_por_estado = await leer_contadores(clave_contadores_cliente(current_user.id), "turnos")
         
         return {
-            "mis_turnos": mis_turnos,
-            "confirmados": turnos_confirmados,
-            "pendientes": turnos_pendientes
+            "mis_turnos": sum(turnos_por_estado.values()),
+            "confirmados": turnos_por_estado.get(EstadoTurno.CONFIRMADO, 0),
+            "pendientes": turnos_por_estado.get(EstadoTurno.RESERVADO, 0)
         }
 
 # User Management (Admin only)
 @api_router.get("/admin/users", response_model=List[UserResponse])
-async def get_all_users(request: Request):
+async def get_all_users(
+    request: Request,
+    response: Response,
+    rol: Optional[str] = None,
+    is_active: Optional[bool] = None,
+    q: Optional[str] = None,
+    limit: int = 50,
+    cursor: Optional[str] = None
+):
     admin_user = await get_admin_user(request)
-    users_cursor = db.users.find({})
-    users = await users_cursor.to_list(1000)
+    
+    limit = max(1, min(limit, LIMITE_PAGINA_MAXIMO))
+    filtros = []
+    if rol:
+        filtros.append({"rol": rol})
+    if is_active is not None:
+        filtros.append({"is_active": is_active})
+    if q:
+        filtros.append(filtro_prefijo(q, ["email", "nombre"]))
+    if cursor:
+        filtros.append(filtro_keyset(cursor))
+    
+    proyeccion = {"_id": 0, "password_hash": 0}
+    users_cursor = db.users.find({"$and": filtros} if filtros else {}, proyeccion).sort(ORDEN_KEYSET).limit(limit + 1)
+    users = paginar(response, await users_cursor.to_list(limit + 1), limit)
     return [UserResponse(**user) for user in users]
 
 @api_router.delete("/admin/users/{user_id}")
@@ -740,6 +2204,8 @@ async def delete_user(user_id: str, request: Request):
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Usuario no encontrado"
         )
+    principal_cache.invalidar_usuario(user_id)
+    await lista_revocacion.revocar_usuario(user_id)
     return {"message": "Usuario eliminado correctamente"}
 
 @api_router.put("/admin/users/{user_id}/toggle-status")
@@ -757,6 +2223,9 @@ async def toggle_user_status(user_id: str, request: Request):
         {"id": user_id},
         {"$set": {"is_active": new_status}}
     )
+    principal_cache.invalidar_usuario(user_id)
+    if not new_status:
+        await lista_revocacion.revocar_usuario(user_id)
     
     return {"message": f"Usuario {'activado' if new_status else 'desactivado'} correctamente"}
 
@@ -771,91 +2240,86 @@ async def admin_only_route(request: Request):
     admin_user = await get_admin_user(request)
     return {"message": "Solo los administradores pueden ver esto", "secret": "Información ultra secreta"}
 
-# Google OAuth Session Endpoint
-@api_router.get("/session-data", response_model=SessionDataResponse)
-async def get_session_data(request: Request):
-    session_id = request.headers.get("X-Session-ID")
-    if not session_id:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Session ID requerido"
-        )
-    
+async def intercambiar_session_data(session_id: str) -> dict:
     # Call Emergent Auth API
-    try:
-        response = requests.get(
-            "https://demobackend.emergentagent.com/auth/v1/env/oauth/session-data",
-            headers={"X-Session-ID": session_id},
-            timeout=10
+    session_data = await auth_service.obtener_session_data(session_id)
+    
+    # Check if user exists, if not create them
+    user = await get_user_by_email(session_data["email"])
+    
+    if not user:
+        # Create new Google user with default role
+        google_user_data = GoogleUser(
+            email=session_data["email"],
+            nombre=session_data["name"],
+            google_id=session_data["id"],
+            picture=session_data.get("picture"),
+            rol=UserRole.CLIENTE  # Default role for Google users
         )
         
-        if response.status_code != 200:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Session ID inválido"
-            )
-        
-        session_data = response.json()
-        
-        # Check if user exists, if not create them
-        user = await get_user_by_email(session_data["email"])
-        
-        if not user:
-            # Create new Google user with default role
-            google_user_data = GoogleUser(
-                email=session_data["email"],
-                nombre=session_data["name"],
-                google_id=session_data["id"],
-                picture=session_data.get("picture"),
-                rol=UserRole.CLIENTE  # Default role for Google users
-            )
-            
-            new_user = User(
-                email=google_user_data.email,
-                nombre=google_user_data.nombre,
-                rol=google_user_data.rol,
-                google_id=google_user_data.google_id,
-                picture=google_user_data.picture,
-                password_hash=None  # No password for Google users
-            )
-            
-            user_dict = new_user.dict()
-            await db.users.insert_one(user_dict)
-            user = new_user
-        else:
-            # Update existing user with Google info if they don't have it
-            if not user.google_id:
-                await db.users.update_one(
-                    {"id": user.id},
-                    {"$set": {
-                        "google_id": session_data["id"],
-                        "picture": session_data.get("picture")
-                    }}
-                )
-                # Update user object
-                user.google_id = session_data["id"]
-                user.picture = session_data.get("picture")
-        
-        # Create session in database
-        session_token = session_data["session_token"]
-        expires_at = datetime.now(timezone.utc) + timedelta(days=7)
-        
-        google_session = GoogleSession(
-            user_id=user.id,
-            session_token=session_token,
-            expires_at=expires_at
+        new_user = User(
+            email=google_user_data.email,
+            nombre=google_user_data.nombre,
+            rol=google_user_data.rol,
+            google_id=google_user_data.google_id,
+            picture=google_user_data.picture,
+            password_hash=None  # No password for Google users
         )
         
-        await db.google_sessions.insert_one(google_session.dict())
-        
-        return SessionDataResponse(**session_data)
-        
-    except requests.RequestException as e:
-        logger.error(f"Error calling Emergent Auth API: {e}")
+        user_dict = new_user.dict()
+        await db.users.insert_one(user_dict)
+        user = new_user
+    else:
+        # Update existing user with Google info if they don't have it
+        if not user.google_id:
+            await db.users.update_one(
+                {"id": user.id},
+                {"$set": {
+                    "google_id": session_data["id"],
+                    "picture": session_data.get("picture")
+                }}
+            )
+            # Update user object
+            user.google_id = session_data["id"]
+            user.picture = session_data.get("picture")
+    
+    # Create session in database
+    session_token = session_data["session_token"]
+    expires_at = datetime.now(timezone.utc) + timedelta(days=7)
+    
+    google_session = GoogleSession(
+        user_id=user.id,
+        session_token=session_token,
+        expires_at=expires_at
+    )
+    
+    # Upsert por token: reintentos del mismo intercambio no duplican la sesión
+    session_dict = google_session.dict()
+    await db.google_sessions.update_one(
+        {"session_token": session_token},
+        {
+            "$set": {"user_id": session_dict["user_id"], "expires_at": session_dict["expires_at"]},
+            "$setOnInsert": {"id": session_dict["id"], "created_at": session_dict["created_at"]}
+        },
+        upsert=True
+    )
+    
+    return session_data
+
+# Google OAuth Session Endpoint
+@api_router.get("/session-data", response_model=SessionDataResponse)
+async def get_session_data(request: Request):
+    session_id = request.headers.get("X-Session-ID")
+    if not session_id:
         raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail="Error del servidor de autenticación"
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Session ID requerido"
         )
+    
+    session_data = await intercambios_sesion.ejecutar(
+        session_id, lambda: intercambiar_session_data(session_id)
+    )
+    return SessionDataResponse(**session_data)
 
 class SetSessionCookieRequest(BaseModel):
     session_token: str
@@ -878,7 +2342,7 @@ async def set_session_cookie(response: Response, request_data: SetSessionCookieR
     return {"message": "Cookie establecida correctamente"}
 
 @api_router.post("/logout")
-async def logout(request: Request, response: Response):
+async def logout(request: Request, response: Response, refresh_data: Optional[RefreshRequest] = None):
     """Logout user and clear session"""
     # Get session token from cookie
     session_token = request.cookies.get("session_token")
@@ -886,6 +2350,7 @@ async def logout(request: Request, response: Response):
     if session_token:
         # Delete session from database
         await db.google_sessions.delete_one({"session_token": session_token})
+        principal_cache.invalidar(f"session:{session_token}")
         
         # Clear cookie
         is_development = os.environ.get('CORS_ORIGINS', '*') == '*'
@@ -897,6 +2362,20 @@ async def logout(request: Request, response: Response):
             samesite="lax" if is_development else "none"
         )
     
+    # Revocar el access token presentado (si lo hay)
+    payload = _decodificar_bearer(request)
+    if payload and payload.get("jti"):
+        await lista_revocacion.revocar(f"jti:{payload['jti']}")
+    
+    # Invalidar la familia del refresh token presentado (si lo hay)
+    if refresh_data:
+        token_doc = await db.refresh_tokens.find_one(
+            {"token_hash": hash_refresh_token(refresh_data.refresh_token)},
+            {"_id": 0, "familia": 1}
+        )
+        if token_doc:
+            await db.refresh_tokens.delete_many({"familia": token_doc["familia"]})
+    
     return {"message": "Sesión cerrada correctamente"}
 
 @api_router.get("/check-session")
@@ -912,52 +2391,782 @@ async def check_session(request: Request):
 async def root():
     return {"message": "Hello World", "status": "API funcionando"}
 
+# ========== DISPONIBILIDAD DE TURNOS ==========
+
+ZONA_HORARIA_LAVADEROS = ZoneInfo(os.environ.get("LAVADEROS_TZ", "America/Argentina/Tucuman"))
+DISPONIBILIDAD_MAX_DIAS = 62
+# El resumen mensual (público, y escribe bitmaps) llega hasta tantos meses después del actual
+DISPONIBILIDAD_MESES_ADELANTE = 12
+# El último turno del día se ofrece truncado si quedan al menos estos minutos antes del cierre
+TURNO_PARCIAL_MINIMO_MINUTOS = 30
+# Los servicios con duración propia (por tipo de vehículo) pueden empezar cada tantos minutos
+GRANO_INICIO_MINUTOS = 15
+
+def _minutos_del_dia(hora: str) -> int:
+    horas, minutos = hora.split(":")
+    return int(horas) * 60 + int(minutos)
+
+def minutos_utc(fecha_hora: datetime) -> int:
+    """Minutos desde epoch; los datetime naive (como los devuelve Mongo) se toman como UTC"""
+    if fecha_hora.tzinfo is None:
+        fecha_hora = fecha_hora.replace(tzinfo=timezone.utc)
+    return int(fecha_hora.timestamp()) // 60
+
+def inicio_dia_utc(dia: date) -> datetime:
+    """Medianoche local del lavadero, en UTC"""
+    return datetime(dia.year, dia.month, dia.day, tzinfo=ZONA_HORARIA_LAVADEROS).astimezone(timezone.utc)
+
+def inicios_de_turno(config: dict, duracion: Optional[int] = None) -> np.ndarray:
+    """Minutos desde medianoche de cada inicio posible en el día.
+
+    Sin duracion: la grilla de turnos (mismo criterio que el calendario). Con la
+    duración de un servicio: cada GRANO_INICIO_MINUTOS, si termina antes del cierre.
+    """
+    apertura = _minutos_del_dia(config["horario_apertura"])
+    cierre = _minutos_del_dia(config["horario_cierre"])
+    if duracion is not None:
+        return np.arange(apertura, cierre - duracion + 1, GRANO_INICIO_MINUTOS, dtype=np.int64)
+    duracion = max(1, int(config["duracion_turno"]))
+    inicios = np.arange(apertura, cierre, duracion, dtype=np.int64)
+    return inicios[inicios + min(duracion, TURNO_PARCIAL_MINIMO_MINUTOS) <= cierre]
+
+def servicio_turno(config: dict, tipo_vehiculo: Optional[str] = None):
+    """(duración en minutos, precio) del servicio; sin tipo es el turno de la grilla"""
+    if tipo_vehiculo is None:
+        return int(config["duracion_turno"]), config.get("precio_turno", 0.0)
+    tipo = next((
+        tipo for tipo in config.get("tipos_vehiculo", [])
+        if tipo["tipo"] == tipo_vehiculo and tipo.get("activo", True)
+    ), None)
+    if not tipo:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="El lavadero no ofrece servicio para ese tipo de vehículo"
+        )
+    return int(tipo.get("duracion") or config["duracion_turno"]), tipo["precio"]
+
+def intervalo_turno(config: dict, turno: dict):
+    """[inicio, fin) del turno en minutos UTC desde epoch"""
+    inicio = minutos_utc(turno["fecha_hora"])
+    if turno.get("fin"):
+        return inicio, minutos_utc(turno["fin"])
+    return inicio, inicio + int(config["duracion_turno"])
+
+def calcular_disponibilidad(config: dict, desde: date, hasta: date, feriados, reservados, ahora: datetime,
+                            duracion: Optional[int] = None):
+    """Matriz días x inicios (True = libre), sin loops por turno.
+
+    feriados: fechas no laborales; reservados: (inicio, fin, bay) de los turnos tomados, en
+    minutos UTC. Un inicio está libre si algún bay no tiene turnos que se solapen con
+    [inicio, inicio + duración); duracion None es la grilla de turnos del lavadero.
+    Devuelve (días laborables como datetime64[D], inicios en minutos, matriz bool).
+    """
+    dias = np.arange(np.datetime64(desde, "D"), np.datetime64(hasta, "D") + 1)
+    # 1970-01-01 fue jueves: 1 = lunes ... 7 = domingo
+    dia_semana = (dias.astype(np.int64) + 3) % 7 + 1
+    laborables = np.isin(dia_semana, config["dias_laborables"]) & ~np.isin(
+        dias, np.array(list(feriados), dtype="datetime64[D]")
+    )
+    dias = dias[laborables]
+    inicios = inicios_de_turno(config, duracion)
+    largo = duracion if duracion is not None else max(1, int(config["duracion_turno"]))
+    
+    # Offset UTC de cada día en la zona del lavadero (por si la zona tuviera horario de verano)
+    offsets = np.array([
+        ZONA_HORARIA_LAVADEROS.utcoffset(datetime(dia.year, dia.month, dia.day)) // timedelta(minutes=1)
+        for dia in dias.astype(object)
+    ], dtype=np.int64)
+    # Inicio UTC (minutos desde epoch) de cada turno: matriz [días, turnos]
+    inicio_utc = (dias.astype("datetime64[m]").astype(np.int64) - offsets)[:, None] + inicios[None, :]
+    
+    libres = inicio_utc > minutos_utc(ahora)
+    bays = config.get("bays", 1)
+    reservados = np.array(list(reservados), dtype=np.int64).reshape(-1, 3)
+    reservados = reservados[reservados[:, 2] < bays]
+    if len(reservados):
+        # Los inicios aplanados quedan ordenados: cada reserva tapa un rango contiguo, los
+        # que empiezan en (inicio - largo, fin). Se marca con un array de diferencias por bay.
+        planos = inicio_utc.ravel()
+        primeros = np.searchsorted(planos, reservados[:, 0] - largo, side="right")
+        ultimos = np.searchsorted(planos, reservados[:, 1], side="left")
+        diferencias = np.zeros((bays, planos.size + 1), dtype=np.int64)
+        np.add.at(diferencias, (reservados[:, 2], primeros), 1)
+        np.add.at(diferencias, (reservados[:, 2], ultimos), -1)
+        bays_ocupados = (np.cumsum(diferencias, axis=1)[:, :-1] > 0).sum(axis=0)
+        libres &= (bays_ocupados < bays).reshape(inicio_utc.shape)
+    return dias, inicios, libres
+
+def codificar_disponibilidad(dias: np.ndarray, inicios: np.ndarray, libres: np.ndarray) -> dict:
+    """Encoding compacto: horarios una sola vez y un string de bits ('1' = libre) por día laborable"""
+    filas = (libres.astype(np.uint8) + ord("0")).tobytes().decode()
+    ancho = len(inicios)
+    return {
+        "horarios": [f"{minuto // 60:02d}:{minuto % 60:02d}" for minuto in inicios.tolist()],
+        "dias": {
+            str(dia): filas[i * ancho:(i + 1) * ancho]
+            for i, dia in enumerate(dias.astype("datetime64[D]").astype(str))
+        }
+    }
+
+# ========== BITMAPS DE DISPONIBILIDAD POR DÍA ==========
+# Un documento por lavadero y día: un bit por turno y puesto (bit = bay * slots + turno),
+# 1 = el bay está ocupado en algún momento de ese turno de la grilla (un servicio largo
+# marca todos los turnos que pisa). Se mantienen con $bit en cada reserva/cancelación y se reconstruyen
+# a demanda cuando faltan o cambió la grilla del lavadero.
+
+BITS_POR_PALABRA = 63  # el bit 63 es el de signo en un long de BSON
+
+def _utc(fecha_hora: datetime) -> datetime:
+    return fecha_hora.replace(tzinfo=timezone.utc) if fecha_hora.tzinfo is None else fecha_hora
+
+def firma_grilla(config: dict) -> str:
+    return f"{config['horario_apertura']}-{config['horario_cierre']}-{config['duracion_turno']}-{config.get('bays', 1)}"
+
+def dia_local(fecha_hora: datetime) -> date:
+    return _utc(fecha_hora).astimezone(ZONA_HORARIA_LAVADEROS).date()
+
+def _id_bitmap(lavadero_id: str, dia: date) -> str:
+    return f"{lavadero_id}:{dia.isoformat()}"
+
+def _bits_turno(config: dict, turno: dict):
+    """(día, máscara de los bits que ocupa en su bay, si cubre enteros todos esos turnos de la grilla)"""
+    dia = dia_local(turno["fecha_hora"])
+    bay = turno.get("bay", 0)
+    # Puestos que ya no existen (se redujeron los bays) no tienen bit en la grilla actual
+    if bay >= config.get("bays", 1):
+        return dia, 0, True
+    inicio, fin = intervalo_turno(config, turno)
+    inicios = inicios_de_turno(config) + minutos_utc(inicio_dia_utc(dia))
+    duracion = max(1, int(config["duracion_turno"]))
+    pisados = (inicios < fin) & (inicios + duracion > inicio)
+    enteros = pisados & (inicios >= inicio) & (inicios + duracion <= fin)
+    mascara = 0
+    for columna in np.flatnonzero(pisados).tolist():
+        mascara |= 1 << (bay * len(inicios) + columna)
+    return dia, mascara, bool((pisados == enteros).all())
+
+def _palabras(bits: int, cantidad_bits: int) -> list:
+    mascara = (1 << BITS_POR_PALABRA) - 1
+    return [(bits >> (i * BITS_POR_PALABRA)) & mascara for i in range(math.ceil(cantidad_bits / BITS_POR_PALABRA))]
+
+async def _actualizar_bits(lavadero_id: str, config: dict, turno: dict, ocupado: bool):
+    dia, mascara, exacto = _bits_turno(config, turno)
+    if not mascara:
+        return
+    # También el documento vacío de una construcción en curso (sin grilla): el $inc de
+    # version le avisa que un turno cambió mientras leía
+    filtro = {"_id": _id_bitmap(lavadero_id, dia), "grilla": {"$in": [firma_grilla(config), None]}}
+    if not ocupado and not exacto:
+        # Otro servicio corto puede seguir ocupando parte de ese turno en el bay: reconstruir al leer
+        await db.disponibilidad_dias.delete_one(filtro)
+        return
+    tope = (1 << BITS_POR_PALABRA) - 1
+    operaciones = {
+        f"palabras.{i}": {"or": palabra} if ocupado else {"and": ~palabra & tope}
+        for i, palabra in enumerate(_palabras(mascara, mascara.bit_length())) if palabra
+    }
+    # Sin upsert: si el día todavía no tiene bitmap se construirá completo al leerlo
+    await db.disponibilidad_dias.update_one(filtro, {"$bit": operaciones, "$inc": {"version": 1}})
+
+async def marcar_slot_ocupado(lavadero_id: str, config: dict, turno: dict):
+    await _actualizar_bits(lavadero_id, config, turno, ocupado=True)
+
+async def liberar_slot(lavadero_id: str, config: dict, turno: dict):
+    await _actualizar_bits(lavadero_id, config, turno, ocupado=False)
+
+async def _turnos_activos(lavadero_id: str, desde: date, hasta: date):
+    return await db.turnos.find(
+        {"lavadero_id": lavadero_id, "ocupa_slot": True,
+         "fecha_hora": {"$gte": inicio_dia_utc(desde), "$lt": inicio_dia_utc(hasta + timedelta(days=1))}},
+        {"_id": 0, "fecha_hora": 1, "fin": 1, "bay": 1}
+    ).to_list(None)
+
+BITMAP_CONSTRUCCION_INTENTOS = 3
+
+async def construir_bitmaps(lavadero_id: str, config: dict, dias: list):
+    """Crea los bitmaps de los días indicados a partir de la configuración, feriados y turnos.
+
+    Cada reserva/cancelación incrementa la version del documento del día. Antes de leer
+    los turnos se deja un documento vacío (sin grilla, que esas actualizaciones también
+    tocan) y se anota su version; la escritura final solo aplica si no cambió. Los días
+    que cambiaron se vuelven a leer.
+    """
+    documentos = {}
+    pendientes = sorted(dias)
+    slots = len(inicios_de_turno(config))
+    bays = config.get("bays", 1)
+    cantidad_bits = slots * bays
+    
+    for _ in range(BITMAP_CONSTRUCCION_INTENTOS):
+        if not pendientes:
+            break
+        expires_at = datetime.now(timezone.utc) + timedelta(days=1)
+        ids = {_id_bitmap(lavadero_id, dia): dia for dia in pendientes}
+        await db.disponibilidad_dias.bulk_write([
+            UpdateOne(
+                {"_id": id_bitmap},
+                {"$setOnInsert": {"lavadero_id": lavadero_id, "fecha": dia.isoformat(),
+                                  "version": 0, "expires_at": expires_at}},
+                upsert=True
+            )
+            for id_bitmap, dia in ids.items()
+        ], ordered=False)
+        versiones = {
+            doc["_id"]: doc.get("version")
+            for doc in await db.disponibilidad_dias.find({"_id": {"$in": list(ids)}}, {"version": 1}).to_list(None)
+        }
+        
+        desde, hasta = pendientes[0], pendientes[-1]
+        feriados, turnos = await asyncio.gather(
+            db.dias_no_laborales.find(
+                {"lavadero_id": lavadero_id, "fecha": {"$gte": rango_dia_no_laboral(desde)["$gte"],
+                                                       "$lt": rango_dia_no_laboral(hasta)["$lt"]}},
+                {"_id": 0, "fecha": 1}
+            ).to_list(None),
+            _turnos_activos(lavadero_id, desde, hasta)
+        )
+        feriados = {dia["fecha"].date() for dia in feriados}
+        ocupados = {}
+        for turno in turnos:
+            dia, mascara, _ = _bits_turno(config, turno)
+            ocupados[dia] = ocupados.get(dia, 0) | mascara
+        
+        async def escribir(dia: date) -> bool:
+            laborable = dia.isoweekday() in config["dias_laborables"] and dia not in feriados
+            documento = {
+                "lavadero_id": lavadero_id,
+                "fecha": dia.isoformat(),
+                "grilla": firma_grilla(config),
+                "laborable": laborable,
+                "slots": slots,
+                "bays": bays,
+                "palabras": _palabras(ocupados.get(dia, 0), cantidad_bits) if laborable else [],
+                "expires_at": expires_at
+            }
+            id_bitmap = _id_bitmap(lavadero_id, dia)
+            version = versiones.get(id_bitmap)
+            documentos[dia] = {"_id": id_bitmap, **documento}
+            resultado = await db.disponibilidad_dias.update_one(
+                {"_id": id_bitmap, "version": version if version is not None else {"$exists": False}},
+                {"$set": documento}
+            )
+            return resultado.matched_count == 1
+        
+        escritos = await asyncio.gather(*(escribir(dia) for dia in pendientes))
+        pendientes = [dia for dia, escrito in zip(pendientes, escritos) if not escrito]
+    
+    if pendientes:
+        # Siguen cambiando: se responde con lo leído y el próximo lector los vuelve a construir
+        logger.info(f"Bitmaps de {lavadero_id} sin persistir por cambios concurrentes: {pendientes}")
+    return documentos
+
+def libres_en_bitmap(doc: dict, config: dict, ahora: datetime) -> int:
+    """Popcount de los turnos libres (y todavía no pasados) de un día"""
+    if not doc["laborable"]:
+        return 0
+    dia = date.fromisoformat(doc["fecha"])
+    inicios = inicios_de_turno(config)
+    futuros = inicios + minutos_utc(inicio_dia_utc(dia)) > minutos_utc(ahora)
+    mascara_dia = 0
+    for columna in np.flatnonzero(futuros).tolist():
+        mascara_dia |= 1 << columna
+    mascara = 0
+    for bay in range(doc["bays"]):
+        mascara |= mascara_dia << (bay * doc["slots"])
+    ocupados = sum(palabra << (i * BITS_POR_PALABRA) for i, palabra in enumerate(doc["palabras"]))
+    return (mascara & ~ocupados).bit_count()
+
+# ========== ÍNDICE DE INTERVALOS POR BAY ==========
+# En memoria: intervalos ocupados por bay de cada lavadero-día, para responder
+# "¿entra un servicio de N minutos a esta hora?" con un bisect. En la base: cada turno
+# reclama bloques de BLOQUE_OCUPACION_MINUTOS con _id (lavadero, bay, bloque), así que
+# dos turnos solapados en el mismo bay no pueden confirmarse aunque el índice esté viejo.
+# Los bloques se escriben ya con su vencimiento final; la reconciliación periódica borra
+# los de reclamos que nunca llegaron a turno y reclama los de turnos que no los tienen.
+
+BLOQUE_OCUPACION_MINUTOS = 5
+RESERVA_PENDIENTE_MINUTOS = 5  # un reclamo más viejo que esto sin turno activo quedó huérfano
+OCUPACION_RECONCILIACION_SEGUNDOS = int(os.environ.get("OCUPACION_RECONCILIACION_SEGUNDOS", "300"))
+
+class IndiceIntervalos:
+    """Intervalos [inicio, fin) ocupados de un lavadero-día, ordenados por inicio en cada bay.
+
+    Dentro de un bay no se solapan, así que los fines quedan en el mismo orden que los
+    inicios y alcanza con mirar el vecino anterior y el siguiente: O(log n) por bay.
+    """
+
+    def __init__(self, bays: int):
+        self.inicios = [[] for _ in range(bays)]
+        self.fines = [[] for _ in range(bays)]
+
+    def libre(self, bay: int, inicio: int, fin: int) -> bool:
+        inicios, fines = self.inicios[bay], self.fines[bay]
+        i = bisect.bisect_right(inicios, inicio)
+        return (i == 0 or fines[i - 1] <= inicio) and (i == len(inicios) or inicios[i] >= fin)
+
+    def bay_libre(self, inicio: int, fin: int, descartados=()) -> Optional[int]:
+        return next((
+            bay for bay in range(len(self.inicios))
+            if bay not in descartados and self.libre(bay, inicio, fin)
+        ), None)
+
+    def agregar(self, bay: int, inicio: int, fin: int):
+        i = bisect.bisect_left(self.inicios[bay], inicio)
+        self.inicios[bay].insert(i, inicio)
+        self.fines[bay].insert(i, fin)
+
+    def quitar(self, bay: int, inicio: int, fin: int):
+        i = bisect.bisect_left(self.inicios[bay], inicio)
+        if i < len(self.inicios[bay]) and self.inicios[bay][i] == inicio and self.fines[bay][i] == fin:
+            del self.inicios[bay][i], self.fines[bay][i]
+
+class IndicesIntervalos:
+    """Cache en proceso (TTL + LRU acotado) de IndiceIntervalos por lavadero-día.
+
+    Puede quedar viejo respecto de otros workers: solo se usa para elegir el bay, y la
+    base tiene la última palabra al reclamar los bloques.
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self._indices = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.hits = 0
+        self.construcciones = 0
+
+    @staticmethod
+    def _clave(lavadero_id: str, dia: date, config: dict):
+        return (lavadero_id, dia, firma_grilla(config))
+
+    async def obtener(self, lavadero_id: str, dia: date, config: dict, reconstruir: bool = False):
+        """(índice, recién construido desde la base)"""
+        clave = self._clave(lavadero_id, dia, config)
+        indice = None if reconstruir else self._indices.get(clave)
+        if indice is not None:
+            self.hits += 1
+            return indice, False
+        
+        self.construcciones += 1
+        bays = config.get("bays", 1)
+        indice = IndiceIntervalos(bays)
+        for turno in await _turnos_activos(lavadero_id, dia, dia):
+            if turno.get("bay", 0) < bays:
+                indice.agregar(turno.get("bay", 0), *intervalo_turno(config, turno))
+        self._indices[clave] = indice
+        return indice, True
+
+    def agregar(self, lavadero_id: str, config: dict, turno: dict):
+        indice = self._indices.get(self._clave(lavadero_id, dia_local(turno["fecha_hora"]), config))
+        if indice is not None and turno.get("bay", 0) < len(indice.inicios):
+            indice.agregar(turno.get("bay", 0), *intervalo_turno(config, turno))
+
+    def quitar(self, lavadero_id: str, config: dict, turno: dict):
+        indice = self._indices.get(self._clave(lavadero_id, dia_local(turno["fecha_hora"]), config))
+        if indice is not None and turno.get("bay", 0) < len(indice.inicios):
+            indice.quitar(turno.get("bay", 0), *intervalo_turno(config, turno))
+
+    def stats(self):
+        return {
+            "entradas": len(self._indices),
+            "maxsize": self._indices.maxsize,
+            "ttl_segundos": self._indices.ttl,
+            "hits": self.hits,
+            "construcciones": self.construcciones
+        }
+
+indices_intervalos = IndicesIntervalos(
+    maxsize=int(os.environ.get("INDICES_INTERVALOS_MAXSIZE", "5000")),
+    ttl=float(os.environ.get("INDICES_INTERVALOS_TTL_SEGUNDOS", "60"))
+)
+
+def _bloques(inicio: int, fin: int) -> range:
+    # Redondeo hacia afuera: horarios fuera del múltiplo nunca dejan huecos sin reclamar
+    return range(inicio // BLOQUE_OCUPACION_MINUTOS, -(-fin // BLOQUE_OCUPACION_MINUTOS))
+
+async def reclamar_intervalo(lavadero_id: str, bay: int, inicio: int, fin: int, turno_id: str) -> bool:
+    """Inserta los bloques del intervalo en el bay; False (sin dejar nada) si alguno ya era de otro turno"""
+    reclamado_en = datetime.now(timezone.utc)
+    # Viven hasta un día después del turno: no dependen de un segundo write que confirme
+    expires_at = datetime.fromtimestamp(fin * 60, timezone.utc) + timedelta(days=1)
+    try:
+        await db.ocupacion_bays.insert_many([
+            {"_id": f"{lavadero_id}:{bay}:{bloque}", "turno_id": turno_id,
+             "reclamado_en": reclamado_en, "expires_at": expires_at}
+            for bloque in _bloques(inicio, fin)
+        ], ordered=True)
+    except BulkWriteError:
+        await liberar_intervalo(turno_id)
+        return False
+    return True
+
+async def liberar_intervalo(turno_id: str):
+    await db.ocupacion_bays.delete_many({"turno_id": turno_id})
+
+async def reconciliar_ocupacion():
+    """Alinea ocupacion_bays con los turnos activos de cada lavadero (lecturas por índice)"""
+    ahora = datetime.now(timezone.utc)
+    resultado = {"reclamados": 0, "conflictos": 0, "huerfanos": 0}
+    async for lavadero in db.lavaderos.find({}, {"_id": 0, "id": 1}):
+        lavadero_id = lavadero["id"]
+        # Los bloques vencen un día después del turno: mirar un margen hacia atrás
+        turnos = await db.turnos.find(
+            {"lavadero_id": lavadero_id, "fecha_hora": {"$gte": ahora - timedelta(days=2)},
+             "ocupa_slot": {"$ne": False}, "estado": {"$nin": [EstadoTurno.DISPONIBLE, EstadoTurno.CANCELADO]}},
+            {"_id": 0, "id": 1, "fecha_hora": 1, "fin": 1, "bay": 1}
+        ).to_list(None)
+        activos = {turno["id"] for turno in turnos}
+        con_bloques = set(await db.ocupacion_bays.distinct(
+            "turno_id", {"_id": {"$regex": f"^{re.escape(lavadero_id)}:"}}
+        ))
+        
+        # Reclamos de un worker que cayó antes de insertar el turno (o de turnos ya cancelados)
+        huerfanos = set(await db.ocupacion_bays.distinct("turno_id", {
+            "_id": {"$regex": f"^{re.escape(lavadero_id)}:"},
+            "reclamado_en": {"$lt": ahora - timedelta(minutes=RESERVA_PENDIENTE_MINUTOS)}
+        })) - activos
+        if huerfanos:
+            borrados = await db.ocupacion_bays.delete_many({"turno_id": {"$in": list(huerfanos)}})
+            resultado["huerfanos"] += borrados.deleted_count
+        
+        # Turnos sin bloques: anteriores a ocupacion_bays o que perdieron sus bloques
+        faltantes = [turno for turno in turnos if turno["id"] not in con_bloques]
+        if not faltantes:
+            continue
+        config = await db.configuracion_lavadero.find_one({"lavadero_id": lavadero_id})
+        config = normalizar_configuracion(config or ConfiguracionLavadero(lavadero_id=lavadero_id).dict())
+        for turno in faltantes:
+            inicio, fin = intervalo_turno(config, turno)
+            if await reclamar_intervalo(lavadero_id, turno.get("bay", 0), inicio, fin, turno["id"]):
+                resultado["reclamados"] += 1
+            else:
+                resultado["conflictos"] += 1
+                logger.warning(f"Turno {turno['id']} se solapa con otro turno en su bay: no se pudo reclamar")
+    
+    if any(resultado.values()):
+        logger.info(f"Reconciliación de ocupacion_bays: {resultado}")
+    return resultado
+
+async def tarea_reconciliacion_ocupacion():
+    """La primera pasada (al arrancar) hace el backfill de los turnos sin bloques"""
+    while True:
+        try:
+            await reconciliar_ocupacion()
+        except Exception as e:
+            logger.error(f"Error reconciliando ocupacion_bays: {e}")
+        await asyncio.sleep(OCUPACION_RECONCILIACION_SEGUNDOS)
+
+# ========== RESERVA DE TURNOS ==========
+
+async def contar_turnos_fuera_de_bays(lavadero_id: str, bays: int) -> int:
+    """Turnos activos que todavía no empezaron en puestos >= bays (índice único del slot)"""
+    return await db.turnos.count_documents({
+        "lavadero_id": lavadero_id, "ocupa_slot": True,
+        "fecha_hora": {"$gte": datetime.now(timezone.utc)}, "bay": {"$gte": bays}
+    })
+
+def rango_dia_no_laboral(dia: date) -> dict:
+    # Los días no laborales se guardan a medianoche (UTC) de la fecha
+    inicio = datetime.combine(dia, datetime.min.time())
+    return {"$gte": inicio, "$lt": inicio + timedelta(days=1)}
+
+async def _turno_idempotente(cliente_id: str, idempotency_key: str, lavadero_id: str, fecha_hora: datetime):
+    """Turno ya creado con esta Idempotency-Key (reintento del cliente), o None"""
+    existente = await db.turnos.find_one(
+        {"cliente_id": cliente_id, "idempotency_key": idempotency_key}, {"_id": 0}
+    )
+    if existente and (
+        existente["lavadero_id"] != lavadero_id or minutos_utc(existente["fecha_hora"]) != minutos_utc(fecha_hora)
+    ):
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail="La Idempotency-Key ya fue usada para otra reserva"
+        )
+    return existente
+
+async def reservar_turno(lavadero_id: str, cliente_id: str, fecha_hora: datetime,
+                         idempotency_key: Optional[str] = None, tipo_vehiculo: Optional[str] = None):
+    """Reserva atómica de un servicio. Devuelve (turno, creado); creado=False si es un reintento idempotente.
+
+    Sin tipo_vehiculo ocupa un turno de la grilla; con tipo, la duración de ese servicio
+    desde cualquier inicio cada GRANO_INICIO_MINUTOS. El bay se elige con el índice de
+    intervalos en memoria y se confirma reclamando sus bloques en la base: si otro turno
+    ganó alguno, se descarta ese bay y se prueba con los que quedan.
+    """
+    if fecha_hora.tzinfo is None:
+        fecha_hora = fecha_hora.replace(tzinfo=ZONA_HORARIA_LAVADEROS)
+    fecha_hora = fecha_hora.astimezone(timezone.utc)
+    
+    if idempotency_key:
+        existente = await _turno_idempotente(cliente_id, idempotency_key, lavadero_id, fecha_hora)
+        if existente:
+            return existente, False
+    
+    # Validar el inicio contra los horarios del lavadero (no contra otras reservas)
+    dia = dia_local(fecha_hora)
+    lavadero, config, feriado = await asyncio.gather(
+        db.lavaderos.find_one({"id": lavadero_id}, {"_id": 0, "estado_operativo": 1, "is_active": 1}),
+        db.configuracion_lavadero.find_one({"lavadero_id": lavadero_id}),
+        db.dias_no_laborales.find_one({"lavadero_id": lavadero_id, "fecha": rango_dia_no_laboral(dia)}, {"_id": 1})
+    )
+    if not lavadero:
+        raise HTTPException(status_code=404, detail="Lavadero no encontrado")
+    if lavadero.get("estado_operativo") != EstadoAdmin.ACTIVO or not lavadero.get("is_active", True):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="El lavadero no está operativo"
+        )
+    
+    config = normalizar_configuracion(config or ConfiguracionLavadero(lavadero_id=lavadero_id).dict())
+    duracion, precio = servicio_turno(config, tipo_vehiculo)
+    dias, inicios, libres = calcular_disponibilidad(
+        config, dia, dia, feriados=[dia] if feriado else [], reservados=[], ahora=datetime.now(timezone.utc),
+        duracion=duracion if tipo_vehiculo else None
+    )
+    base = minutos_utc(inicio_dia_utc(dia))
+    inicio = minutos_utc(fecha_hora)
+    columna = np.flatnonzero(inicios == inicio - base)
+    if not len(dias) or not len(columna) or fecha_hora.second or fecha_hora.microsecond:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="El horario no corresponde a un turno del lavadero"
+        )
+    if not libres[0, columna[0]]:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="El horario del turno ya pasó"
+        )
+    # El último turno de la grilla puede terminar truncado en el cierre
+    fin = min(inicio + duracion, base + _minutos_del_dia(config["horario_cierre"]))
+    
+    indice, construido = await indices_intervalos.obtener(lavadero_id, dia, config)
+    turno_dict = None
+    descartados = set()
+    # Cada bay descartado es uno que otra reserva ocupó: a lo sumo bays vueltas
+    for _ in range(config.get("bays", 1)):
+        bay = indice.bay_libre(inicio, fin, descartados)
+        if bay is None and not construido:
+            # El índice puede no ver cancelaciones de otros workers: confirmar con la base
+            indice, construido = await indices_intervalos.obtener(lavadero_id, dia, config, reconstruir=True)
+            bay = indice.bay_libre(inicio, fin, descartados)
+        if bay is None:
+            break
+        
+        turno = Turno(
+            lavadero_id=lavadero_id,
+            cliente_id=cliente_id,
+            fecha_hora=fecha_hora,
+            fin=fecha_hora + timedelta(minutes=fin - inicio),
+            tipo_vehiculo=tipo_vehiculo,
+            bay=bay,
+            estado=EstadoTurno.RESERVADO,
+            precio=precio,
+            idempotency_key=idempotency_key
+        )
+        turno_dict = turno.dict()
+        if not await reclamar_intervalo(lavadero_id, bay, inicio, fin, turno.id):
+            descartados.add(bay)
+            turno_dict = None
+            continue
+        try:
+            await db.turnos.insert_one(dict(turno_dict))
+        except DuplicateKeyError as e:
+            await liberar_intervalo(turno.id)
+            # Si quien ganó fue un reintento concurrente con la misma key, devolver ese turno
+            patron = (e.details or {}).get("keyPattern") or {}
+            if idempotency_key and "bay" not in patron:
+                existente = await _turno_idempotente(cliente_id, idempotency_key, lavadero_id, fecha_hora)
+                if existente:
+                    return existente, False
+            if "idempotency_key" in patron:
+                raise HTTPException(
+                    status_code=status.HTTP_409_CONFLICT,
+                    detail="La Idempotency-Key ya se usó para otro turno"
+                )
+            descartados.add(bay)
+            turno_dict = None
+            continue
+        indices_intervalos.agregar(lavadero_id, config, turno_dict)
+        break
+    if turno_dict is None:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Ese horario ya no tiene puestos libres"
+        )
+    
+    await asyncio.gather(
+        registrar_transicion(clave_contadores_lavadero(lavadero_id), "turnos", nuevo=EstadoTurno.RESERVADO),
+        registrar_transicion(clave_contadores_cliente(cliente_id), "turnos", nuevo=EstadoTurno.RESERVADO),
+        marcar_slot_ocupado(lavadero_id, config, turno_dict)
+    )
+    return turno_dict, True
+
+async def cancelar_turno(turno_id: str, usuario: User):
+    """Cancela un turno activo (su cliente o el admin del lavadero) y libera el slot"""
+    turno = await db.turnos.find_one({"id": turno_id}, {"_id": 0})
+    if not turno:
+        raise HTTPException(status_code=404, detail="Turno no encontrado")
+    if turno.get("cliente_id") != usuario.id:
+        lavadero = await db.lavaderos.find_one({"id": turno["lavadero_id"]}, {"_id": 0, "admin_id": 1})
+        if usuario.rol != UserRole.SUPER_ADMIN and (not lavadero or lavadero["admin_id"] != usuario.id):
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="No tienes permisos para cancelar este turno"
+            )
+    
+    # Condicional: dos cancelaciones concurrentes no descuentan dos veces
+    anterior = await db.turnos.find_one_and_update(
+        {"id": turno_id, "ocupa_slot": True},
+        {"$set": {"estado": EstadoTurno.CANCELADO, "ocupa_slot": False}},
+        projection={"_id": 0},
+        return_document=ReturnDocument.BEFORE
+    )
+    if not anterior:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="El turno ya está cancelado"
+        )
+    
+    config = await db.configuracion_lavadero.find_one({"lavadero_id": anterior["lavadero_id"]})
+    config = normalizar_configuracion(config or ConfiguracionLavadero(lavadero_id=anterior["lavadero_id"]).dict())
+    indices_intervalos.quitar(anterior["lavadero_id"], config, anterior)
+    await asyncio.gather(
+        registrar_transicion(
+            clave_contadores_lavadero(anterior["lavadero_id"]), "turnos",
+            anterior=anterior["estado"], nuevo=EstadoTurno.CANCELADO
+        ),
+        registrar_transicion(
+            clave_contadores_cliente(anterior["cliente_id"]), "turnos",
+            anterior=anterior["estado"], nuevo=EstadoTurno.CANCELADO
+        ),
+        liberar_slot(anterior["lavadero_id"], config, anterior),
+        liberar_intervalo(turno_id)
+    )
+    return {**anterior, "estado": EstadoTurno.CANCELADO, "ocupa_slot": False}
+
 # ========== ENDPOINTS PÚBLICOS ==========
 
+async def incrementar_version_contenido(lavadero_id: str):
+    """Llamar después de escribir: un lector que ve la versión nueva ve también los datos nuevos"""
+    await db.lavaderos.update_one({"id": lavadero_id}, {"$inc": {"version_contenido": 1}})
+
+async def get_version_contenido(lavadero_id: str) -> int:
+    lavadero = await db.lavaderos.find_one({"id": lavadero_id}, {"_id": 0, "version_contenido": 1})
+    if not lavadero:
+        raise HTTPException(status_code=404, detail="Lavadero no encontrado")
+    return lavadero.get("version_contenido", 0)
+
+def etag_coincide(request: Request, etag: str) -> bool:
+    if_none_match = request.headers.get("If-None-Match")
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return etag in (valor.strip().removeprefix("W/") for valor in if_none_match.split(","))
+
+async def responder_con_etag(request: Request, lavadero_id: str, recurso: str, generar) -> Response:
+    """304 sin consultar ni serializar si el cliente ya tiene la versión actual del recurso"""
+    version = await get_version_contenido(lavadero_id)
+    etag = f'"{lavadero_id}-{recurso}-v{version}"'
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if etag_coincide(request, etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    
+    # La versión forma parte de la clave: entre workers no se sirve contenido de otra versión
+    response = await cache_respuestas.responder(f"lavadero:{lavadero_id}:{recurso}:v{version}", generar)
+    response.headers.update(headers)
+    return response
+
+# Tamaños de página del listado público: cualquier otro limit se sube al siguiente
+LIMITES_OPERATIVOS = (20, 50, 100, 200, 500)
+# Solo las primeras páginas van al cache; las demás (y cursores inventados) van directo a la base
+PAGINAS_OPERATIVOS_CACHEADAS = 3
+
+def _pagina_operativos_cacheable(limit: int, cursor: str) -> bool:
+    """Si el cursor es uno de los que publicaron las primeras páginas cacheadas"""
+    siguiente = ""
+    for _ in range(PAGINAS_OPERATIVOS_CACHEADAS):
+        if cursor == siguiente:
+            return True
+        siguiente = cache_respuestas.header(f"operativos:{limit}:{siguiente}", "X-Next-Cursor")
+        if siguiente is None:
+            return False
+    return False
+
 # Obtener lavaderos operativos con información completa (para la página inicial)
+# Paginado por cursor (id del último lavadero); el siguiente cursor viaja en X-Next-Cursor
 @api_router.get("/lavaderos-operativos")
-async def get_lavaderos_operativos():
-    lavaderos_cursor = db.lavaderos.find({
+async def get_lavaderos_operativos(limit: int = 100, cursor: Optional[str] = None, q: Optional[str] = None):
+    limit = next((permitido for permitido in LIMITES_OPERATIVOS if permitido >= limit), LIMITES_OPERATIVOS[-1])
+    if q and q.strip():
+        # Las búsquedas no se cachean: cada texto sería una entrada distinta
+        return await _lavaderos_operativos(limit, cursor, q.strip())
+    if not _pagina_operativos_cacheable(limit, cursor or ""):
+        return await _lavaderos_operativos(limit, cursor)
+    return await cache_respuestas.responder(
+        f"operativos:{limit}:{cursor or ''}", lambda: _lavaderos_operativos(limit, cursor)
+    )
+
+async def _lavaderos_operativos(limit: int, cursor: Optional[str], q: Optional[str] = None):
+    match_filters = {
         "estado_operativo": EstadoAdmin.ACTIVO,
         "is_active": True
-    })
-    lavaderos = await lavaderos_cursor.to_list(1000)
+    }
+    if cursor:
+        match_filters["id"] = {"$gt": cursor}
+    if q:
+        # Mismo criterio que tenía el buscador de la home: contiene, sin distinguir mayúsculas.
+        # El recorrido lo sigue guiando el índice (estado_operativo, is_active, id)
+        match_filters["nombre"] = {"$regex": re.escape(q), "$options": "i"}
+    
+    # Una sola agregación: lavaderos + configuración (solo los campos que usa la tarjeta)
+    pipeline = [
+        {"$match": match_filters},
+        {"$sort": {"id": 1}},
+        {"$limit": limit + 1},
+        {"$lookup": {
+            "from": "configuracion_lavadero",
+            "let": {"lavadero_id": "$id"},
+            "pipeline": [
+                {"$match": {"$expr": {"$eq": ["$lavadero_id", "$$lavadero_id"]}}},
+                {"$limit": 1},
+                {"$project": {"_id": 0, "direccion_completa": 1, "esta_abierto": 1}}
+            ],
+            "as": "config"
+        }},
+        {"$project": {
+            "_id": 0,
+            "id": 1,
+            "nombre": 1,
+            # Dirección actualizada en configuración si existe, sino la original del registro
+            "direccion": {"$let": {
+                "vars": {"direccion_config": {"$ifNull": [{"$arrayElemAt": ["$config.direccion_completa", 0]}, ""]}},
+                "in": {"$cond": [{"$ne": ["$$direccion_config", ""]}, "$$direccion_config", "$direccion"]}
+            }},
+            "descripcion": {"$ifNull": ["$descripcion", None]},
+            "estado_operativo": 1,
+            "estado_apertura": {"$cond": [
+                {"$eq": [{"$arrayElemAt": ["$config.esta_abierto", 0]}, True]}, "Abierto", "Cerrado"
+            ]},
+            "fecha_vencimiento": {"$ifNull": ["$fecha_vencimiento", None]},
+            "created_at": 1
+        }}
+    ]
     
-    # Enriquecer cada lavadero con información de configuración
-    lavaderos_enriquecidos = []
-    for lavadero in lavaderos:
-        # Obtener configuración del lavadero para dirección actualizada
-        config = await db.configuracion_lavadero.find_one({"lavadero_id": lavadero["id"]})
-        
-        # Determinar dirección a mostrar (configuración si existe, sino la original)
-        direccion_actual = lavadero["direccion"]  # Dirección original del registro
-        if config and config.get("direccion_completa"):
-            direccion_actual = config["direccion_completa"]  # Dirección actualizada en configuración
-        
-        # Determinar estado de apertura/cierre
-        estado_apertura = "Cerrado"  # Por defecto cerrado
-        if config and config.get("esta_abierto", False):
-            estado_apertura = "Abierto"
-        
-        # Crear respuesta enriquecida
-        lavadero_enriquecido = {
-            "id": lavadero["id"],
-            "nombre": lavadero["nombre"],
-            "direccion": direccion_actual,  # Dirección actualizada
-            "descripcion": lavadero.get("descripcion"),
-            "estado_operativo": lavadero["estado_operativo"],
-            "estado_apertura": estado_apertura,  # Nuevo campo
-            "fecha_vencimiento": lavadero.get("fecha_vencimiento"),
-            "created_at": lavadero["created_at"]
-        }
-        
-        lavaderos_enriquecidos.append(lavadero_enriquecido)
+    lavaderos = await db.lavaderos.aggregate(pipeline).to_list(limit + 1)
     
-    return lavaderos_enriquecidos
+    headers = {}
+    if len(lavaderos) > limit:
+        lavaderos = lavaderos[:limit]
+        headers["X-Next-Cursor"] = lavaderos[-1]["id"]
+    
+    return JSONResponse(content=jsonable_encoder(lavaderos), headers=headers)
 
 # Obtener información específica de un lavadero
 @api_router.get("/lavaderos/{lavadero_id}")
-async def get_lavadero_by_id(lavadero_id: str):
+async def get_lavadero_publico(lavadero_id: str):
+    return await cache_respuestas.responder(
+        f"lavadero:{lavadero_id}:detalle", lambda: _lavadero_publico(lavadero_id)
+    )
+
+async def _lavadero_publico(lavadero_id: str):
     # Buscar el lavadero por ID
     lavadero = await db.lavaderos.find_one({"id": lavadero_id})
     
@@ -975,7 +3184,7 @@ async def get_lavadero_by_id(lavadero_id: str):
     if config and config.get("esta_abierto", False):
         estado_apertura = "Abierto"
     
-    return {
+    return JSONResponse(content=jsonable_encoder({
         "id": lavadero["id"],
         "nombre": lavadero["nombre"],
         "admin_id": lavadero["admin_id"],
@@ -986,11 +3195,16 @@ async def get_lavadero_by_id(lavadero_id: str):
         "admin_nombre": admin_info["nombre"] if admin_info else "No disponible",
         "admin_email": admin_info["email"] if admin_info else "No disponible",
         "created_at": lavadero["created_at"]
-    }
+    }))
 
 # Obtener configuración completa de un lavadero (horarios, precios, tipos de vehículos)
 @api_router.get("/lavaderos/{lavadero_id}/configuracion")
-async def get_lavadero_configuracion(lavadero_id: str):
+async def get_lavadero_configuracion(lavadero_id: str, request: Request):
+    return await responder_con_etag(
+        request, lavadero_id, "configuracion", lambda: _lavadero_configuracion(lavadero_id)
+    )
+
+async def _lavadero_configuracion(lavadero_id: str):
     # Verificar que el lavadero existe
     lavadero = await db.lavaderos.find_one({"id": lavadero_id})
     if not lavadero:
@@ -1000,102 +3214,47 @@ async def get_lavadero_configuracion(lavadero_id: str):
     config = await db.configuracion_lavadero.find_one({"lavadero_id": lavadero_id})
     
     if not config:
-        # Crear configuración por defecto con tipos de vehículos básicos
-        tipos_vehiculo_default = [
-            {
-                "tipo": "auto",
-                "nombre": "Auto/Sedan",
-                "precio": 2500.0,
-                "activo": True,
-                "icono": "🚗"
-            },
-            {
-                "tipo": "suv",
-                "nombre": "SUV/Pickup",
-                "precio": 3500.0,
-                "activo": True,
-                "icono": "🚙"
-            },
-            {
-                "tipo": "moto",
-                "nombre": "Motocicleta",
-                "precio": 1500.0,
-                "activo": True,
-                "icono": "🏍️"
-            }
-        ]
-        
-        default_config = {
-            "id": str(uuid.uuid4()),
-            "lavadero_id": lavadero_id,
-            "direccion": lavadero.get("direccion", ""),
-            "latitud": -26.8241,  # San Miguel de Tucumán por defecto
-            "longitud": -65.2226,
-            "esta_abierto": False,
-            "horario_apertura": "08:00",
-            "horario_cierre": "20:00",
-            "duracion_turno": 60,  # 60 minutos por turno
-            "tipos_vehiculo": tipos_vehiculo_default,
-            "dias_laborables": [1, 2, 3, 4, 5, 6],  # Lunes a Sábado
-            "alias_bancario": f"lavadero.{lavadero_id[:8]}.mp",
-            "configurado": True,
-            "created_at": datetime.now(timezone.utc)
-        }
-        
-        await db.configuracion_lavadero.insert_one(default_config)
-        config = default_config
+        # Crear configuración por defecto
+        default_config = ConfiguracionLavadero(
+            lavadero_id=lavadero_id,
+            horario_cierre=HORARIO_CIERRE_PUBLICO_POR_DEFECTO,
+            dias_laborables=DIAS_LABORABLES_PUBLICO_POR_DEFECTO,
+            tipos_vehiculo=[
+                TipoVehiculo(tipo=tipo, nombre=nombre, precio=precio, icono=icono)
+                for tipo, nombre, icono, precio in TIPOS_VEHICULO_PUBLICO_POR_DEFECTO
+            ],
+            latitud=-26.8241,  # San Miguel de Tucumán por defecto
+            longitud=-65.2226,
+            direccion_completa=lavadero.get("direccion", ""),
+            alias_bancario=f"lavadero.{lavadero_id[:8]}.mp"
+        )
+        config = default_config.dict()
+        await db.configuracion_lavadero.insert_one(dict(config))
     
-    # Construir tipos de vehículos desde los campos de configuración
-    tipos_vehiculo = []
+    config = normalizar_configuracion(config)
     
-    # Verificar si tiene configuración nueva (array tipos_vehiculo) o antigua (campos separados)
-    if config.get("tipos_vehiculo"):
-        tipos_vehiculo = config["tipos_vehiculo"]
-    else:
-        # Construir desde campos separados (configuración antigua)
-        if config.get("servicio_motos", False):
-            tipos_vehiculo.append({
-                "tipo": "moto",
-                "nombre": "Motocicleta",
-                "precio": config.get("precio_motos", 1500.0),
-                "activo": True,
-                "icono": "🏍️"
-            })
-        
-        if config.get("servicio_autos", False):
-            tipos_vehiculo.append({
-                "tipo": "auto", 
-                "nombre": "Auto/Sedan",
-                "precio": config.get("precio_autos", 2500.0),
-                "activo": True,
-                "icono": "🚗"
-            })
-        
-        if config.get("precio_camionetas"):  # Si existe precio de camionetas, agregarlo
-            tipos_vehiculo.append({
-                "tipo": "camioneta",
-                "nombre": "Camioneta/SUV", 
-                "precio": config.get("precio_camionetas", 3500.0),
-                "activo": True,
-                "icono": "🚙"
-            })
-
-    return {
+    return JSONResponse(content=jsonable_encoder({
         "lavadero_id": config["lavadero_id"],
-        "horario_apertura": config.get("horario_apertura", "08:00"),
-        "horario_cierre": config.get("horario_cierre", "20:00"),
-        "duracion_turno": config.get("duracion_turno", 60),
-        "tipos_vehiculo": tipos_vehiculo,
-        "dias_laborables": config.get("dias_laborables", [1, 2, 3, 4, 5, 6]),
+        "horario_apertura": config["horario_apertura"],
+        "horario_cierre": config["horario_cierre"],
+        "duracion_turno": config["duracion_turno"],
+        "bays": config.get("bays", 1),
+        "tipos_vehiculo": [tipo for tipo in config["tipos_vehiculo"] if tipo.get("activo", True)],
+        "dias_laborables": config["dias_laborables"],
         "esta_abierto": config.get("esta_abierto", False),
         "alias_bancario": config.get("alias_bancario", ""),
-        "direccion": config.get("direccion", ""),
+        "direccion": config.get("direccion_completa") or "",
         "configurado": config.get("configurado", False)
-    }
+    }))
 
 # Obtener días no laborales de un lavadero específico (endpoint público para calendario)
 @api_router.get("/lavaderos/{lavadero_id}/dias-no-laborales")
-async def get_lavadero_dias_no_laborales(lavadero_id: str):
+async def get_lavadero_dias_no_laborales(lavadero_id: str, request: Request):
+    return await responder_con_etag(
+        request, lavadero_id, "dias", lambda: _lavadero_dias_no_laborales(lavadero_id)
+    )
+
+async def _lavadero_dias_no_laborales(lavadero_id: str):
     # Verificar que el lavadero existe
     lavadero = await db.lavaderos.find_one({"id": lavadero_id})
     if not lavadero:
@@ -1113,62 +3272,209 @@ async def get_lavadero_dias_no_laborales(lavadero_id: str):
             del dia_dict['_id']  # Remove MongoDB ObjectId
         result.append(dia_dict)
     
-    return result
+    return JSONResponse(content=jsonable_encoder(result))
+
+# Turnos libres de un lavadero entre dos fechas (inclusive, en hora local del lavadero).
+# Con tipo_vehiculo: inicios posibles (cada GRANO_INICIO_MINUTOS) para la duración de ese servicio
+@api_router.get("/lavaderos/{lavadero_id}/disponibilidad")
+async def get_disponibilidad(lavadero_id: str, desde: Optional[date] = None, hasta: Optional[date] = None,
+                             tipo_vehiculo: Optional[str] = None):
+    hoy = datetime.now(ZONA_HORARIA_LAVADEROS).date()
+    desde = desde or hoy
+    hasta = hasta or desde + timedelta(days=6)
+    if hasta < desde or (hasta - desde).days >= DISPONIBILIDAD_MAX_DIAS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"El rango debe tener entre 1 y {DISPONIBILIDAD_MAX_DIAS} días"
+        )
+    
+    rango_utc = {"$gte": inicio_dia_utc(desde), "$lt": inicio_dia_utc(hasta + timedelta(days=1))}
+    lavadero, config, feriados, reservados = await asyncio.gather(
+        db.lavaderos.find_one({"id": lavadero_id}, {"_id": 1}),
+        db.configuracion_lavadero.find_one({"lavadero_id": lavadero_id}),
+        db.dias_no_laborales.find(
+            {"lavadero_id": lavadero_id, "fecha": {"$gte": datetime.combine(desde, datetime.min.time()),
+                                                   "$lt": datetime.combine(hasta + timedelta(days=1), datetime.min.time())}},
+            {"_id": 0, "fecha": 1}
+        ).to_list(None),
+        # Un único range scan sobre (lavadero_id, fecha_hora)
+        db.turnos.find(
+            {"lavadero_id": lavadero_id, "fecha_hora": rango_utc,
+             "estado": {"$nin": [EstadoTurno.DISPONIBLE, EstadoTurno.CANCELADO]}},
+            {"_id": 0, "fecha_hora": 1, "fin": 1, "bay": 1}
+        ).to_list(None)
+    )
+    if not lavadero:
+        raise HTTPException(status_code=404, detail="Lavadero no encontrado")
+    
+    config = normalizar_configuracion(config or ConfiguracionLavadero(lavadero_id=lavadero_id).dict())
+    duracion, _ = servicio_turno(config, tipo_vehiculo)
+    dias, inicios, libres = calcular_disponibilidad(
+        config, desde, hasta,
+        feriados=[dia["fecha"].date() for dia in feriados],
+        reservados=[(*intervalo_turno(config, turno), turno.get("bay", 0)) for turno in reservados],
+        ahora=datetime.now(timezone.utc),
+        duracion=duracion if tipo_vehiculo else None
+    )
+    
+    return {
+        "lavadero_id": lavadero_id,
+        "desde": desde,
+        "hasta": hasta,
+        "zona_horaria": ZONA_HORARIA_LAVADEROS.key,
+        "duracion_turno": config["duracion_turno"],
+        "tipo_vehiculo": tipo_vehiculo,
+        "duracion": duracion,
+        "bays": config.get("bays", 1),
+        **codificar_disponibilidad(dias, inicios, libres)
+    }
+
+# Reservar un turno (cliente autenticado)
+# Reenviar con el mismo header Idempotency-Key devuelve el turno ya creado en lugar de un 409
+@api_router.post("/lavaderos/{lavadero_id}/turnos", response_model=TurnoResponse, status_code=status.HTTP_201_CREATED)
+async def crear_turno(lavadero_id: str, turno_data: TurnoCreate, request: Request, response: Response):
+    current_user = await get_current_user(request)
+    
+    turno, creado = await reservar_turno(
+        lavadero_id, current_user.id, turno_data.fecha_hora,
+        idempotency_key=request.headers.get("Idempotency-Key"),
+        tipo_vehiculo=turno_data.tipo_vehiculo
+    )
+    if not creado:
+        response.status_code = status.HTTP_200_OK
+        response.headers["Idempotent-Replayed"] = "true"
+    return turno
+
+# Cancelar un turno (cliente dueño, admin del lavadero o super admin)
+@api_router.post("/turnos/{turno_id}/cancelar", response_model=TurnoResponse)
+async def cancelar_turno_endpoint(turno_id: str, request: Request):
+    current_user = await get_current_user(request)
+    return await cancelar_turno(turno_id, current_user)
+
+# Resumen mensual: turnos libres por día laborable (lee a lo sumo 31 bitmaps)
+@api_router.get("/lavaderos/{lavadero_id}/disponibilidad/mes")
+async def get_disponibilidad_mes(lavadero_id: str, mes: Optional[str] = None):
+    hoy = datetime.now(ZONA_HORARIA_LAVADEROS).date()
+    try:
+        primer_dia = datetime.strptime(mes, "%Y-%m").date() if mes else hoy.replace(day=1)
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="El mes debe tener el formato YYYY-MM"
+        )
+    meses_adelante = (primer_dia.year - hoy.year) * 12 + primer_dia.month - hoy.month
+    if meses_adelante > DISPONIBILIDAD_MESES_ADELANTE:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Solo se puede consultar hasta {DISPONIBILIDAD_MESES_ADELANTE} meses hacia adelante"
+        )
+    ultimo_dia = (primer_dia.replace(day=28) + timedelta(days=4)).replace(day=1) - timedelta(days=1)
+    
+    lavadero, config, bitmaps = await asyncio.gather(
+        db.lavaderos.find_one({"id": lavadero_id}, {"_id": 1}),
+        db.configuracion_lavadero.find_one({"lavadero_id": lavadero_id}),
+        db.disponibilidad_dias.find(
+            {"lavadero_id": lavadero_id, "fecha": {"$gte": max(primer_dia, hoy).isoformat(), "$lte": ultimo_dia.isoformat()}}
+        ).to_list(31)
+    )
+    if not lavadero:
+        raise HTTPException(status_code=404, detail="Lavadero no encontrado")
+    
+    config = normalizar_configuracion(config or ConfiguracionLavadero(lavadero_id=lavadero_id).dict())
+    firma = firma_grilla(config)
+    por_dia = {date.fromisoformat(doc["fecha"]): doc for doc in bitmaps if doc.get("grilla") == firma}
+    
+    # Días pasados y días de la semana que no se trabaja no tienen lugar (ni entrada en la
+    # respuesta); los demás que faltan (o con grilla vieja) se construyen una vez
+    dias_mes = [primer_dia + timedelta(days=i) for i in range((ultimo_dia - primer_dia).days + 1)]
+    faltantes = [
+        dia for dia in dias_mes
+        if dia >= hoy and dia.isoweekday() in config["dias_laborables"] and dia not in por_dia
+    ]
+    por_dia.update(await construir_bitmaps(lavadero_id, config, faltantes))
+    
+    ahora = datetime.now(timezone.utc)
+    total = len(inicios_de_turno(config))
+    return {
+        "lavadero_id": lavadero_id,
+        "mes": primer_dia.strftime("%Y-%m"),
+        "zona_horaria": ZONA_HORARIA_LAVADEROS.key,
+        "dias": {
+            dia.isoformat(): {"libres": libres_en_bitmap(doc, config, ahora), "total": total * doc["bays"]}
+            for dia, doc in sorted(por_dia.items())
+            if dia >= hoy and dia.isoweekday() in config["dias_laborables"] and doc["laborable"]
+        }
+    }
 
 # Obtener configuración de Super Admin (alias bancario)
 @api_router.get("/superadmin-config")
 async def get_superadmin_config():
-    config = await db.configuracion_superadmin.find_one({})
-    if not config:
-        # Crear configuración por defecto
-        default_config = ConfiguracionSuperAdmin(
-            alias_bancario="superadmin.alias.mp",
-            precio_mensualidad=10000.0
-        )
-        await db.configuracion_superadmin.insert_one(default_config.dict())
-        config = default_config.dict()
+    return await cache_respuestas.responder("superadmin-config", _superadmin_config_publica)
+
+async def _superadmin_config_publica():
+    config = await configuracion_superadmin.obtener()
     
-    return {
+    return JSONResponse(content={
         "alias_bancario": config.get("alias_bancario"),
         "precio_mensualidad": config.get("precio_mensualidad")
-    }
+    })
 
 # ========== ENDPOINTS SUPER ADMIN ==========
 
 # Ver todos los lavaderos (Super Admin)
 @api_router.get("/superadmin/lavaderos")
-async def get_all_lavaderos(request: Request):
+async def get_all_lavaderos(
+    request: Request,
+    response: Response,
+    estado_operativo: Optional[str] = None,
+    is_active: Optional[bool] = None,
+    q: Optional[str] = None,
+    limit: int = 50,
+    cursor: Optional[str] = None
+):
     await get_super_admin_user(request)
     
-    # Join con usuarios para obtener datos del admin
+    limit = max(1, min(limit, LIMITE_PAGINA_MAXIMO))
+    filtros = []
+    if estado_operativo:
+        filtros.append({"estado_operativo": estado_operativo})
+    if is_active is not None:
+        filtros.append({"is_active": is_active})
+    if q:
+        filtros.append(filtro_prefijo(q, ["nombre"]))
+    if cursor:
+        filtros.append(filtro_keyset(cursor))
+    
+    # Ordenar y recortar sobre índice; join con usuarios solo para la página
     pipeline = [
+        {"$match": {"$and": filtros} if filtros else {}},
+        {"$sort": dict(ORDEN_KEYSET)},
+        {"$limit": limit + 1},
         {
             "$lookup": {
                 "from": "users",
                 "localField": "admin_id",
                 "foreignField": "id",
+                "pipeline": [{"$project": {"_id": 0, "nombre": 1, "email": 1}}],
                 "as": "admin"
             }
         },
-        {"$unwind": "$admin"}
+        {"$unwind": {"path": "$admin", "preserveNullAndEmptyArrays": True}},
+        {"$project": {
+            "_id": 0,
+            "id": 1,
+            "nombre": 1,
+            "direccion": 1,
+            "admin_nombre": {"$ifNull": ["$admin.nombre", "No disponible"]},
+            "admin_email": {"$ifNull": ["$admin.email", "No disponible"]},
+            "estado_operativo": 1,
+            "fecha_vencimiento": {"$ifNull": ["$fecha_vencimiento", None]},
+            "created_at": 1
+        }}
     ]
     
-    lavaderos = await db.lavaderos.aggregate(pipeline).to_list(1000)
-    
-    result = []
-    for lavadero in lavaderos:
-        result.append({
-            "id": lavadero["id"],
-            "nombre": lavadero["nombre"],
-            "direccion": lavadero["direccion"],
-            "admin_nombre": lavadero["admin"]["nombre"],
-            "admin_email": lavadero["admin"]["email"],
-            "estado_operativo": lavadero["estado_operativo"],
-            "fecha_vencimiento": lavadero.get("fecha_vencimiento"),
-            "created_at": lavadero["created_at"]
-        })
-    
-    return result
+    lavaderos = await db.lavaderos.aggregate(pipeline).to_list(limit + 1)
+    return paginar(response, lavaderos, limit)
 
 # Obtener comprobantes pendientes (Super Admin)
 @api_router.get("/superadmin/comprobantes-pendientes")
@@ -1224,16 +3530,20 @@ async def get_comprobantes_pendientes(request: Request):
     return result
 
 # Obtener historial completo de comprobantes (Super Admin) - NUEVA FUNCIONALIDAD
+# Con cursor usa paginación keyset (created_at, id); sin cursor mantiene offset
 @api_router.get("/superadmin/comprobantes-historial")
 async def get_comprobantes_historial(
     request: Request,
     estado: Optional[str] = None,
     admin_id: Optional[str] = None,
     limit: int = 50,
-    offset: int = 0
+    offset: int = 0,
+    cursor: Optional[str] = None
 ):
     await get_super_admin_user(request)
     
+    limit = max(1, min(limit, 200))
+    
     # Construir filtros
     match_filters = {}
     if estado and estado in [EstadoPago.PENDIENTE, EstadoPago.CONFIRMADO, EstadoPago.RECHAZADO]:
@@ -1241,36 +3551,44 @@ async def get_comprobantes_historial(
     if admin_id:
         match_filters["admin_id"] = admin_id
     
-    # Pipeline para obtener historial completo con información detallada
+    # Posicionamiento de la página sobre el índice: keyset si hay cursor, offset si no.
+    # Se pide una fila de más para saber si hay página siguiente.
+    filtro_pagina = {"$and": [match_filters, filtro_keyset(cursor)]} if cursor else match_filters
     pipeline = [
-        {"$match": match_filters} if match_filters else {"$match": {}},
+        {"$match": filtro_pagina},
+        {"$sort": {"created_at": -1, "id": -1}},
+        *([{"$skip": offset}] if offset and not cursor else []),
+        {"$limit": limit + 1},
+        # Los joins se hacen solo sobre la página ya recortada
         {"$lookup": {
             "from": "pagos_mensualidad",
             "localField": "pago_mensualidad_id",
             "foreignField": "id",
+            "pipeline": [{"$project": {"_id": 0, "monto": 1, "mes_año": 1, "lavadero_id": 1}}],
             "as": "pago_info"
         }},
-        {"$unwind": "$pago_info"},
+        {"$unwind": {"path": "$pago_info", "preserveNullAndEmptyArrays": True}},
         {"$lookup": {
             "from": "users",
-            "localField": "admin_id", 
+            "localField": "admin_id",
             "foreignField": "id",
+            "pipeline": [{"$project": {"_id": 0, "nombre": 1, "email": 1}}],
             "as": "admin_info"
         }},
-        {"$unwind": "$admin_info"},
+        {"$unwind": {"path": "$admin_info", "preserveNullAndEmptyArrays": True}},
         {"$lookup": {
             "from": "lavaderos",
             "localField": "pago_info.lavadero_id",
-            "foreignField": "id", 
+            "foreignField": "id",
+            "pipeline": [{"$project": {"_id": 0, "nombre": 1}}],
             "as": "lavadero_info"
         }},
-        {"$unwind": "$lavadero_info"},
+        {"$unwind": {"path": "$lavadero_info", "preserveNullAndEmptyArrays": True}},
         {"$project": {
-            "_id": 0,  # Exclude MongoDB ObjectId
             "comprobante_id": "$id",
             "admin_id": "$admin_id",
             "admin_nombre": "$admin_info.nombre",
-            "admin_email": "$admin_info.email", 
+            "admin_email": "$admin_info.email",
             "lavadero_nombre": "$lavadero_info.nombre",
             "monto": "$pago_info.monto",
             "mes_año": "$pago_info.mes_año",
@@ -1278,60 +3596,42 @@ async def get_comprobantes_historial(
             "created_at": 1,
             "estado": 1,
             "comentario_superadmin": 1,
+            "_id": 0,
             "fecha_procesamiento": {"$ifNull": ["$fecha_procesamiento", None]}
-        }},
-        {"$sort": {"created_at": -1}},
-        {"$skip": offset},
-        {"$limit": limit}
+        }}
     ]
     
-    # Ejecutar query principal
-    comprobantes_cursor = db.comprobantes_pago_mensualidad.aggregate(pipeline)
-    comprobantes = await comprobantes_cursor.to_list(limit)
+    comprobantes, total = await asyncio.gather(
+        db.comprobantes_pago_mensualidad.aggregate(pipeline).to_list(limit + 1),
+        db.comprobantes_pago_mensualidad.count_documents(match_filters)
+    )
+    
+    next_cursor = None
+    if len(comprobantes) > limit:
+        comprobantes = comprobantes[:limit]
+        next_cursor = codificar_cursor(comprobantes[-1]["created_at"], comprobantes[-1]["comprobante_id"])
     
-    # Contar total de registros para paginación
-    count_pipeline = [
-        {"$match": match_filters} if match_filters else {"$match": {}},
-        {"$count": "total"}
-    ]
-    count_cursor = db.comprobantes_pago_mensualidad.aggregate(count_pipeline)
-    count_result = await count_cursor.to_list(1)
-    total = count_result[0]["total"] if count_result else 0
-    
-    # Obtener estadísticas de resumen
-    stats_pipeline = [
-        {"$group": {
-            "_id": "$estado",
-            "count": {"$sum": 1}
-        }}
-    ]
-    stats_cursor = db.comprobantes_pago_mensualidad.aggregate(stats_pipeline)
-    stats_raw = await stats_cursor.to_list(10)
+    # Obtener estadísticas de resumen (desde los contadores globales)
+    stats_raw = await leer_contadores(CONTADORES_GLOBAL, "comprobantes_pago_mensualidad")
     
     stats = {
         "total": total,
-        "pendientes": 0,
-        "aprobados": 0,
-        "rechazados": 0
+        "pendientes": stats_raw.get(EstadoPago.PENDIENTE, 0),
+        "aprobados": stats_raw.get(EstadoPago.CONFIRMADO, 0),
+        "rechazados": stats_raw.get(EstadoPago.RECHAZADO, 0)
     }
     
-    for stat in stats_raw:
-        if stat["_id"] == EstadoPago.PENDIENTE:
-            stats["pendientes"] = stat["count"]
-        elif stat["_id"] == EstadoPago.CONFIRMADO:
-            stats["aprobados"] = stat["count"]
-        elif stat["_id"] == EstadoPago.RECHAZADO:
-            stats["rechazados"] = stat["count"]
-    
     return {
         "comprobantes": comprobantes,
         "total": total,
         "stats": stats,
+        "next_cursor": next_cursor,
         "filters": {
             "estado": estado,
             "admin_id": admin_id,
             "limit": limit,
-            "offset": offset
+            "offset": offset,
+            "cursor": cursor
         }
     }
 
@@ -1413,6 +3713,7 @@ async def upload_comprobante_mensualidad(
         
         comprobante_dict = nuevo_comprobante.dict()
         await db.comprobantes_pago_mensualidad.insert_one(comprobante_dict)
+        await registrar_transicion(CONTADORES_GLOBAL, "comprobantes_pago_mensualidad", nuevo=nuevo_comprobante.estado)
         
         return {
             "message": "Comprobante subido exitosamente",
@@ -1432,14 +3733,10 @@ async def upload_comprobante_mensualidad(
 
 # Obtener comprobantes del admin (Admin)
 @api_router.get("/admin/mis-comprobantes")
-async def get_mis_comprobantes(request: Request):
-    current_user = await get_current_user(request)
-    
-    if current_user.rol != UserRole.ADMIN:
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="Solo los administradores pueden ver sus comprobantes"
-        )
+async def get_mis_comprobantes(
+    ctx: AdminContext = Depends(admin_context("Solo los administradores pueden ver sus comprobantes", cargar_lavadero=False))
+):
+    current_user = ctx.user
     
     # Pipeline para obtener comprobantes con información del pago
     pipeline = [
@@ -1475,14 +3772,10 @@ async def get_mis_comprobantes(request: Request):
 
 # Obtener pago pendiente del admin (Admin)
 @api_router.get("/admin/pago-pendiente")
-async def get_pago_pendiente(request: Request):
-    current_user = await get_current_user(request)
-    
-    if current_user.rol != UserRole.ADMIN:
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="Solo los administradores pueden ver sus pagos"
-        )
+async def get_pago_pendiente(
+    ctx: AdminContext = Depends(admin_context("Solo los administradores pueden ver sus pagos", cargar_lavadero=False))
+):
+    current_user = ctx.user
     
     # Buscar pago pendiente
     pago_pendiente = await db.pagos_mensualidad.find_one({
@@ -1494,10 +3787,8 @@ async def get_pago_pendiente(request: Request):
         return {"tiene_pago_pendiente": False}
     
     # Obtener configuración del Super Admin para el alias bancario
-    config_superadmin = await db.configuracion_superadmin.find_one({})
-    alias_bancario = "No configurado"
-    if config_superadmin:
-        alias_bancario = config_superadmin.get("alias_bancario", "No configurado")
+    config_superadmin = await configuracion_superadmin.obtener()
+    alias_bancario = config_superadmin.get("alias_bancario", "No configurado")
     
     # Verificar si ya tiene comprobante
     comprobante = await db.comprobantes_pago_mensualidad.find_one({
@@ -1529,16 +3820,26 @@ async def aprobar_comprobante(comprobante_id: str, request: Request):
             detail="Comprobante no encontrado"
         )
     
-    # Actualizar comprobante
-    await db.comprobantes_pago_mensualidad.update_one(
-        {"id": comprobante_id},
+    # Actualizar comprobante, solo si nadie lo revisó mientras tanto
+    if not await db.comprobantes_pago_mensualidad.find_one_and_update(
+        {"id": comprobante_id, "estado": comprobante_doc.get("estado")},
         {
             "$set": {
                 "estado": EstadoPago.CONFIRMADO,
                 "fecha_revision": datetime.now(timezone.utc),
                 "comentario_superadmin": "Pago confirmado"
             }
-        }
+        },
+        projection={"estado": 1},
+        return_document=ReturnDocument.BEFORE
+    ):
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="El comprobante cambió de estado mientras se revisaba"
+        )
+    await registrar_transicion(
+        CONTADORES_GLOBAL, "comprobantes_pago_mensualidad",
+        anterior=comprobante_doc.get("estado"), nuevo=EstadoPago.CONFIRMADO
     )
     
     # Actualizar pago mensualidad
@@ -1551,15 +3852,23 @@ async def aprobar_comprobante(comprobante_id: str, request: Request):
     pago_doc = await db.pagos_mensualidad.find_one({"id": comprobante_doc["pago_mensualidad_id"]})
     if pago_doc:
         fecha_vencimiento = datetime.now(timezone.utc) + timedelta(days=30)
-        await db.lavaderos.update_one(
+        lavadero_anterior = await db.lavaderos.find_one_and_update(
             {"id": pago_doc["lavadero_id"]},
             {
                 "$set": {
                     "estado_operativo": EstadoAdmin.ACTIVO,
                     "fecha_vencimiento": fecha_vencimiento
                 }
-            }
+            },
+            projection={"estado_operativo": 1},
+            return_document=ReturnDocument.BEFORE
         )
+        if lavadero_anterior:
+            await registrar_transicion(
+                CONTADORES_GLOBAL, "lavaderos",
+                anterior=lavadero_anterior.get("estado_operativo"), nuevo=EstadoAdmin.ACTIVO
+            )
+        cache_respuestas.invalidar_lavadero(pago_doc["lavadero_id"])
     
     return {"message": "Comprobante aprobado y lavadero activado"}
 
@@ -1576,16 +3885,26 @@ async def rechazar_comprobante(comprobante_id: str, rechazo_data: RechazarCompro
             detail="Comprobante no encontrado"
         )
     
-    # Actualizar comprobante
-    await db.comprobantes_pago_mensualidad.update_one(
-        {"id": comprobante_id},
+    # Actualizar comprobante, solo si nadie lo revisó mientras tanto
+    if not await db.comprobantes_pago_mensualidad.find_one_and_update(
+        {"id": comprobante_id, "estado": comprobante_doc.get("estado")},
         {
             "$set": {
                 "estado": EstadoPago.RECHAZADO,
                 "fecha_revision": datetime.now(timezone.utc),
                 "comentario_superadmin": rechazo_data.comentario
             }
-        }
+        },
+        projection={"estado": 1},
+        return_document=ReturnDocument.BEFORE
+    ):
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="El comprobante cambió de estado mientras se revisaba"
+        )
+    await registrar_transicion(
+        CONTADORES_GLOBAL, "comprobantes_pago_mensualidad",
+        anterior=comprobante_doc.get("estado"), nuevo=EstadoPago.RECHAZADO
     )
     
     return {"message": "Comprobante rechazado"}
@@ -1594,24 +3913,76 @@ async def rechazar_comprobante(comprobante_id: str, rechazo_data: RechazarCompro
 
 # Ver todos los admins (Super Admin)
 @api_router.get("/superadmin/admins") 
-async def get_all_admins(request: Request):
+async def get_all_admins(
+    request: Request,
+    response: Response,
+    estado_operativo: Optional[str] = None,
+    is_active: Optional[bool] = None,
+    q: Optional[str] = None,
+    limit: int = 50,
+    cursor: Optional[str] = None
+):
     await get_super_admin_user(request)
     
-    # Pipeline para obtener admins con información de sus lavaderos
-    pipeline = [
-        {"$match": {"rol": UserRole.ADMIN}},
-        {
-            "$lookup": {
-                "from": "lavaderos",
-                "localField": "id",
-                "foreignField": "admin_id",
-                "as": "lavadero"
+    limit = max(1, min(limit, LIMITE_PAGINA_MAXIMO))
+    filtros = [{"rol": UserRole.ADMIN}]
+    if is_active is not None:
+        filtros.append({"is_active": is_active})
+    if q:
+        filtros.append(filtro_prefijo(q, ["email", "nombre"]))
+    proyeccion_admin = {"_id": 0, "id": 1, "nombre": 1, "email": 1, "created_at": 1,
+                        "is_active": 1, "google_id": 1,
+                        "has_password": {"$ne": [{"$ifNull": ["$password_hash", None]}, None]}}
+    proyeccion_lavadero = {"_id": 0, "id": 1, "nombre": 1, "estado_operativo": 1, "fecha_vencimiento": 1}
+    
+    if estado_operativo:
+        # El estado operativo vive en el lavadero: se pagina lavaderos por su índice
+        # (estado_operativo, created_at, id) y se trae el admin de cada uno. El cursor
+        # es el del lavadero.
+        filtros_lavadero = [{"estado_operativo": estado_operativo}]
+        if cursor:
+            filtros_lavadero.append(filtro_keyset(cursor))
+        pipeline = [
+            {"$match": {"$and": filtros_lavadero}},
+            {"$sort": dict(ORDEN_KEYSET)},
+            {
+                "$lookup": {
+                    "from": "users",
+                    "localField": "admin_id",
+                    "foreignField": "id",
+                    "pipeline": [{"$match": {"$and": filtros}}, {"$project": proyeccion_admin}],
+                    "as": "admin"
+                }
+            },
+            {"$unwind": "$admin"},
+            {"$limit": limit + 1},
+            {"$project": {**proyeccion_lavadero, "created_at": 1, "admin": 1}}
+        ]
+        lavaderos = paginar(response, await db.lavaderos.aggregate(pipeline).to_list(limit + 1), limit)
+        admins = [
+            {**lavadero.pop("admin"), "lavadero": [{k: v for k, v in lavadero.items() if k != "created_at"}]}
+            for lavadero in lavaderos
+        ]
+    else:
+        if cursor:
+            filtros.append(filtro_keyset(cursor))
+        # Pipeline para obtener admins con información de sus lavaderos
+        pipeline = [
+            {"$match": {"$and": filtros}},
+            {"$sort": dict(ORDEN_KEYSET)},
+            {"$limit": limit + 1},
+            {"$project": proyeccion_admin},
+            {
+                "$lookup": {
+                    "from": "lavaderos",
+                    "localField": "id",
+                    "foreignField": "admin_id",
+                    "pipeline": [{"$project": proyeccion_lavadero}],
+                    "as": "lavadero"
+                }
             }
-        },
-        {"$sort": {"created_at": -1}}
-    ]
-    
-    admins = await db.users.aggregate(pipeline).to_list(1000)
+        ]
+        admins = paginar(response, await db.users.aggregate(pipeline).to_list(limit + 1), limit)
     
     result = []
     for admin in admins:
@@ -1620,7 +3991,7 @@ async def get_all_admins(request: Request):
             "admin_id": admin["id"],
             "nombre": admin["nombre"],
             "email": admin["email"],
-            "password_hash": admin.get("password_hash", "N/A"),
+            "has_password": admin["has_password"],
             "created_at": admin["created_at"],
             "is_active": admin["is_active"],
             "google_id": admin.get("google_id"),
@@ -1667,7 +4038,7 @@ async def update_admin(admin_id: str, update_data: AdminUpdateRequest, request:
             )
         update_fields["email"] = update_data.email
     if update_data.password is not None:
-        update_fields["password_hash"] = get_password_hash(update_data.password)
+        update_fields["password_hash"] = await get_password_hash_async(update_data.password)
     if update_data.is_active is not None:
         update_fields["is_active"] = update_data.is_active
     
@@ -1682,6 +4053,8 @@ async def update_admin(admin_id: str, update_data: AdminUpdateRequest, request:
         {"id": admin_id},
         {"$set": update_fields}
     )
+    principal_cache.invalidar_usuario(admin_id)
+    await lista_revocacion.revocar_usuario(admin_id)
     
     return {"message": "Admin actualizado correctamente"}
 
@@ -1701,6 +4074,26 @@ async def delete_admin(admin_id: str, request: Request):
     # Buscar y eliminar lavadero asociado
     lavadero_doc = await db.lavaderos.find_one({"admin_id": admin_id})
     if lavadero_doc:
+        # Descontar de los contadores globales lo que se va a eliminar
+        comprobantes_por_estado = await contar_por_estado(db.comprobantes_pago_mensualidad, {"admin_id": admin_id})
+        incrementos = {
+            f"comprobantes_pago_mensualidad.{estado}": -cantidad
+            for estado, cantidad in comprobantes_por_estado.items()
+        }
+        incrementos[f"lavaderos.{lavadero_doc.get('estado_operativo', EstadoAdmin.PENDIENTE_APROBACION)}"] = -1
+        await ajustar_contadores(CONTADORES_GLOBAL, incrementos)
+        await db.contadores.delete_one({"_id": clave_contadores_lavadero(lavadero_doc["id"])})
+        # Y de cada cliente, los turnos que tenía en este lavadero
+        turnos_por_cliente = await _contar_por_clave_y_estado(
+            db.turnos, "cliente_id", {"lavadero_id": lavadero_doc["id"]}
+        )
+        await asyncio.gather(*(
+            ajustar_contadores(clave_contadores_cliente(cliente_id), {
+                f"turnos.{estado}": -cantidad for estado, cantidad in turnos.items()
+            })
+            for cliente_id, turnos in turnos_por_cliente.items()
+        ))
+        
         # Eliminar datos relacionados del lavadero
         await db.lavaderos.delete_one({"admin_id": admin_id})
         await db.pagos_mensualidad.delete_many({"admin_id": admin_id})
@@ -1708,9 +4101,12 @@ async def delete_admin(admin_id: str, request: Request):
         await db.configuracion_lavadero.delete_many({"lavadero_id": lavadero_doc["id"]})
         await db.turnos.delete_many({"lavadero_id": lavadero_doc["id"]})
         await db.dias_no_laborales.delete_many({"lavadero_id": lavadero_doc["id"]})
+        cache_respuestas.invalidar_lavadero(lavadero_doc["id"])
     
     # Eliminar admin
     await db.users.delete_one({"id": admin_id})
+    principal_cache.invalidar_usuario(admin_id)
+    await lista_revocacion.revocar_usuario(admin_id)
     
     return {"message": "Admin y todos sus datos asociados eliminados correctamente"}
 
@@ -1760,7 +4156,7 @@ async def crear_admin_superadmin(admin_data: AdminLavaderoRegister, request: Req
         )
     
     # Create admin user
-    password_hash = get_password_hash(admin_data.password)
+    password_hash = await get_password_hash_async(admin_data.password)
     new_admin = User(
         email=admin_data.email,
         nombre=admin_data.nombre,
@@ -1791,18 +4187,11 @@ async def crear_admin_superadmin(admin_data: AdminLavaderoRegister, request: Req
     # Insert lavadero to database
     lavadero_dict = new_lavadero.dict()
     await db.lavaderos.insert_one(lavadero_dict)
+    await registrar_transicion(CONTADORES_GLOBAL, "lavaderos", nuevo=new_lavadero.estado_operativo)
     
     # Crear pago mensualidad pendiente (igual que en registro normal)
     # Obtener configuración super admin
-    config_super = await db.configuracion_superadmin.find_one({})
-    if not config_super:
-        # Crear configuración por defecto si no existe
-        default_config = ConfiguracionSuperAdmin(
-            alias_bancario="superadmin.alias.mp",
-            precio_mensualidad=10000.0
-        )
-        await db.configuracion_superadmin.insert_one(default_config.dict())
-        config_super = default_config.dict()
+    config_super = await configuracion_superadmin.obtener()
     
     # Crear pago mensualidad
     from datetime import timedelta
@@ -1864,7 +4253,7 @@ async def toggle_lavadero_estado(admin_id: str, request: Request):
         message = "Lavadero desactivado - admin debe subir nuevo comprobante para reactivación"
         
         # Crear nuevo pago PENDIENTE para que el admin pueda subir comprobante
-        config_super = await db.configuracion_superadmin.find_one({})
+        config_super = await configuracion_superadmin.obtener()
         if config_super:
             # Verificar si ya existe un pago PENDIENTE para este admin en este mes
             mes_actual = datetime.now().strftime("%Y-%m")
@@ -1901,7 +4290,7 @@ async def toggle_lavadero_estado(admin_id: str, request: Request):
         message = "Lavadero activado exitosamente (sin proceso de pago)"
         
         # Crear pago mensualidad como confirmado (simulado) solo al activar
-        config_super = await db.configuracion_superadmin.find_one({})
+        config_super = await configuracion_superadmin.obtener()
         if config_super:
             # Verificar si ya existe un pago para este mes
             mes_actual = datetime.now().strftime("%Y-%m")
@@ -1921,8 +4310,19 @@ async def toggle_lavadero_estado(admin_id: str, request: Request):
                 )
                 await db.pagos_mensualidad.insert_one(pago_mensualidad.dict())
     
-    # Actualizar lavadero
-    await db.lavaderos.update_one({"admin_id": admin_id}, update_data)
+    # Actualizar lavadero; la transición se cuenta desde el estado que realmente tenía
+    lavadero_anterior = await db.lavaderos.find_one_and_update(
+        {"admin_id": admin_id},
+        update_data,
+        projection={"estado_operativo": 1},
+        return_document=ReturnDocument.BEFORE
+    )
+    if lavadero_anterior:
+        await registrar_transicion(
+            CONTADORES_GLOBAL, "lavaderos",
+            anterior=lavadero_anterior.get("estado_operativo"), nuevo=nuevo_estado
+        )
+    cache_respuestas.invalidar_lavadero(lavadero_doc["id"])
     
     response_data = {
         "message": message,
@@ -1939,88 +4339,73 @@ async def toggle_lavadero_estado(admin_id: str, request: Request):
 
 # Obtener configuración del lavadero (Admin)
 @api_router.get("/admin/configuracion")
-async def get_configuracion_lavadero(request: Request):
-    current_user = await get_current_user(request)
-    
-    if current_user.rol != UserRole.ADMIN:
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="Solo los administradores pueden acceder a esta configuración"
-        )
-    
-    # Buscar lavadero del admin
-    lavadero_doc = await db.lavaderos.find_one({"admin_id": current_user.id})
-    if not lavadero_doc:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Lavadero no encontrado"
-        )
+async def get_configuracion_lavadero(
+    ctx: AdminContext = Depends(admin_context("Solo los administradores pueden acceder a esta configuración"))
+):
+    lavadero_doc = ctx.lavadero
     
-    # Buscar configuración existente
-    config_doc = await db.configuracion_lavadero.find_one({"lavadero_id": lavadero_doc["id"]})
+    # Configuración existente (ya resuelta en el contexto)
+    config_doc = ctx.config
     
     if not config_doc:
         # Crear configuración por defecto si no existe, usando dirección del registro
         default_config = ConfiguracionLavadero(
             lavadero_id=lavadero_doc["id"],
-            hora_apertura="08:00",
-            hora_cierre="18:00",
-            duracion_turno_minutos=60,
-            dias_laborales=[1, 2, 3, 4, 5],  # Lunes a Viernes
-            alias_bancario="lavadero.alias.mp",
-            precio_turno=5000.0,
-            # Valores por defecto para nuevos campos
-            servicio_motos=True,
-            servicio_autos=True,
-            servicio_camionetas=True,
-            precio_motos=3000.0,
-            precio_autos=5000.0,
-            precio_camionetas=8000.0,
             latitud=-26.8241,  # Coordenadas de San Miguel de Tucumán
             longitud=-65.2226,
             direccion_completa=lavadero_doc.get("direccion", ""),  # 🔧 USAR DIRECCIÓN DEL REGISTRO
-            esta_abierto=False
         )
-        config_dict = default_config.dict()
-        await db.configuracion_lavadero.insert_one(config_dict)
-        config_response = default_config.dict()
-        config_response['nombre_lavadero'] = lavadero_doc.get("nombre", "")
-        return config_response
-    
-    # Remove MongoDB ObjectId from the document
-    config_dict = dict(config_doc)
-    if '_id' in config_dict:
-        del config_dict['_id']
+        config_doc = default_config.dict()
+        await db.configuracion_lavadero.insert_one(dict(config_doc))
     
-    # Agregar nombre del lavadero desde el documento del lavadero
-    config_dict['nombre_lavadero'] = lavadero_doc.get("nombre", "")
-    
-    return config_dict
+    return configuracion_vista_admin(normalizar_configuracion(config_doc), lavadero_doc)
 
 # Actualizar configuración del lavadero (Admin)
 @api_router.put("/admin/configuracion")
-async def update_configuracion_lavadero(config_data: ConfiguracionLavaderoCreate, request: Request):
-    current_user = await get_current_user(request)
+async def update_configuracion_lavadero(
+    config_data: ConfiguracionLavaderoCreate,
+    ctx: AdminContext = Depends(admin_context("Solo los administradores pueden modificar la configuración"))
+):
+    lavadero_doc = ctx.lavadero
     
-    if current_user.rol != UserRole.ADMIN:
+    # Validaciones básicas: horarios y duraciones sobre la grilla de bloques de ocupación
+    if not (
+        0 < config_data.duracion_turno_minutos <= 480  # Max 8 horas
+        and config_data.duracion_turno_minutos % BLOQUE_OCUPACION_MINUTOS == 0
+    ):
         raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="Solo los administradores pueden modificar la configuración"
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"La duración del turno debe estar entre {BLOQUE_OCUPACION_MINUTOS} y 480 minutos, en múltiplos de {BLOQUE_OCUPACION_MINUTOS}"
         )
     
-    # Buscar lavadero del admin
-    lavadero_doc = await db.lavaderos.find_one({"admin_id": current_user.id})
-    if not lavadero_doc:
+    try:
+        apertura = _minutos_del_dia(config_data.hora_apertura)
+        cierre = _minutos_del_dia(config_data.hora_cierre)
+    except ValueError:
         raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Lavadero no encontrado"
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Los horarios deben tener el formato HH:MM"
+        )
+    if apertura >= cierre or apertura % BLOQUE_OCUPACION_MINUTOS or cierre % BLOQUE_OCUPACION_MINUTOS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"La apertura debe ser anterior al cierre y ambos horarios múltiplos de {BLOQUE_OCUPACION_MINUTOS} minutos"
+        )
+    
+    if not (1 <= config_data.bays <= BAYS_MAXIMO):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"La cantidad de puestos de lavado debe estar entre 1 y {BAYS_MAXIMO}"
         )
     
-    # Validaciones básicas
-    if not (0 <= config_data.duracion_turno_minutos <= 480):  # Max 8 horas
+    duraciones = [config_data.duracion_motos, config_data.duracion_autos, config_data.duracion_camionetas]
+    if not all(
+        duracion is None or (0 < duracion <= 480 and duracion % BLOQUE_OCUPACION_MINUTOS == 0)
+        for duracion in duraciones
+    ):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
-            detail="La duración del turno debe estar entre 1 y 480 minutos"
+            detail=f"La duración de cada servicio debe estar entre {BLOQUE_OCUPACION_MINUTOS} y 480 minutos, en múltiplos de {BLOQUE_OCUPACION_MINUTOS}"
         )
     
     if not all(1 <= dia <= 7 for dia in config_data.dias_laborales):
@@ -2029,39 +4414,59 @@ async def update_configuracion_lavadero(config_data: ConfiguracionLavaderoCreate
             detail="Los días laborales deben estar entre 1 (Lunes) y 7 (Domingo)"
         )
     
-    # Actualizar configuración (sincronizar nombres de campos con endpoint público)
+    # Achicar bays no puede dejar turnos futuros en puestos que dejan de existir
+    turnos_desplazados = await contar_turnos_fuera_de_bays(lavadero_doc["id"], config_data.bays)
+    if turnos_desplazados:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"Hay {turnos_desplazados} turnos futuros en los puestos que se quieren quitar: cancélalos antes de reducir los puestos"
+        )
+    
+    # Actualizar configuración (solo esquema canónico)
     update_data = {
         "$set": {
-            # Campos públicos (usados por el calendario de reservas)
             "horario_apertura": config_data.hora_apertura,
             "horario_cierre": config_data.hora_cierre,
             "duracion_turno": config_data.duracion_turno_minutos,
+            "bays": config_data.bays,
             "dias_laborables": config_data.dias_laborales,
-            # Campos legacy (para compatibilidad con admin)
-            "hora_apertura": config_data.hora_apertura,
-            "hora_cierre": config_data.hora_cierre,
-            "duracion_turno_minutos": config_data.duracion_turno_minutos,
-            "dias_laborales": config_data.dias_laborales,
+            "tipos_vehiculo": tipos_vehiculo_desde_servicios(config_data.dict()),
             "alias_bancario": config_data.alias_bancario,
             "precio_turno": config_data.precio_turno,
-            # Nuevos campos para tipos de vehículos
-            "servicio_motos": config_data.servicio_motos,
-            "servicio_autos": config_data.servicio_autos,
-            "servicio_camionetas": config_data.servicio_camionetas,
-            "precio_motos": config_data.precio_motos,
-            "precio_autos": config_data.precio_autos,
-            "precio_camionetas": config_data.precio_camionetas,
             # Ubicación del lavadero
             "latitud": config_data.latitud,
             "longitud": config_data.longitud,
-            "direccion_completa": config_data.direccion_completa
+            "direccion_completa": config_data.direccion_completa,
+            "configurado": True,
+            "schema_version": CONFIGURACION_SCHEMA_VERSION
+        },
+        # Restos del esquema anterior si el backfill todavía no pasó por este documento
+        "$unset": {campo: "" for campo in CAMPOS_CONFIGURACION_LEGACY},
+        "$setOnInsert": {
+            "id": str(uuid.uuid4()),
+            "esta_abierto": False,
+            "created_at": datetime.now(timezone.utc)
         }
     }
     
-    result = await db.configuracion_lavadero.update_one(
+    anterior = await db.configuracion_lavadero.find_one_and_update(
         {"lavadero_id": lavadero_doc["id"]},
-        update_data
+        update_data,
+        projection={"_id": 0, "bays": 1},
+        upsert=True,
+        return_document=ReturnDocument.BEFORE
     )
+    bays_anteriores = (anterior or {}).get("bays", 1)
+    # Una reserva pudo entrar en un puesto quitado entre el chequeo y el update: volver atrás
+    bays_revertidos = (
+        config_data.bays < bays_anteriores
+        and await contar_turnos_fuera_de_bays(lavadero_doc["id"], config_data.bays)
+    )
+    if bays_revertidos:
+        await db.configuracion_lavadero.update_one(
+            {"lavadero_id": lavadero_doc["id"], "bays": config_data.bays},
+            {"$set": {"bays": bays_anteriores}}
+        )
     
     # Si se proporciona nombre_lavadero, actualizar también en la tabla lavaderos
     if config_data.nombre_lavadero:
@@ -2069,35 +4474,27 @@ async def update_configuracion_lavadero(config_data: ConfiguracionLavaderoCreate
             {"id": lavadero_doc["id"]},
             {"$set": {"nombre": config_data.nombre_lavadero}}
         )
+    await incrementar_version_contenido(lavadero_doc["id"])
+    cache_respuestas.invalidar_lavadero(lavadero_doc["id"])
+    # La grilla pudo cambiar: los bitmaps desde hoy se reconstruyen al próximo resumen mensual
+    await db.disponibilidad_dias.delete_many({
+        "lavadero_id": lavadero_doc["id"],
+        "fecha": {"$gte": datetime.now(ZONA_HORARIA_LAVADEROS).date().isoformat()}
+    })
     
-    if result.modified_count == 0:
-        # Si no existe configuración, crear nueva
-        nueva_config = ConfiguracionLavadero(
-            lavadero_id=lavadero_doc["id"],
-            **config_data.dict()
+    if bays_revertidos:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Se reservó un turno en los puestos que se quieren quitar: se guardó el resto de la configuración sin cambiar los puestos"
         )
-        await db.configuracion_lavadero.insert_one(nueva_config.dict())
-    
     return {"message": "Configuración actualizada exitosamente"}
 
 # Obtener días no laborales (Admin)
 @api_router.get("/admin/dias-no-laborales")
-async def get_dias_no_laborales(request: Request):
-    current_user = await get_current_user(request)
-    
-    if current_user.rol != UserRole.ADMIN:
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="Solo los administradores pueden acceder a esta información"
-        )
-    
-    # Buscar lavadero del admin
-    lavadero_doc = await db.lavaderos.find_one({"admin_id": current_user.id})
-    if not lavadero_doc:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Lavadero no encontrado"
-        )
+async def get_dias_no_laborales(
+    ctx: AdminContext = Depends(admin_context("Solo los administradores pueden acceder a esta información"))
+):
+    lavadero_doc = ctx.lavadero
     
     # Obtener días no laborales del lavadero
     dias_cursor = db.dias_no_laborales.find({"lavadero_id": lavadero_doc["id"]})
@@ -2115,22 +4512,11 @@ async def get_dias_no_laborales(request: Request):
 
 # Agregar día no laboral (Admin)
 @api_router.post("/admin/dias-no-laborales")
-async def add_dia_no_laboral(dia_data: DiaNoLaboralCreate, request: Request):
-    current_user = await get_current_user(request)
-    
-    if current_user.rol != UserRole.ADMIN:
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="Solo los administradores pueden agregar días no laborales"
-        )
-    
-    # Buscar lavadero del admin
-    lavadero_doc = await db.lavaderos.find_one({"admin_id": current_user.id})
-    if not lavadero_doc:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Lavadero no encontrado"
-        )
+async def add_dia_no_laboral(
+    dia_data: DiaNoLaboralCreate,
+    ctx: AdminContext = Depends(admin_context("Solo los administradores pueden agregar días no laborales"))
+):
+    lavadero_doc = ctx.lavadero
     
     # Verificar que la fecha no esté en el pasado
     fecha_inicio_dia = dia_data.fecha.replace(hour=0, minute=0, second=0, microsecond=0)
@@ -2160,63 +4546,50 @@ async def add_dia_no_laboral(dia_data: DiaNoLaboralCreate, request: Request):
     )
     
     await db.dias_no_laborales.insert_one(nuevo_dia.dict())
+    await db.disponibilidad_dias.update_one(
+        {"_id": _id_bitmap(lavadero_doc["id"], fecha_inicio_dia.date())},
+        {"$set": {"laborable": False}, "$inc": {"version": 1}}
+    )
+    await incrementar_version_contenido(lavadero_doc["id"])
+    cache_respuestas.invalidar(f"lavadero:{lavadero_doc['id']}:dias")
     
     return {"message": "Día no laboral agregado exitosamente", "dia": nuevo_dia.dict()}
 
 # Eliminar día no laboral (Admin)
 @api_router.delete("/admin/dias-no-laborales/{dia_id}")
-async def delete_dia_no_laboral(dia_id: str, request: Request):
-    current_user = await get_current_user(request)
-    
-    if current_user.rol != UserRole.ADMIN:
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="Solo los administradores pueden eliminar días no laborales"
-        )
-    
-    # Buscar lavadero del admin
-    lavadero_doc = await db.lavaderos.find_one({"admin_id": current_user.id})
-    if not lavadero_doc:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Lavadero no encontrado"
-        )
+async def delete_dia_no_laboral(
+    dia_id: str,
+    ctx: AdminContext = Depends(admin_context("Solo los administradores pueden eliminar días no laborales"))
+):
+    lavadero_doc = ctx.lavadero
     
     # Eliminar día no laboral
-    result = await db.dias_no_laborales.delete_one({
+    dia_eliminado = await db.dias_no_laborales.find_one_and_delete({
         "id": dia_id,
         "lavadero_id": lavadero_doc["id"]
     })
     
-    if result.deleted_count == 0:
+    if not dia_eliminado:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Día no laboral no encontrado"
         )
+    # El día vuelve a ser laborable: su bitmap se reconstruye (con los turnos que tenga) al leerlo
+    await db.disponibilidad_dias.delete_one({"_id": _id_bitmap(lavadero_doc["id"], dia_eliminado["fecha"].date())})
+    await incrementar_version_contenido(lavadero_doc["id"])
+    cache_respuestas.invalidar(f"lavadero:{lavadero_doc['id']}:dias")
     
     return {"message": "Día no laboral eliminado exitosamente"}
 
 # Toggle estado de apertura del lavadero (Admin)
 @api_router.post("/admin/toggle-apertura")
-async def toggle_apertura_lavadero(request: Request):
-    current_user = await get_current_user(request)
-    
-    if current_user.rol != UserRole.ADMIN:
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="Solo los administradores pueden cambiar el estado de apertura"
-        )
-    
-    # Buscar lavadero del admin
-    lavadero_doc = await db.lavaderos.find_one({"admin_id": current_user.id})
-    if not lavadero_doc:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Lavadero no encontrado"
-        )
+async def toggle_apertura_lavadero(
+    ctx: AdminContext = Depends(admin_context("Solo los administradores pueden cambiar el estado de apertura"))
+):
+    lavadero_doc = ctx.lavadero
     
-    # Buscar configuración del lavadero
-    config_doc = await db.configuracion_lavadero.find_one({"lavadero_id": lavadero_doc["id"]})
+    # Configuración del lavadero (ya resuelta en el contexto)
+    config_doc = ctx.config
     if not config_doc:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -2231,6 +4604,8 @@ async def toggle_apertura_lavadero(request: Request):
         {"lavadero_id": lavadero_doc["id"]},
         {"$set": {"esta_abierto": nuevo_estado}}
     )
+    await incrementar_version_contenido(lavadero_doc["id"])
+    cache_respuestas.invalidar_lavadero(lavadero_doc["id"])
     
     return {
         "message": f"Lavadero {'abierto' if nuevo_estado else 'cerrado'} exitosamente",
@@ -2246,24 +4621,8 @@ async def toggle_apertura_lavadero(request: Request):
 async def get_configuracion_superadmin(request: Request):
     await get_super_admin_user(request)
     
-    # Buscar configuración existente
-    config_doc = await db.configuracion_superadmin.find_one({})
-    
-    if not config_doc:
-        # Crear configuración por defecto si no existe
-        default_config = ConfiguracionSuperAdmin(
-            alias_bancario="superadmin.sistema.mp",
-            precio_mensualidad=10000.0
-        )
-        config_dict = default_config.dict()
-        await db.configuracion_superadmin.insert_one(config_dict)
-        return default_config.dict()
-    
-    # Remove MongoDB ObjectId from the document
-    config_dict = dict(config_doc)
-    if '_id' in config_dict:
-        del config_dict['_id']
-    return config_dict
+    # Singleton cacheado (se crea con valores por defecto si no existe)
+    return await configuracion_superadmin.obtener()
 
 # Actualizar configuración del Super Admin
 @api_router.put("/superadmin/configuracion")
@@ -2293,40 +4652,13 @@ async def update_configuracion_superadmin(request: Request, config_data: dict):
             detail="El precio mensualidad debe ser un número válido mayor a cero"
         )
     
-    # Buscar configuración existente
-    existing_config = await db.configuracion_superadmin.find_one({})
-    
-    # Verificar si el precio cambió para actualizar pagos pendientes
-    precio_anterior = None
-    if existing_config:
-        precio_anterior = existing_config.get("precio_mensualidad")
-    
-    update_data = {
-        "$set": {
-            "alias_bancario": config_data["alias_bancario"].strip(),
-            "precio_mensualidad": precio
-        }
-    }
-    
-    if existing_config:
-        # Actualizar configuración existente
-        result = await db.configuracion_superadmin.update_one(
-            {"id": existing_config["id"]},
-            update_data
-        )
-        
-        if result.modified_count == 0:
-            raise HTTPException(
-                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                detail="No se pudo actualizar la configuración"
-            )
-    else:
-        # Crear nueva configuración si no existe
-        nueva_config = ConfiguracionSuperAdmin(
-            alias_bancario=config_data["alias_bancario"].strip(),
-            precio_mensualidad=precio
-        )
-        await db.configuracion_superadmin.insert_one(nueva_config.dict())
+    # Actualizar el singleton (y la copia en cache) obteniendo el precio anterior
+    config_anterior = await configuracion_superadmin.actualizar({
+        "alias_bancario": config_data["alias_bancario"].strip(),
+        "precio_mensualidad": precio
+    })
+    precio_anterior = config_anterior.get("precio_mensualidad")
+    cache_respuestas.invalidar("superadmin-config")
     
     # 🔧 NUEVA FUNCIONALIDAD: Actualizar pagos PENDIENTES si el precio cambió
     if precio_anterior is not None and precio_anterior != precio:
@@ -2352,56 +4684,241 @@ async def update_configuracion_superadmin(request: Request, config_data: dict):
         "precio_mensualidad": precio
     }
 
-# Obtener credenciales para testing (Super Admin)
-@api_router.get("/superadmin/credenciales-testing")
-async def get_credenciales_testing(request: Request):
+# Métricas internas del proceso (Super Admin)
+@api_router.get("/superadmin/metricas")
+async def get_metricas(request: Request):
     await get_super_admin_user(request)
     
-    # Esta es una función especial solo para development/testing
-    # En producción debería ser removida por seguridad
-    
-    # Obtener todos los admins
-    admins_cursor = db.users.find({"rol": UserRole.ADMIN})
-    admins = await admins_cursor.to_list(1000)
-    
-    # Lista ampliada de contraseñas comunes para testing
-    common_passwords = [
-        "admin123", "carlos123", "emp123", "test123", 
-        "123456", "password", "admin", "test", 
-        "lavadero123", "password123", "admin2023", "demo123",
-        "kearcangel123", "superadmin", "1234567890", "qwerty",
-        "maria123", "juan123", "ana123", "jose123",
-        "K@#l1331",  # Super admin password
-        "pass", "pass123", "admin2024", "user123"
-    ]
+    return {
+        "principal_cache": principal_cache.stats(),
+        "password_pool": password_pool.stats(),
+        "auth_service": {**auth_service.stats(), "single_flight_compartidas": intercambios_sesion.compartidas},
+        "limitador_autenticacion": limitador_autenticacion.stats(),
+        "cache_respuestas": cache_respuestas.stats(),
+        "indices_intervalos": indices_intervalos.stats()
+    }
+
+# Reporte de drift de índices (Super Admin)
+@api_router.get("/superadmin/indices")
+async def get_reporte_indices(request: Request):
+    await get_super_admin_user(request)
     
-    result = []
-    for admin in admins:
-        # Para cada admin, probar las contraseñas comunes
-        plain_password = "contraseña_no_encontrada"
+    reporte = await reporte_drift_indices()
+    return {
+        "sincronizado": not reporte,
+        "drift": reporte
+    }
+
+# ========== CREDENCIALES DE TESTING (JOBS EN BACKGROUND) ==========
+# Esta es una función especial solo para development/testing
+# En producción debería ser removida por seguridad
+
+# Lista ampliada de contraseñas comunes para testing
+COMMON_PASSWORDS_TESTING = [
+    "admin123", "carlos123", "emp123", "test123", 
+    "123456", "password", "admin", "test", 
+    "lavadero123", "password123", "admin2023", "demo123",
+    "kearcangel123", "superadmin", "1234567890", "qwerty",
+    "maria123", "juan123", "ana123", "jose123",
+    "K@#l1331",  # Super admin password
+    "pass", "pass123", "admin2024", "user123"
+]
+CREDENCIALES_POOL_WORKERS = int(os.environ.get("CREDENCIALES_POOL_WORKERS", "2"))
+# Los jobs viven en Mongo (cualquier worker de uvicorn los consulta o cancela) y se
+# borran solos pasado este tiempo
+CREDENCIALES_TRABAJO_TTL = timedelta(hours=1)
+# Cada cuánto el worker que corre un job mira si lo cancelaron desde otro worker
+CREDENCIALES_CANCELACION_POLL_SEGUNDOS = 1
+# Contraseñas por tarea del pool: al cancelar un job, lo que ya está en un worker no se
+# puede interrumpir, así que como mucho sigue corriendo un lote por worker
+CREDENCIALES_PASSWORDS_POR_TAREA = 5
+PASSWORD_NO_ENCONTRADA = "contraseña_no_encontrada"
+
+def resumen_trabajo_credenciales(trabajo: dict, incluir_resultados: bool = True):
+    resumen = {
+        "job_id": trabajo["_id"],
+        "estado": trabajo["estado"],
+        "total": trabajo["total"],
+        "procesados": trabajo["procesados"],
+        "created_at": trabajo["created_at"],
+        "error": trabajo.get("error")
+    }
+    if incluir_resultados:
+        resumen["resultados"] = [r for r in trabajo.get("resultados", []) if r is not None]
+    return resumen
+
+# Tareas de los jobs que corren en este worker (el estado está en db.trabajos_credenciales)
+tareas_credenciales = {}
+_credenciales_executor = None
+
+def get_credenciales_executor():
+    global _credenciales_executor
+    if _credenciales_executor is None:
+        # spawn: los procesos importan solo credenciales_worker, sin heredar el event loop
+        # ni los sockets de Mongo de este proceso
+        _credenciales_executor = ProcessPoolExecutor(
+            max_workers=CREDENCIALES_POOL_WORKERS,
+            mp_context=multiprocessing.get_context("spawn")
+        )
+    return _credenciales_executor
+
+async def _vigilar_cancelacion_credenciales(job_id: str, tarea: asyncio.Task):
+    """Cancela la tarea local si el job se canceló (o venció) desde cualquier worker"""
+    while True:
+        await asyncio.sleep(CREDENCIALES_CANCELACION_POLL_SEGUNDOS)
+        trabajo = await db.trabajos_credenciales.find_one({"_id": job_id}, {"estado": 1})
+        if not trabajo or trabajo["estado"] == "CANCELADO":
+            tarea.cancel()
+            return
+
+async def ejecutar_trabajo_credenciales(job_id: str):
+    vigilancia = asyncio.create_task(_vigilar_cancelacion_credenciales(job_id, asyncio.current_task()))
+    en_curso = {"_id": job_id, "estado": "EN_CURSO"}
+    try:
+        admins = await db.users.find(
+            {"rol": UserRole.ADMIN},
+            {"_id": 0, "email": 1, "nombre": 1, "password_hash": 1}
+        ).to_list(None)
+        await db.trabajos_credenciales.update_one(
+            en_curso, {"$set": {"total": len(admins), "resultados": [None] * len(admins)}}
+        )
         
-        if admin.get("password_hash"):
-            for pwd in common_passwords:
-                try:
-                    if verify_password(pwd, admin["password_hash"]):
-                        plain_password = pwd
-                        break
-                except Exception as e:
-                    # Si hay error en la verificación, continuar con la siguiente
-                    continue
+        # Todas las credenciales temporales en una sola consulta (la primera por email gana)
+        temp_credentials = {}
+        async for temp_cred in db.temp_credentials.find({"admin_email": {"$in": [a["email"] for a in admins]}}):
+            temp_credentials.setdefault(temp_cred["admin_email"], temp_cred["password"])
         
-        # También verificar si hay una entrada en la tabla temporal de credenciales
-        temp_cred = await db.temp_credentials.find_one({"admin_email": admin["email"]})
-        if temp_cred:
-            plain_password = temp_cred["password"]
+        async def registrar(indice: int, password: str):
+            admin = admins[indice]
+            await db.trabajos_credenciales.update_one(en_curso, {
+                "$set": {f"resultados.{indice}": {
+                    "email": admin["email"],
+                    "nombre": admin["nombre"],
+                    "password": password
+                }},
+                "$inc": {"procesados": 1}
+            })
         
-        result.append({
-            "email": admin["email"],
-            "nombre": admin["nombre"],
-            "password": plain_password
-        })
+        # Los que tienen credencial temporal no necesitan bcrypt
+        pendientes = []
+        inmediatos = []
+        for indice, admin in enumerate(admins):
+            if admin["email"] in temp_credentials:
+                inmediatos.append(registrar(indice, temp_credentials[admin["email"]]))
+            elif admin.get("password_hash"):
+                pendientes.append(indice)
+            else:
+                inmediatos.append(registrar(indice, PASSWORD_NO_ENCONTRADA))
+        await asyncio.gather(*inmediatos)
+        
+        # bcrypt en el process pool, como mucho un lote en vuelo por worker. Nada queda
+        # encolado en el pool: al cancelar, el próximo lote no se manda
+        loop = asyncio.get_running_loop()
+        executor = get_credenciales_executor()
+        semaforo = asyncio.Semaphore(CREDENCIALES_POOL_WORKERS)
+        
+        async def verificar(indice: int):
+            password = None
+            for inicio in range(0, len(COMMON_PASSWORDS_TESTING), CREDENCIALES_PASSWORDS_POR_TAREA):
+                async with semaforo:
+                    password = await loop.run_in_executor(
+                        executor, buscar_password_comun, admins[indice]["password_hash"],
+                        COMMON_PASSWORDS_TESTING[inicio:inicio + CREDENCIALES_PASSWORDS_POR_TAREA]
+                    )
+                if password:
+                    break
+            await registrar(indice, password or PASSWORD_NO_ENCONTRADA)
+        
+        await asyncio.gather(*(verificar(indice) for indice in pendientes))
+        await db.trabajos_credenciales.update_one(en_curso, {"$set": {"estado": "COMPLETADO"}})
+    except asyncio.CancelledError:
+        await db.trabajos_credenciales.update_one(en_curso, {"$set": {"estado": "CANCELADO"}})
+        raise
+    except Exception as e:
+        logger.error(f"Error en job de credenciales {job_id}: {e}")
+        await db.trabajos_credenciales.update_one(en_curso, {"$set": {"estado": "ERROR", "error": str(e)}})
+    finally:
+        vigilancia.cancel()
+
+async def iniciar_trabajo_credenciales():
+    ahora = datetime.now(timezone.utc)
+    trabajo = {
+        "_id": str(uuid.uuid4()),
+        "estado": "EN_CURSO",  # EN_CURSO, COMPLETADO, CANCELADO, ERROR
+        "total": 0,
+        "procesados": 0,
+        "resultados": [],
+        "error": None,
+        "created_at": ahora,
+        "expires_at": ahora + CREDENCIALES_TRABAJO_TTL
+    }
+    await db.trabajos_credenciales.insert_one(trabajo)
+    tarea = asyncio.create_task(ejecutar_trabajo_credenciales(trabajo["_id"]))
+    tareas_credenciales[trabajo["_id"]] = tarea
+    tarea.add_done_callback(lambda _: tareas_credenciales.pop(trabajo["_id"], None))
+    return trabajo, tarea
+
+async def get_trabajo_credenciales(job_id: str):
+    trabajo = await db.trabajos_credenciales.find_one({"_id": job_id})
+    if not trabajo:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Job no encontrado"
+        )
+    return trabajo
+
+# Obtener credenciales para testing (Super Admin)
+# Compatibilidad: lanza un job y espera su resultado sin bloquear el event loop
+@api_router.get("/superadmin/credenciales-testing")
+async def get_credenciales_testing(request: Request):
+    await get_super_admin_user(request)
     
-    return result
+    trabajo, tarea = await iniciar_trabajo_credenciales()
+    try:
+        await asyncio.shield(tarea)
+    except asyncio.CancelledError:
+        # Si lo que se canceló es el job (DELETE), no este request: responder en vez de cortar
+        if not tarea.cancelled():
+            raise
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="El job de credenciales fue cancelado"
+        )
+    trabajo = await get_trabajo_credenciales(trabajo["_id"])
+    if trabajo["estado"] != "COMPLETADO":
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=trabajo.get("error") or "No se pudieron obtener las credenciales"
+        )
+    return resumen_trabajo_credenciales(trabajo)["resultados"]
+
+# Lanzar job de credenciales para testing (Super Admin)
+@api_router.post("/superadmin/credenciales-testing/jobs")
+async def crear_job_credenciales_testing(request: Request):
+    await get_super_admin_user(request)
+    
+    trabajo, _ = await iniciar_trabajo_credenciales()
+    return resumen_trabajo_credenciales(trabajo, incluir_resultados=False)
+
+# Consultar progreso y resultados parciales de un job (Super Admin)
+@api_router.get("/superadmin/credenciales-testing/jobs/{job_id}")
+async def get_job_credenciales_testing(job_id: str, request: Request):
+    await get_super_admin_user(request)
+    
+    return resumen_trabajo_credenciales(await get_trabajo_credenciales(job_id))
+
+# Cancelar un job (Super Admin)
+# Desde cualquier worker: el que lo corre ve el estado en la base y corta antes del próximo lote
+@api_router.delete("/superadmin/credenciales-testing/jobs/{job_id}")
+async def cancelar_job_credenciales_testing(job_id: str, request: Request):
+    await get_super_admin_user(request)
+    
+    await db.trabajos_credenciales.update_one(
+        {"_id": job_id, "estado": "EN_CURSO"}, {"$set": {"estado": "CANCELADO"}}
+    )
+    if job_id in tareas_credenciales:
+        tareas_credenciales[job_id].cancel()
+    return resumen_trabajo_credenciales(await get_trabajo_credenciales(job_id), incluir_resultados=False)
 
 # Endpoint específico para servir imágenes de comprobantes
 @api_router.get("/uploads/comprobantes/{filename}")
@@ -2441,18 +4958,29 @@ app.add_middleware(
     allow_origins=os.environ.get('CORS_ORIGINS', '*').split(','),
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "ETag"],
 )
 
 # Mount static files DESPUÉS de CORS
 app.mount("/uploads", StaticFiles(directory=str(UPLOAD_DIR)), name="uploads")
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
-logger = logging.getLogger(__name__)
+@app.on_event("startup")
+async def startup_db_client():
+    await aplicar_indices()
+    await backfill_lavadero_id_comprobantes_pago()
+    auth_service.iniciar()
+    app.state.tareas = [
+        asyncio.create_task(migrar_configuraciones()),
+        asyncio.create_task(tarea_reconciliacion_contadores()),
+        asyncio.create_task(tarea_sincronizacion_revocaciones()),
+        asyncio.create_task(tarea_reconciliacion_ocupacion()),
+    ]
 
 @app.on_event("shutdown")
 async def shutdown_db_client():
+    for tarea in app.state.tareas:
+        tarea.cancel()
+    if _credenciales_executor is not None:
+        _credenciales_executor.shutdown(wait=False, cancel_futures=True)
+    await auth_service.cerrar()
     client.close()
\ No newline at end of file
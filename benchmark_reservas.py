@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+"""
+Benchmark de contención en proceso para la reserva de turnos.
+
+Crea un lavadero temporal, lanza miles de intentos concurrentes de reserva sobre
+unos pocos slots (con una fracción de reintentos con la misma Idempotency-Key)
+y verifica en la base que ningún puesto (bay) de un slot quedó reservado dos veces
+ni se superó la capacidad de cada slot. Al final borra
+todo lo que creó.
+
+Los intentos llaman a reservar_turno desde un único proceso y event loop: mide la
+contención entre corrutinas sobre la misma base, no entre workers de uvicorn.
+
+Uso:
+    python benchmark_reservas.py
+    python benchmark_reservas.py --intentos 5000 --slots 3 --bays 4 --reintentos 0.2
+"""
+import argparse
+import asyncio
+import random
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+# Add backend to path
+sys.path.append(str(Path(__file__).parent / "backend"))
+
+from fastapi import HTTPException
+from server import (
+    db, client, aplicar_indices, reservar_turno, inicio_dia_utc,
+    Lavadero, ConfiguracionLavadero, EstadoAdmin, ZONA_HORARIA_LAVADEROS,
+    clave_contadores_lavadero, minutos_utc, _bloques
+)
+
+DURACION_TURNO = 60
+
+async def crear_lavadero_temporal(bays: int):
+    lavadero = Lavadero(
+        nombre="Benchmark reservas",
+        direccion="Temporal",
+        admin_id=f"bench-admin-{uuid.uuid4()}",
+        estado_operativo=EstadoAdmin.ACTIVO
+    )
+    config = ConfiguracionLavadero(
+        lavadero_id=lavadero.id,
+        horario_apertura="08:00",
+        horario_cierre="20:00",
+        duracion_turno=DURACION_TURNO,
+        bays=bays,
+        dias_laborables=[1, 2, 3, 4, 5, 6, 7]
+    )
+    await db.lavaderos.insert_one(lavadero.dict())
+    await db.configuracion_lavadero.insert_one(config.dict())
+    return lavadero.id
+
+async def limpiar(lavadero_id: str, prefijo_clientes: str, bays: int, desde: datetime, hasta: datetime):
+    await db.turnos.delete_many({"lavadero_id": lavadero_id})
+    # Bloques reclamados y bitmaps de disponibilidad de los días de la corrida
+    await db.ocupacion_bays.delete_many({"_id": {"$in": [
+        f"{lavadero_id}:{bay}:{bloque}" for bay in range(bays) for bloque in _bloques(minutos_utc(desde), minutos_utc(hasta))
+    ]}})
+    await db.disponibilidad_dias.delete_many({
+        "lavadero_id": lavadero_id,
+        "fecha": {"$gte": desde.astimezone(ZONA_HORARIA_LAVADEROS).date().isoformat(),
+                  "$lte": hasta.astimezone(ZONA_HORARIA_LAVADEROS).date().isoformat()}
+    })
+    await db.configuracion_lavadero.delete_many({"lavadero_id": lavadero_id})
+    await db.lavaderos.delete_one({"id": lavadero_id})
+    await db.contadores.delete_one({"_id": clave_contadores_lavadero(lavadero_id)})
+    await db.contadores.delete_many({"_id": {"$regex": f"^cliente:{prefijo_clientes}"}})
+
+async def main():
+    parser = argparse.ArgumentParser(description="Benchmark de contención en proceso de reservas de turnos")
+    parser.add_argument("--intentos", type=int, default=2000, help="Intentos de reserva concurrentes")
+    parser.add_argument("--slots", type=int, default=3, help="Slots distintos en disputa")
+    parser.add_argument("--bays", type=int, default=1, help="Puestos de lavado por slot")
+    parser.add_argument("--reintentos", type=float, default=0.1, help="Fracción de intentos que son reintentos idempotentes")
+    args = parser.parse_args()
+
+    print("🔥 BENCHMARK DE CONTENCIÓN DE RESERVAS (EN PROCESO)")
+    print("=" * 50)
+
+    await aplicar_indices()
+    lavadero_id = await crear_lavadero_temporal(args.bays)
+    prefijo_clientes = f"bench-{uuid.uuid4().hex[:8]}-"
+
+    # Slots de mañana (hora local del lavadero) desde las 09:00
+    manana = datetime.now(ZONA_HORARIA_LAVADEROS).date() + timedelta(days=1)
+    slots = [inicio_dia_utc(manana) + timedelta(hours=9 + i) for i in range(args.slots)]
+
+    # Cada intento es (cliente, key); los reintentos repiten un par ya usado
+    intentos = []
+    for i in range(args.intentos):
+        if intentos and random.random() < args.reintentos:
+            intentos.append(random.choice(intentos))
+        else:
+            intentos.append((f"{prefijo_clientes}{i}", str(uuid.uuid4()), random.choice(slots)))
+
+    resultados = {"creados": 0, "reintentos_idempotentes": 0, "conflictos": 0, "errores": 0}
+    latencias = []
+
+    async def intentar(cliente_id, key, slot):
+        inicio = time.perf_counter()
+        try:
+            _, creado = await reservar_turno(lavadero_id, cliente_id, slot, idempotency_key=key)
+            resultados["creados" if creado else "reintentos_idempotentes"] += 1
+        except HTTPException as e:
+            resultados["conflictos" if e.status_code == 409 else "errores"] += 1
+        finally:
+            latencias.append(time.perf_counter() - inicio)
+
+    try:
+        inicio = time.perf_counter()
+        await asyncio.gather(*(intentar(*intento) for intento in intentos))
+        total = time.perf_counter() - inicio
+
+        # Verificación en la base: como mucho un turno activo por (fecha_hora, bay)
+        duplicados = await db.turnos.aggregate([
+            {"$match": {"lavadero_id": lavadero_id, "ocupa_slot": True}},
+            {"$group": {"_id": {"fecha_hora": "$fecha_hora", "bay": "$bay"}, "n": {"$sum": 1}}},
+            {"$match": {"n": {"$gt": 1}}}
+        ]).to_list(None)
+        reservados = await db.turnos.count_documents({"lavadero_id": lavadero_id, "ocupa_slot": True})
+        sobre_capacidad = await db.turnos.aggregate([
+            {"$match": {"lavadero_id": lavadero_id, "ocupa_slot": True}},
+            {"$group": {"_id": "$fecha_hora", "n": {"$sum": 1}}},
+            {"$match": {"n": {"$gt": args.bays}}}
+        ]).to_list(None)
+
+        latencias.sort()
+        print(f"📊 Intentos: {len(intentos)} sobre {len(slots)} slots x {args.bays} bays en {total:.2f}s "
+              f"({len(intentos) / total:.0f} intentos/s)")
+        print(f"   Resultados: {resultados}")
+        print(f"   Latencia p50: {latencias[len(latencias) // 2] * 1000:.1f}ms | "
+              f"p99: {latencias[int(len(latencias) * 0.99) - 1] * 1000:.1f}ms")
+        print(f"   Turnos reservados en la base: {reservados}")
+
+        if duplicados or sobre_capacidad or reservados != resultados["creados"] or reservados > len(slots) * args.bays:
+            print(f"❌ DOBLES RESERVAS DETECTADAS: {duplicados or sobre_capacidad}")
+            sys.exit(1)
+        print("✅ Cero dobles reservas")
+    finally:
+        await limpiar(lavadero_id, prefijo_clientes, args.bays,
+                      min(slots), max(slots) + timedelta(minutes=DURACION_TURNO))
+        client.close()
+
+if __name__ == "__main__":
+    asyncio.run(main())
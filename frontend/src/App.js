@@ -9,6 +9,78 @@ const API = `${BACKEND_URL}/api`;
 // Configure axios to include cookies
 axios.defaults.withCredentials = true;
 
+// Ante un 401 con JWT, rota el refresh token y reintenta una vez (un solo refresh en vuelo)
+let refreshEnCurso = null;
+
+// Rota el refresh token salvo que otra pestaña ya lo haya hecho (localStorage es compartido)
+const rotarTokens = async (refreshToken) => {
+  const actual = localStorage.getItem('refresh_token');
+  if (!actual) {
+    throw new Error('Sesión cerrada en otra pestaña');
+  }
+  if (actual !== refreshToken) {
+    return { access_token: localStorage.getItem('token'), refresh_token: actual };
+  }
+  const { data } = await axios.post(`${API}/refresh`, { refresh_token: refreshToken });
+  localStorage.setItem('token', data.access_token);
+  localStorage.setItem('refresh_token', data.refresh_token);
+  return data;
+};
+
+axios.interceptors.response.use(
+  response => response,
+  async (error) => {
+    const original = error.config;
+    const refreshToken = localStorage.getItem('refresh_token');
+    if (
+      error.response?.status !== 401 || !refreshToken || !original || original._reintentado ||
+      original.url?.endsWith('/refresh') || original.url?.endsWith('/login')
+    ) {
+      return Promise.reject(error);
+    }
+    original._reintentado = true;
+    try {
+      if (!refreshEnCurso) {
+        // Web Locks: entre pestañas rota una sola a la vez; las demás toman el token ya rotado
+        refreshEnCurso = (navigator.locks
+          ? navigator.locks.request('lavaderos-refresh-token', () => rotarTokens(refreshToken))
+          : rotarTokens(refreshToken)
+        ).finally(() => { refreshEnCurso = null; });
+      }
+      const data = await refreshEnCurso;
+      axios.defaults.headers.common['Authorization'] = `Bearer ${data.access_token}`;
+      original.headers['Authorization'] = `Bearer ${data.access_token}`;
+      return axios(original);
+    } catch (refreshError) {
+      localStorage.removeItem('token');
+      localStorage.removeItem('refresh_token');
+      delete axios.defaults.headers.common['Authorization'];
+      return Promise.reject(error);
+    }
+  }
+);
+
+// Trae una página de un listado paginado por cursor; la siguiente se pide con nextCursor (header X-Next-Cursor)
+const fetchPage = async (url, cursor = null, params = {}) => {
+  const response = await axios.get(url, { params: cursor ? { ...params, cursor } : params });
+  return { items: response.data, nextCursor: response.headers['x-next-cursor'] || null };
+};
+
+const LoadMoreButton = ({ nextCursor, loading, onLoadMore }) => {
+  if (!nextCursor) return null;
+  return (
+    <div className="px-4 py-4 text-center border-t border-gray-200">
+      <button
+        onClick={() => onLoadMore(nextCursor)}
+        disabled={loading}
+        className="px-4 py-2 bg-gray-100 text-gray-700 rounded text-sm hover:bg-gray-200 disabled:opacity-50"
+      >
+        {loading ? 'Cargando...' : 'Cargar más'}
+      </button>
+    </div>
+  );
+};
+
 // Componente simple de ubicación para Tucumán - San Miguel
 const SimpleLocationSelector = ({ onLocationChange }) => {
   const [address, setAddress] = useState('');
@@ -170,9 +242,10 @@ const AuthProvider = ({ children }) => {
     try {
       const response = await axios.post(`${API}/login`, { email, password });
       
-      const { access_token, user: userData } = response.data;
+      const { access_token, refresh_token, user: userData } = response.data;
       
       localStorage.setItem('token', access_token);
+      localStorage.setItem('refresh_token', refresh_token);
       axios.defaults.headers.common['Authorization'] = `Bearer ${access_token}`;
       setUser(userData);
       
@@ -208,7 +281,8 @@ const AuthProvider = ({ children }) => {
     
     try {
       // Call logout endpoint to clear session
-      await axios.post(`${API}/logout`);
+      const refreshToken = localStorage.getItem('refresh_token');
+      await axios.post(`${API}/logout`, refreshToken ? { refresh_token: refreshToken } : undefined);
     } catch (error) {
       console.error('Error during logout:', error);
     }
@@ -220,6 +294,7 @@ const AuthProvider = ({ children }) => {
     
     // Clear local storage and axios headers
     localStorage.removeItem('token');
+    localStorage.removeItem('refresh_token');
     delete axios.defaults.headers.common['Authorization'];
     setUser(null);
   };
@@ -1334,20 +1409,26 @@ const UserProfile = () => {
 // User Management Component (Admin only)
 const UserManagement = () => {
   const [users, setUsers] = useState([]);
+  const [nextCursor, setNextCursor] = useState(null);
   const [loading, setLoading] = useState(true);
+  const [loadingMore, setLoadingMore] = useState(false);
 
   useEffect(() => {
     fetchUsers();
   }, []);
 
-  const fetchUsers = async () => {
+  // Sin cursor recarga la primera página; con cursor agrega la siguiente
+  const fetchUsers = async (cursor = null) => {
+    setLoadingMore(Boolean(cursor));
     try {
-      const response = await axios.get(`${API}/admin/users`);
-      setUsers(response.data);
+      const page = await fetchPage(`${API}/admin/users`, cursor);
+      setUsers(prev => cursor ? [...prev, ...page.items] : page.items);
+      setNextCursor(page.nextCursor);
     } catch (error) {
       console.error('Error fetching users:', error);
     } finally {
       setLoading(false);
+      setLoadingMore(false);
     }
   };
 
@@ -1439,6 +1520,7 @@ const UserManagement = () => {
             </li>
           ))}
         </ul>
+        <LoadMoreButton nextCursor={nextCursor} loading={loadingMore} onLoadMore={fetchUsers} />
       </div>
     </div>
   );
@@ -2529,6 +2611,39 @@ const CalendarioSemanal = ({
     return days;
   }, [currentWeekStart]);
 
+  // Fecha local en formato YYYY-MM-DD (clave de la disponibilidad del backend)
+  const fechaLocal = (date) => (
+    `${date.getFullYear()}-${String(date.getMonth() + 1).padStart(2, '0')}-${String(date.getDate()).padStart(2, '0')}`
+  );
+
+  // Disponibilidad de la semana visible calculada en el backend (incluye turnos ya reservados)
+  useEffect(() => {
+    const fetchDisponibilidad = async () => {
+      if (!lavadero?.id) return;
+      try {
+        setLoading(true);
+        const response = await axios.get(`${API}/lavaderos/${lavadero.id}/disponibilidad`, {
+          params: { desde: fechaLocal(weekDays[0]), hasta: fechaLocal(weekDays[6]) }
+        });
+        setAvailableSlots(response.data);
+      } catch (error) {
+        console.error('Error fetching disponibilidad:', error);
+        setAvailableSlots({});
+      } finally {
+        setLoading(false);
+      }
+    };
+    
+    fetchDisponibilidad();
+  }, [lavadero?.id, weekDays]);
+
+  // Un horario está tomado si el backend lo marca como no libre ('0') para ese día
+  const isTakenSlot = (date, timeString) => {
+    const bits = availableSlots.dias?.[fechaLocal(date)];
+    const index = availableSlots.horarios ? availableSlots.horarios.indexOf(timeString) : -1;
+    return bits !== undefined && index >= 0 && bits[index] === '0';
+  };
+
   // Nombres de días en español
   const dayNames = ['Dom', 'Lun', 'Mar', 'Mié', 'Jue', 'Vie', 'Sáb'];
   const monthNames = [
@@ -2637,7 +2752,7 @@ const CalendarioSemanal = ({
 
   // Manejar selección de horario
   const handleTimeSlotClick = (date, timeString) => {
-    if (!isDayWorking(date) || isPastDate(date) || isPastTime(date, timeString)) {
+    if (!isDayWorking(date) || isPastDate(date) || isPastTime(date, timeString) || isTakenSlot(date, timeString)) {
       return; // No permitir selección de slots no disponibles
     }
     
@@ -2739,18 +2854,21 @@ const CalendarioSemanal = ({
                     configuracion.duracion_turno
                   ).map((timeSlot) => {
                     const isPastSlot = isPastTime(day, timeSlot);
+                    const isTaken = !isPastSlot && isTakenSlot(day, timeSlot);
                     const isSelected = isSlotSelected(day, timeSlot);
                     
                     return (
                       <button
                         key={timeSlot}
                         onClick={() => handleTimeSlotClick(day, timeSlot)}
-                        disabled={isPastSlot}
+                        disabled={isPastSlot || isTaken}
                         className={`w-full py-2 px-2 text-xs rounded transition-colors ${
                           isSelected
                             ? 'bg-blue-600 text-white font-medium'
                             : isPastSlot
                             ? 'bg-gray-200 text-gray-400 cursor-not-allowed'
+                            : isTaken
+                            ? 'bg-red-50 text-red-400 line-through cursor-not-allowed'
                             : 'bg-green-50 text-green-800 hover:bg-green-100 border border-green-200'
                         }`}
                       >
@@ -3091,32 +3209,48 @@ const ReservaLavadero = () => {
 const HomePage = () => {
   const [lavaderos, setLavaderos] = useState([]);
   const [filteredLavaderos, setFilteredLavaderos] = useState([]);
+  const [nextCursor, setNextCursor] = useState(null);
   const [loading, setLoading] = useState(true);
+  const [loadingMore, setLoadingMore] = useState(false);
   const [searchTerm, setSearchTerm] = useState('');
   const [filterAbierto, setFilterAbierto] = useState(false);
   const [currentPage, setCurrentPage] = useState(1);
   const [itemsPerPage, setItemsPerPage] = useState(3); // 3 para desktop, 1 para móvil
   const { user } = useAuth();
   const navigate = useNavigate();
+  const ultimaBusqueda = React.useRef(0);
+
+  const esAdmin = user && (user.rol === 'ADMIN' || user.rol === 'SUPER_ADMIN');
 
   useEffect(() => {
     // Si es admin o superadmin, redirigir a su dashboard
-    if (user && (user.rol === 'ADMIN' || user.rol === 'SUPER_ADMIN')) {
+    if (esAdmin) {
       navigate('/dashboard');
-      return;
     }
-    fetchLavaderos();
-  }, [user, navigate]);
+  }, [esAdmin, navigate]);
 
-  const fetchLavaderos = async () => {
+  // La búsqueda la resuelve el servidor: primera página al cambiar el texto (con debounce)
+  useEffect(() => {
+    if (esAdmin) return;
+    const timer = setTimeout(() => fetchLavaderos(), searchTerm ? 300 : 0);
+    return () => clearTimeout(timer);
+  }, [searchTerm, esAdmin]);
+
+  // Sin cursor trae la primera página de la búsqueda actual; con cursor agrega la siguiente
+  const fetchLavaderos = async (cursor = null) => {
+    const busqueda = cursor ? ultimaBusqueda.current : ++ultimaBusqueda.current;
+    setLoadingMore(Boolean(cursor));
     try {
-      const response = await axios.get(`${API}/lavaderos-operativos`);
-      setLavaderos(response.data);
-      setFilteredLavaderos(response.data); // Inicializar filtrados
+      const q = searchTerm.trim();
+      const page = await fetchPage(`${API}/lavaderos-operativos`, cursor, q ? { q } : {});
+      if (busqueda !== ultimaBusqueda.current) return; // respuesta de una búsqueda anterior
+      setLavaderos(prev => cursor ? [...prev, ...page.items] : page.items);
+      setNextCursor(page.nextCursor);
     } catch (error) {
       console.error('Error fetching lavaderos:', error);
     } finally {
       setLoading(false);
+      setLoadingMore(false);
     }
   };
 
@@ -3148,25 +3282,16 @@ const HomePage = () => {
     return () => window.removeEventListener('resize', updateItemsPerPage);
   }, []);
 
-  // Función de filtrado
+  // Filtro de abiertos sobre las páginas ya cargadas (el nombre lo filtra el servidor)
   React.useEffect(() => {
-    let filtered = lavaderos;
-
-    // Filtrar por nombre
-    if (searchTerm) {
-      filtered = filtered.filter(lavadero =>
-        lavadero.nombre.toLowerCase().includes(searchTerm.toLowerCase())
-      );
-    }
-
-    // Filtrar por estado abierto
-    if (filterAbierto) {
-      filtered = filtered.filter(lavadero => lavadero.estado_apertura === 'Abierto');
-    }
+    setFilteredLavaderos(
+      filterAbierto ? lavaderos.filter(lavadero => lavadero.estado_apertura === 'Abierto') : lavaderos
+    );
+  }, [lavaderos, filterAbierto]);
 
-    setFilteredLavaderos(filtered);
+  React.useEffect(() => {
     setCurrentPage(1); // Reset página al filtrar
-  }, [lavaderos, searchTerm, filterAbierto]);
+  }, [searchTerm, filterAbierto]);
 
   // Calcular elementos de la página actual
   const indexOfLastItem = currentPage * itemsPerPage;
@@ -3283,7 +3408,7 @@ const HomePage = () => {
             {/* Información de resultados */}
             <div className="md:w-32 flex items-end">
               <p className="text-sm text-gray-500">
-                {filteredLavaderos.length} lavadero{filteredLavaderos.length !== 1 ? 's' : ''}
+                {filteredLavaderos.length}{nextCursor ? '+' : ''} lavadero{filteredLavaderos.length !== 1 ? 's' : ''}
               </p>
             </div>
           </div>
@@ -3294,7 +3419,7 @@ const HomePage = () => {
           <div className="text-center py-12">
             <div className="text-xl text-gray-600">Cargando lavaderos disponibles...</div>
           </div>
-        ) : lavaderos.length === 0 ? (
+        ) : lavaderos.length === 0 && !searchTerm ? (
           <div className="text-center py-12">
             <div className="text-xl text-gray-600 mb-4">
               😔 No hay lavaderos operativos en este momento
@@ -3386,6 +3511,8 @@ const HomePage = () => {
                 </button>
               </div>
             )}
+
+            <LoadMoreButton nextCursor={nextCursor} loading={loadingMore} onLoadMore={fetchLavaderos} />
           </>
         )}
 
@@ -4939,7 +5066,9 @@ const RevisarComprobantes = () => {
 // Componente de Gestión de Admins (Super Admin)
 const GestionAdmins = () => {
   const [admins, setAdmins] = useState([]);
+  const [nextCursor, setNextCursor] = useState(null);
   const [loading, setLoading] = useState(true);
+  const [loadingMore, setLoadingMore] = useState(false);
   const [editingAdmin, setEditingAdmin] = useState(null);
   const [editForm, setEditForm] = useState({});
   const [showPassword, setShowPassword] = useState({});
@@ -4957,14 +5086,18 @@ const GestionAdmins = () => {
     fetchAdmins();
   }, []);
 
-  const fetchAdmins = async () => {
+  // Sin cursor recarga la primera página; con cursor agrega la siguiente
+  const fetchAdmins = async (cursor = null) => {
+    setLoadingMore(Boolean(cursor));
     try {
-      const response = await axios.get(`${API}/superadmin/admins`);
-      setAdmins(response.data);
+      const page = await fetchPage(`${API}/superadmin/admins`, cursor);
+      setAdmins(prev => cursor ? [...prev, ...page.items] : page.items);
+      setNextCursor(page.nextCursor);
     } catch (error) {
       console.error('Error fetching admins:', error);
     } finally {
       setLoading(false);
+      setLoadingMore(false);
     }
   };
 
@@ -5176,7 +5309,7 @@ const GestionAdmins = () => {
       <div className="bg-white shadow overflow-hidden sm:rounded-md">
         <div className="px-4 py-5 sm:px-6">
           <h3 className="text-lg leading-6 font-medium text-gray-900">
-            Administradores Registrados ({admins.length})
+            Administradores Registrados ({admins.length}{nextCursor ? '+' : ''})
           </h3>
           <p className="mt-1 max-w-2xl text-sm text-gray-500">
             Gestiona todos los administradores de lavaderos del sistema
@@ -5314,9 +5447,9 @@ const GestionAdmins = () => {
                             </button>
                             {showPassword[admin.admin_id] && (
                               <div className="mt-1 text-sm text-gray-600 bg-gray-50 p-2 rounded">
-                                <strong>Hash de contraseña:</strong><br />
+                                <strong>Contraseña:</strong><br />
                                 <code className="text-xs break-all">
-                                  {admin.password_hash || 'Sin contraseña (usuario de Google)'}
+                                  {admin.has_password ? 'Contraseña establecida' : 'Sin contraseña (usuario de Google)'}
                                 </code>
                               </div>
                             )}
@@ -5356,6 +5489,7 @@ const GestionAdmins = () => {
               ))}
             </div>
           )}
+          <LoadMoreButton nextCursor={nextCursor} loading={loadingMore} onLoadMore={fetchAdmins} />
         </div>
       </div>
     </div>
@@ -5370,6 +5504,7 @@ const ConfiguracionLavadero = () => {
     hora_apertura: "08:00",
     hora_cierre: "18:00",
     duracion_turno_minutos: 60,
+    bays: 1,
     dias_laborales: [1, 2, 3, 4, 5], // Lunes a Viernes
     alias_bancario: "lavadero.alias.mp",
     precio_turno: 5000.0,
@@ -5380,6 +5515,10 @@ const ConfiguracionLavadero = () => {
     precio_motos: 3000.0,
     precio_autos: 5000.0,
     precio_camionetas: 8000.0,
+    // Duración por tipo (null = duración del turno)
+    duracion_motos: null,
+    duracion_autos: null,
+    duracion_camionetas: null,
     // Ubicación
     latitud: null,
     longitud: null,
@@ -5558,6 +5697,7 @@ const ConfiguracionLavadero = () => {
                   <label className="block text-xs text-gray-500 mb-1">Apertura</label>
                   <input
                     type="time"
+                    step="300"
                     value={configuracion.hora_apertura}
                     onChange={(e) => handleConfigChange('hora_apertura', e.target.value)}
                     className="w-full px-3 py-2 border border-gray-300 rounded-md focus:outline-none focus:ring-blue-500 focus:border-blue-500"
@@ -5567,6 +5707,7 @@ const ConfiguracionLavadero = () => {
                   <label className="block text-xs text-gray-500 mb-1">Cierre</label>
                   <input
                     type="time"
+                    step="300"
                     value={configuracion.hora_cierre}
                     onChange={(e) => handleConfigChange('hora_cierre', e.target.value)}
                     className="w-full px-3 py-2 border border-gray-300 rounded-md focus:outline-none focus:ring-blue-500 focus:border-blue-500"
@@ -5593,6 +5734,21 @@ const ConfiguracionLavadero = () => {
               </select>
             </div>
 
+            {/* Puestos de lavado */}
+            <div>
+              <label className="block text-sm font-medium text-gray-700 mb-2">
+                Puestos de Lavado (turnos simultáneos)
+              </label>
+              <input
+                type="number"
+                min="1"
+                max="20"
+                value={configuracion.bays}
+                onChange={(e) => handleConfigChange('bays', parseInt(e.target.value) || 1)}
+                className="w-full px-3 py-2 border border-gray-300 rounded-md focus:outline-none focus:ring-blue-500 focus:border-blue-500"
+              />
+            </div>
+
             {/* Alias bancario */}
             <div>
               <label className="block text-sm font-medium text-gray-700 mb-2">
@@ -5642,6 +5798,19 @@ const ConfiguracionLavadero = () => {
                       onChange={(e) => handleConfigChange(`precio_${tipo.key}`, parseFloat(e.target.value) || 0)}
                       className="w-full px-3 py-2 border border-gray-300 rounded-md focus:outline-none focus:ring-blue-500 focus:border-blue-500"
                     />
+                    <label className="block text-sm text-gray-700 mt-3 mb-1">Duración del servicio</label>
+                    <select
+                      value={configuracion[`duracion_${tipo.key}`] || ''}
+                      onChange={(e) => handleConfigChange(`duracion_${tipo.key}`, e.target.value ? parseInt(e.target.value) : null)}
+                      className="w-full px-3 py-2 border border-gray-300 rounded-md focus:outline-none focus:ring-blue-500 focus:border-blue-500"
+                    >
+                      <option value="">Igual al turno</option>
+                      <option value={30}>30 minutos</option>
+                      <option value={45}>45 minutos</option>
+                      <option value={60}>1 hora</option>
+                      <option value={90}>1.5 horas</option>
+                      <option value={120}>2 horas</option>
+                    </select>
                   </div>
                 )}
                 
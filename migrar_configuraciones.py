@@ -0,0 +1,40 @@
+#!/usr/bin/env python3
+"""
+Script para migrar los documentos de configuracion_lavadero al esquema canónico
+(schema_version). Es reanudable: solo procesa documentos en versiones anteriores.
+
+Uso:
+    python migrar_configuraciones.py --dry-run
+    python migrar_configuraciones.py --batch-size 200
+"""
+import argparse
+import asyncio
+import sys
+from pathlib import Path
+
+# Add backend to path
+sys.path.append(str(Path(__file__).parent / "backend"))
+
+from server import migrar_configuraciones, client, CONFIGURACION_SCHEMA_VERSION
+
+async def main():
+    parser = argparse.ArgumentParser(description="Migrar configuracion_lavadero al esquema canónico")
+    parser.add_argument("--dry-run", action="store_true", help="Solo contar documentos a migrar, sin escribir")
+    parser.add_argument("--batch-size", type=int, default=500, help="Documentos por lote")
+    args = parser.parse_args()
+
+    print(f"🔧 MIGRANDO configuracion_lavadero A schema_version {CONFIGURACION_SCHEMA_VERSION}")
+    print("=" * 50)
+
+    resultado = await migrar_configuraciones(dry_run=args.dry_run, batch_size=args.batch_size)
+
+    print(f"📊 Documentos procesados: {resultado['procesados']}")
+    if args.dry_run:
+        print("ℹ️  Dry run: no se escribió ningún cambio")
+    else:
+        print(f"✅ Documentos migrados: {resultado['migrados']}")
+
+    client.close()
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+Servidor stub del servicio de autenticación (Emergent Auth) para probar
+/api/session-data offline y bajo carga.
+
+Responde GET /auth/v1/env/oauth/session-data con datos de sesión derivados
+del X-Session-ID. Los IDs que empiezan con "invalid" devuelven 401 y los que
+empiezan con "error" devuelven 500 (útil para abrir el circuit breaker).
+
+Uso:
+    python stub_auth_server.py --port 8099 --latencia-ms 200
+    AUTH_SERVICE_URL=http://localhost:8099 uvicorn server:app   (en backend/)
+
+    # Carga: N pedidos concurrentes con el mismo Session ID (single-flight)
+    python stub_auth_server.py --carga http://localhost:8001/api --pedidos 200
+"""
+import argparse
+import asyncio
+import random
+import time
+
+import httpx
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+app = FastAPI(title="Stub Emergent Auth")
+app.state.llamadas = 0
+
+@app.get("/auth/v1/env/oauth/session-data")
+async def session_data(request: Request):
+    app.state.llamadas += 1
+    session_id = request.headers.get("X-Session-ID", "")
+
+    latencia = app.state.latencia_ms + random.uniform(0, app.state.jitter_ms)
+    await asyncio.sleep(latencia / 1000)
+
+    if not session_id or session_id.startswith("invalid"):
+        return JSONResponse(status_code=401, content={"detail": "Invalid session"})
+    if session_id.startswith("error"):
+        return JSONResponse(status_code=500, content={"detail": "Upstream error"})
+
+    return {
+        "id": f"google-{session_id}",
+        "email": f"stub-{session_id}@example.com",
+        "name": f"Stub {session_id}",
+        "picture": "https://example.com/avatar.png",
+        "session_token": f"token-{session_id}"
+    }
+
+@app.get("/stats")
+async def stats():
+    return {"llamadas": app.state.llamadas}
+
+async def carga(base_url: str, pedidos: int, sesiones: int):
+    print(f"🔥 {pedidos} pedidos concurrentes a {base_url}/session-data con {sesiones} Session IDs")
+    async with httpx.AsyncClient(timeout=30) as cliente:
+        async def pedido(i: int):
+            inicio = time.perf_counter()
+            response = await cliente.get(
+                f"{base_url}/session-data",
+                headers={"X-Session-ID": f"carga-{i % sesiones}"}
+            )
+            return response.status_code, time.perf_counter() - inicio
+
+        inicio = time.perf_counter()
+        resultados = await asyncio.gather(*(pedido(i) for i in range(pedidos)))
+        total = time.perf_counter() - inicio
+
+    latencias = sorted(latencia for _, latencia in resultados)
+    codigos = {}
+    for codigo, _ in resultados:
+        codigos[codigo] = codigos.get(codigo, 0) + 1
+    print(f"📊 Códigos: {codigos}")
+    print(f"⏱️  Total: {total:.2f}s | p50: {latencias[len(latencias) // 2] * 1000:.0f}ms | "
+          f"p99: {latencias[int(len(latencias) * 0.99) - 1] * 1000:.0f}ms")
+
+def main():
+    parser = argparse.ArgumentParser(description="Stub del servicio de autenticación")
+    parser.add_argument("--port", type=int, default=8099)
+    parser.add_argument("--latencia-ms", type=float, default=100, help="Latencia base por respuesta")
+    parser.add_argument("--jitter-ms", type=float, default=50, help="Latencia aleatoria adicional")
+    parser.add_argument("--carga", metavar="API_URL", help="Generar carga contra el backend en lugar de servir")
+    parser.add_argument("--pedidos", type=int, default=100)
+    parser.add_argument("--sesiones", type=int, default=1, help="Session IDs distintos en la carga")
+    args = parser.parse_args()
+
+    if args.carga:
+        asyncio.run(carga(args.carga.rstrip("/"), args.pedidos, args.sesiones))
+        return
+
+    app.state.latencia_ms = args.latencia_ms
+    app.state.jitter_ms = args.jitter_ms
+    print(f"🔧 Stub de Emergent Auth en http://localhost:{args.port} (latencia ~{args.latencia_ms}ms)")
+    uvicorn.run(app, host="0.0.0.0", port=args.port, log_level="warning")
+
+if __name__ == "__main__":
+    main()
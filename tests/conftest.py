@@ -0,0 +1,10 @@
+"""Tests unitarios del backend: funciones puras de server.py, sin servidor ni MongoDB"""
+import os
+import sys
+from pathlib import Path
+
+# server.py crea el cliente de Mongo al importarse (sin conectarse)
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "lavaderos_test")
+
+sys.path.append(str(Path(__file__).parent.parent / "backend"))
@@ -0,0 +1,110 @@
+from datetime import date, datetime, timedelta, timezone
+
+import server
+
+PASADO = datetime(2020, 1, 1, tzinfo=timezone.utc)
+LUNES = date(2030, 1, 7)
+
+
+def config(**cambios):
+    return {
+        "horario_apertura": "08:00",
+        "horario_cierre": "18:00",
+        "duracion_turno": 60,
+        "dias_laborables": [1, 2, 3, 4, 5],
+        "bays": 1,
+        **cambios,
+    }
+
+
+def turno(hora: int, minuto: int = 0, duracion: int = None, bay: int = 0):
+    inicio = datetime(LUNES.year, LUNES.month, LUNES.day, hora, minuto, tzinfo=server.ZONA_HORARIA_LAVADEROS)
+    datos = {"fecha_hora": inicio.astimezone(timezone.utc).replace(tzinfo=None), "bay": bay}
+    if duracion is not None:
+        datos["fin"] = datos["fecha_hora"] + timedelta(minutes=duracion)
+    return datos
+
+
+def bitmap(cfg, ocupados: int, laborable: bool = True):
+    slots = len(server.inicios_de_turno(cfg))
+    return {
+        "fecha": LUNES.isoformat(),
+        "laborable": laborable,
+        "slots": slots,
+        "bays": cfg["bays"],
+        "palabras": server._palabras(ocupados, slots * cfg["bays"]),
+    }
+
+
+# ---------- _bits_turno ----------
+
+def test_turno_de_la_grilla_ocupa_un_bit():
+    dia, mascara, exacto = server._bits_turno(config(), turno(9))
+    assert dia == LUNES
+    assert mascara == 1 << 1
+    assert exacto
+
+
+def test_servicio_largo_marca_todos_los_turnos_que_pisa():
+    _, mascara, exacto = server._bits_turno(config(), turno(9, duracion=120))
+    assert mascara == 0b110
+    assert exacto
+
+
+def test_servicio_corrido_pisa_turnos_parcialmente():
+    _, mascara, exacto = server._bits_turno(config(), turno(9, 30, duracion=90))
+    assert mascara == 0b110
+    assert not exacto
+
+
+def test_bits_del_segundo_bay_se_desplazan_un_dia_entero():
+    _, mascara, _ = server._bits_turno(config(bays=2), turno(8, bay=1))
+    assert mascara == 1 << 10
+
+
+def test_bay_inexistente_no_tiene_bits():
+    _, mascara, exacto = server._bits_turno(config(bays=2), turno(8, bay=2))
+    assert mascara == 0
+    assert exacto
+
+
+# ---------- _palabras ----------
+
+def test_palabras_en_el_limite_de_63_bits():
+    assert server._palabras(1 << 62, 63) == [1 << 62]
+    assert server._palabras(1 << 63, 64) == [0, 1]
+    assert server._palabras((1 << 64) - 1, 64) == [(1 << 63) - 1, 1]
+    assert all(palabra < 1 << 63 for palabra in server._palabras((1 << 126) - 1, 126))
+
+
+# ---------- libres_en_bitmap ----------
+
+def test_dia_libre_cuenta_todos_los_bits():
+    cfg = config(bays=7)
+    assert server.libres_en_bitmap(bitmap(cfg, 0), cfg, PASADO) == 70
+
+
+def test_dia_no_laborable():
+    cfg = config()
+    assert server.libres_en_bitmap(bitmap(cfg, 0, laborable=False), cfg, PASADO) == 0
+
+
+def test_bits_a_ambos_lados_del_limite_de_palabra():
+    # 7 bays x 10 turnos = 70 bits: bay 6 turno 2 es el bit 62, bay 6 turno 3 el 63 (segunda palabra)
+    cfg = config(bays=7)
+    ocupados = 0
+    for bay, hora in [(6, 10), (6, 11)]:
+        _, mascara, _ = server._bits_turno(cfg, turno(hora, bay=bay))
+        ocupados |= mascara
+    assert ocupados == (1 << 62) | (1 << 63)
+    doc = bitmap(cfg, ocupados)
+    assert doc["palabras"] == [1 << 62, 1]
+    assert server.libres_en_bitmap(doc, cfg, PASADO) == 68
+
+
+def test_turnos_pasados_no_cuentan():
+    cfg = config(bays=2)
+    ahora = datetime(LUNES.year, LUNES.month, LUNES.day, 12, 30, tzinfo=server.ZONA_HORARIA_LAVADEROS)
+    _, mascara, _ = server._bits_turno(cfg, turno(9, duracion=300, bay=1))
+    # Quedan 13 a 17 en cada bay; el servicio del bay 1 ocupa 9 a 13
+    assert server.libres_en_bitmap(bitmap(cfg, mascara), cfg, ahora) == 5 + 4
@@ -0,0 +1,64 @@
+import server
+
+
+def test_documento_v1_del_formulario_admin():
+    doc = server.normalizar_configuracion({
+        "lavadero_id": "l1",
+        "hora_apertura": "07:00",
+        "hora_cierre": "19:00",
+        "duracion_turno_minutos": 45,
+        "dias_laborales": [1, 2, 3],
+        "servicio_motos": False,
+        "precio_autos": 6500.0,
+        "direccion": "San Martín 123",
+    })
+    assert doc["schema_version"] == server.CONFIGURACION_SCHEMA_VERSION
+    assert doc["horario_apertura"] == "07:00"
+    assert doc["horario_cierre"] == "19:00"
+    assert doc["duracion_turno"] == 45
+    assert doc["dias_laborables"] == [1, 2, 3]
+    assert doc["direccion_completa"] == "San Martín 123"
+    assert doc["bays"] == 1
+    tipos = {tipo["tipo"]: tipo for tipo in doc["tipos_vehiculo"]}
+    assert not tipos["moto"]["activo"]
+    assert tipos["auto"]["precio"] == 6500.0
+    for campo in server.CAMPOS_CONFIGURACION_LEGACY:
+        assert campo not in doc
+
+
+def test_documento_v1_con_tipos_suv():
+    doc = server.normalizar_configuracion({
+        "horario_apertura": "08:00",
+        "horario_cierre": "18:00",
+        "tipos_vehiculo": [{"tipo": "suv", "nombre": "SUV", "precio": 9000.0}],
+    })
+    assert [tipo["tipo"] for tipo in doc["tipos_vehiculo"]] == ["camioneta"]
+
+
+def test_documento_vacio_toma_los_valores_por_defecto():
+    doc = server.normalizar_configuracion({})
+    assert (doc["horario_apertura"], doc["horario_cierre"], doc["duracion_turno"]) == ("08:00", "18:00", 60)
+    assert doc["dias_laborables"] == [1, 2, 3, 4, 5]
+    assert len(doc["tipos_vehiculo"]) == len(server.TIPOS_VEHICULO_BASE)
+
+
+def test_v3_agrega_un_bay_a_los_lavaderos_existentes():
+    cambios, eliminados = server.migrar_configuracion_v3({"schema_version": 2})
+    assert cambios == {"bays": 1, "schema_version": 3}
+    assert eliminados == []
+    assert server.migrar_configuracion_v3({"bays": 4})[0]["bays"] == 4
+
+
+def test_documento_actual_no_cambia():
+    doc = server.normalizar_configuracion({})
+    assert server.normalizar_configuracion(doc) == doc
+
+
+def test_no_modifica_el_documento_original():
+    original = {"hora_apertura": "07:00", "schema_version": 1}
+    server.normalizar_configuracion(original)
+    assert original == {"hora_apertura": "07:00", "schema_version": 1}
+
+
+def test_hay_un_paso_por_version():
+    assert sorted(server.MIGRACIONES_CONFIGURACION) == list(range(2, server.CONFIGURACION_SCHEMA_VERSION + 1))
@@ -0,0 +1,174 @@
+from datetime import date, datetime, timezone
+from zoneinfo import ZoneInfo
+
+import numpy as np
+
+import server
+
+PASADO = datetime(2020, 1, 1, tzinfo=timezone.utc)
+LUNES = date(2030, 1, 7)
+
+
+def config(**cambios):
+    return {
+        "horario_apertura": "08:00",
+        "horario_cierre": "18:00",
+        "duracion_turno": 60,
+        "dias_laborables": [1, 2, 3, 4, 5],
+        "bays": 1,
+        **cambios,
+    }
+
+
+def minutos(dia: date, hora: int, minuto: int = 0) -> int:
+    """Minutos UTC desde epoch de una hora local del lavadero"""
+    local = datetime(dia.year, dia.month, dia.day, hora, minuto, tzinfo=server.ZONA_HORARIA_LAVADEROS)
+    return server.minutos_utc(local)
+
+
+def libres_del_dia(cfg, dia, reservados, duracion=None):
+    dias, inicios, libres = server.calcular_disponibilidad(cfg, dia, dia, [], reservados, PASADO, duracion)
+    assert len(dias) == 1
+    return dict(zip((inicios // 60).tolist(), libres[0].tolist()))
+
+
+# ---------- inicios_de_turno ----------
+
+def test_inicios_grilla():
+    inicios = server.inicios_de_turno(config())
+    assert inicios.tolist() == list(range(8 * 60, 18 * 60, 60))
+
+
+def test_inicios_ultimo_turno_truncado_si_quedan_minimo_minutos():
+    # 18:00 entra con 30 minutos antes del cierre, no con 20
+    assert server.inicios_de_turno(config(horario_cierre="18:30"))[-1] == 18 * 60
+    assert server.inicios_de_turno(config(horario_cierre="18:20"))[-1] == 17 * 60
+
+
+def test_inicios_con_duracion_de_servicio():
+    inicios = server.inicios_de_turno(config(), duracion=45)
+    assert inicios[0] == 8 * 60
+    assert np.all(np.diff(inicios) == server.GRANO_INICIO_MINUTOS)
+    # El último termina justo al cierre
+    assert inicios[-1] + 45 == 18 * 60
+
+
+def test_inicios_servicio_mas_largo_que_la_jornada():
+    assert server.inicios_de_turno(config(horario_cierre="09:00"), duracion=90).size == 0
+
+
+# ---------- calcular_disponibilidad ----------
+
+def test_dias_laborables_y_feriados():
+    feriado = date(2030, 1, 9)
+    dias, inicios, libres = server.calcular_disponibilidad(
+        config(), LUNES, date(2030, 1, 13), [feriado], [], PASADO
+    )
+    assert [str(dia) for dia in dias] == ["2030-01-07", "2030-01-08", "2030-01-10", "2030-01-11"]
+    assert libres.shape == (4, 10)
+    assert libres.all()
+
+
+def test_turnos_pasados_no_estan_libres():
+    ahora = datetime(LUNES.year, LUNES.month, LUNES.day, 12, 30, tzinfo=server.ZONA_HORARIA_LAVADEROS)
+    _, inicios, libres = server.calcular_disponibilidad(config(), LUNES, LUNES, [], [], ahora)
+    assert (inicios[~libres[0]] // 60).tolist() == [8, 9, 10, 11, 12]
+
+
+def test_reserva_ocupa_su_turno():
+    libres = libres_del_dia(config(), LUNES, [(minutos(LUNES, 9), minutos(LUNES, 10), 0)])
+    assert [hora for hora, libre in libres.items() if not libre] == [9]
+
+
+def test_reserva_que_pisa_varios_turnos():
+    # 09:30-11:00 solapa con los turnos de las 9 y de las 10, no con los contiguos
+    libres = libres_del_dia(config(), LUNES, [(minutos(LUNES, 9, 30), minutos(LUNES, 11), 0)])
+    assert [hora for hora, libre in libres.items() if not libre] == [9, 10]
+
+
+def test_reservas_contiguas_no_se_tapan_de_mas():
+    reservados = [
+        (minutos(LUNES, 8), minutos(LUNES, 9), 0),
+        (minutos(LUNES, 9), minutos(LUNES, 10), 0),
+        (minutos(LUNES, 17), minutos(LUNES, 18), 0),
+    ]
+    libres = libres_del_dia(config(), LUNES, reservados)
+    assert [hora for hora, libre in libres.items() if not libre] == [8, 9, 17]
+
+
+def test_ultimo_turno_truncado_se_puede_ocupar():
+    cfg = config(horario_cierre="18:30")
+    libres = libres_del_dia(cfg, LUNES, [(minutos(LUNES, 18), minutos(LUNES, 18, 30), 0)])
+    assert libres[18] is False
+    assert libres[17] is True
+
+
+def test_reserva_en_otro_dia_no_afecta():
+    martes = date(2030, 1, 8)
+    dias, _, libres = server.calcular_disponibilidad(
+        config(), LUNES, martes, [], [(minutos(martes, 8), minutos(martes, 9), 0)], PASADO
+    )
+    assert libres[0].all()
+    assert not libres[1][0] and libres[1][1:].all()
+
+
+def test_duracion_de_servicio_contra_reservas():
+    # Un servicio de 90 minutos no entra si se solapa con el turno de las 9:00
+    dias, inicios, matriz = server.calcular_disponibilidad(
+        config(), LUNES, LUNES, [], [(minutos(LUNES, 9), minutos(LUNES, 10), 0)], PASADO, 90
+    )
+    ocupados = inicios[~matriz[0]].tolist()
+    assert ocupados == list(range(8 * 60, 10 * 60, 15))
+
+
+def test_horario_de_verano(monkeypatch):
+    # Cada día usa su propio offset UTC: el turno de las 8 local cae a distinta hora UTC
+    madrid = ZoneInfo("Europe/Madrid")
+    monkeypatch.setattr(server, "ZONA_HORARIA_LAVADEROS", madrid)
+    viernes, lunes = date(2030, 3, 29), date(2030, 4, 1)
+    reservados = [(minutos(dia, 8), minutos(dia, 9), 0) for dia in (viernes, lunes)]
+    assert reservados[0][0] % (24 * 60) == 7 * 60
+    assert reservados[1][0] % (24 * 60) == 6 * 60
+
+    dias, inicios, libres = server.calcular_disponibilidad(config(), viernes, lunes, [], reservados, PASADO)
+    assert [str(dia) for dia in dias] == ["2030-03-29", "2030-04-01"]
+    assert not libres[:, 0].any()
+    assert libres[:, 1:].all()
+
+
+def test_codificar_disponibilidad():
+    dias, inicios, libres = server.calcular_disponibilidad(
+        config(horario_cierre="11:00"), LUNES, LUNES, [], [(minutos(LUNES, 9), minutos(LUNES, 10), 0)], PASADO
+    )
+    assert server.codificar_disponibilidad(dias, inicios, libres) == {
+        "horarios": ["08:00", "09:00", "10:00"],
+        "dias": {"2030-01-07": "101"},
+    }
+
+
+# ---------- bays ----------
+
+def test_con_dos_bays_un_turno_tomado_sigue_libre():
+    libres = libres_del_dia(config(bays=2), LUNES, [(minutos(LUNES, 9), minutos(LUNES, 10), 0)])
+    assert all(libres.values())
+
+
+def test_con_todos_los_bays_tomados_no_esta_libre():
+    reservados = [(minutos(LUNES, 9), minutos(LUNES, 10), bay) for bay in range(3)]
+    libres = libres_del_dia(config(bays=3), LUNES, reservados)
+    assert [hora for hora, libre in libres.items() if not libre] == [9]
+
+
+def test_bays_ocupados_en_horarios_distintos():
+    # Bay 0 ocupado de 9 a 11, bay 1 de 10 a 12: solo a las 10 están los dos tomados
+    reservados = [
+        (minutos(LUNES, 9), minutos(LUNES, 11), 0),
+        (minutos(LUNES, 10), minutos(LUNES, 12), 1),
+    ]
+    libres = libres_del_dia(config(bays=2), LUNES, reservados)
+    assert [hora for hora, libre in libres.items() if not libre] == [10]
+
+
+def test_reservas_en_bays_eliminados_se_ignoran():
+    libres = libres_del_dia(config(bays=1), LUNES, [(minutos(LUNES, 9), minutos(LUNES, 10), 1)])
+    assert all(libres.values())
@@ -0,0 +1,133 @@
+import pytest
+from fastapi import HTTPException
+
+import server
+
+
+def config(**cambios):
+    return {
+        "horario_apertura": "08:00",
+        "horario_cierre": "18:00",
+        "duracion_turno": 60,
+        "precio_turno": 4000.0,
+        "dias_laborables": [1, 2, 3, 4, 5],
+        "bays": 1,
+        "tipos_vehiculo": [
+            {"tipo": "moto", "precio": 3000.0, "activo": True, "duracion": 30},
+            {"tipo": "auto", "precio": 5000.0, "activo": True, "duracion": None},
+            {"tipo": "camioneta", "precio": 8000.0, "activo": False, "duracion": 90},
+        ],
+        **cambios,
+    }
+
+
+# ---------- servicio_turno ----------
+
+def test_servicio_de_la_grilla():
+    assert server.servicio_turno(config()) == (60, 4000.0)
+
+
+def test_servicio_con_duracion_propia():
+    assert server.servicio_turno(config(), "moto") == (30, 3000.0)
+
+
+def test_servicio_sin_duracion_usa_la_del_turno():
+    assert server.servicio_turno(config(), "auto") == (60, 5000.0)
+
+
+@pytest.mark.parametrize("tipo", ["camioneta", "bicicleta"])
+def test_servicio_inactivo_o_inexistente(tipo):
+    with pytest.raises(HTTPException) as error:
+        server.servicio_turno(config(), tipo)
+    assert error.value.status_code == 400
+
+
+# ---------- IndiceIntervalos ----------
+
+@pytest.fixture
+def indice():
+    indice = server.IndiceIntervalos(bays=2)
+    indice.agregar(0, 600, 660)
+    indice.agregar(0, 720, 780)
+    return indice
+
+
+@pytest.mark.parametrize("inicio, fin, libre", [
+    (540, 600, True),   # termina justo cuando empieza el primero
+    (660, 720, True),   # entre los dos, tocando ambos
+    (780, 840, True),   # empieza justo cuando termina el segundo
+    (590, 610, False),  # pisa el inicio del primero
+    (650, 670, False),  # pisa el fin del primero
+    (659, 720, False),
+    (660, 721, False),
+    (610, 620, False),  # dentro de uno
+    (500, 900, False),  # envuelve a los dos
+])
+def test_libre_contra_vecinos(indice, inicio, fin, libre):
+    assert indice.libre(0, inicio, fin) is libre
+
+
+def test_bay_libre_elige_el_primero_disponible(indice):
+    assert indice.bay_libre(660, 720) == 0
+    assert indice.bay_libre(600, 660) == 1
+    assert indice.bay_libre(600, 660, descartados={1}) is None
+
+
+def test_agregar_fuera_de_orden_mantiene_los_inicios_ordenados():
+    indice = server.IndiceIntervalos(bays=1)
+    for inicio in (900, 600, 750):
+        indice.agregar(0, inicio, inicio + 30)
+    assert indice.inicios[0] == [600, 750, 900]
+    assert indice.fines[0] == [630, 780, 930]
+    assert indice.libre(0, 630, 750)
+    assert not indice.libre(0, 630, 751)
+
+
+def test_quitar_libera_el_intervalo(indice):
+    indice.quitar(0, 600, 660)
+    assert indice.libre(0, 600, 660)
+    # Un intervalo que no coincide exactamente no se quita
+    indice.quitar(0, 720, 770)
+    assert not indice.libre(0, 720, 780)
+
+
+# ---------- _bloques ----------
+
+def test_bloques_del_intervalo():
+    assert server._bloques(600, 660) == range(120, 132)
+
+
+def test_turnos_contiguos_no_comparten_bloques():
+    assert not set(server._bloques(600, 660)) & set(server._bloques(660, 720))
+
+
+def test_bloques_fuera_de_la_grilla_se_redondean_hacia_afuera():
+    assert server._bloques(602, 661) == range(120, 133)
+
+
+# ---------- migración v4 ----------
+
+def test_v4_alinea_horarios_y_duracion_a_los_bloques():
+    cambios, eliminados = server.migrar_configuracion_v4({
+        "horario_apertura": "08:03",
+        "horario_cierre": "18:58",
+        "duracion_turno": 47,
+    })
+    assert cambios == {
+        "horario_apertura": "08:05",
+        "horario_cierre": "18:55",
+        "duracion_turno": 45,
+        "schema_version": 4,
+    }
+    assert eliminados == []
+
+
+@pytest.mark.parametrize("duracion, esperada", [(0, 60), (2, 5), (60, 60), (600, 480)])
+def test_v4_duracion_dentro_de_los_limites(duracion, esperada):
+    cambios, _ = server.migrar_configuracion_v4({"duracion_turno": duracion})
+    assert cambios["duracion_turno"] == esperada
+
+
+def test_v4_horarios_ya_alineados_no_cambian():
+    cambios, _ = server.migrar_configuracion_v4(config())
+    assert (cambios["horario_apertura"], cambios["horario_cierre"], cambios["duracion_turno"]) == ("08:00", "18:00", 60)
@@ -0,0 +1,62 @@
+from datetime import datetime
+
+import pytest
+from fastapi import HTTPException, Response
+
+import server
+
+CREATED_AT = datetime(2030, 1, 7, 12, 30, 15, 250000)
+
+
+def test_cursor_ida_y_vuelta():
+    cursor = server.codificar_cursor(CREATED_AT, "abc-123")
+    assert server.filtro_keyset(cursor) == {"$or": [
+        {"created_at": {"$lt": CREATED_AT}},
+        {"created_at": CREATED_AT, "id": {"$lt": "abc-123"}},
+    ]}
+
+
+def test_cursor_con_zona_horaria():
+    created_at = datetime.fromisoformat("2030-01-07T12:30:15+00:00")
+    filtro = server.filtro_keyset(server.codificar_cursor(created_at, "x"))
+    assert filtro["$or"][0]["created_at"]["$lt"] == created_at
+
+
+@pytest.mark.parametrize("cursor", ["", "sin-separador", "no-es-fecha|abc"])
+def test_cursor_invalido(cursor):
+    with pytest.raises(HTTPException) as error:
+        server.filtro_keyset(cursor)
+    assert error.value.status_code == 400
+
+
+def test_filtro_sigue_el_orden_del_listado():
+    # Los elementos posteriores al cursor en (created_at desc, id desc) son los que pasan el filtro
+    items = sorted(
+        [{"created_at": datetime(2030, 1, dia), "id": id} for dia in (5, 6, 7) for id in ("a", "b", "c")],
+        key=lambda item: (item["created_at"], item["id"]),
+        reverse=True,
+    )
+    cursor = items[4]
+    filtro = server.filtro_keyset(server.codificar_cursor(cursor["created_at"], cursor["id"]))
+
+    def pasa(item):
+        return any(
+            all(
+                item[campo] < condicion["$lt"] if isinstance(condicion, dict) else item[campo] == condicion
+                for campo, condicion in rama.items()
+            )
+            for rama in filtro["$or"]
+        )
+
+    assert [item for item in items if pasa(item)] == items[5:]
+
+
+def test_paginar_publica_el_cursor_solo_si_hay_mas():
+    items = [{"created_at": CREATED_AT, "id": str(i)} for i in range(3)]
+    response = Response()
+    assert server.paginar(response, items, 3) == items
+    assert "X-Next-Cursor" not in response.headers
+
+    response = Response()
+    assert server.paginar(response, items, 2) == items[:2]
+    assert response.headers["X-Next-Cursor"] == server.codificar_cursor(CREATED_AT, "1")